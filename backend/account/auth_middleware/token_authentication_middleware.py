@@ -1,11 +1,12 @@
 import jwt
 import logging
-from decouple import config
 from rest_framework import status
 from django.http import JsonResponse
 from django.utils.deprecation import MiddlewareMixin
 from account.models import UserProfile
+from account.profile_cache import get_profile
 from django.contrib.auth.models import AnonymousUser
+from auth_backend.tokens import verify_access_token
 
 logger = logging.getLogger(__name__)
 
@@ -17,22 +18,24 @@ class TokenAuthenticationMiddleware(MiddlewareMixin):
     the corresponding user profile from the database, and attaches it to the request.
     If the token is invalid, expired, or not present, it sets the request's user to 
     AnonymousUser, indicating an unauthenticated or improperly authenticated request.
+
+    Tokens are verified with `verify_access_token`, which reads the secret from the settings once
+    and caches the claims of a verified token until it expires.
     """
 
     def __call__(self, request):
-        access_secret = config("JWT_ACCESS_SECRET")
         token = request.COOKIES.get("access_token")
         
         if token:
             try:
-                # Decode the JWT token to validate and extract user information
+                # Verify the JWT token and extract user information
                 logger.debug(f"Token found: {token}")
-                payload = jwt.decode(token, access_secret, algorithms=["HS256"])
+                payload = verify_access_token(token)
                 user_id = payload.get("user_id")
                 logger.debug(f"Token payload: {payload}")
 
-                # Fetch the user from the database and attach it to the request
-                request.user = UserProfile.objects.get(pk=user_id)
+                # Fetch the user (from the profile cache when possible) and attach it to the request
+                request.user = get_profile(user_id)
                 logger.debug(f"User {user_id} authenticated successfully via JWT.")
                 
             except jwt.ExpiredSignatureError:
@@ -0,0 +1,105 @@
+import jwt
+import logging
+from django.conf import settings
+from rest_framework import exceptions
+from rest_framework.authentication import BaseAuthentication, CSRFCheck
+
+from auth_backend.tokens import verify_access_token
+from .models import UserProfile
+from .profile_cache import get_profile
+
+# Set up the logger
+logger = logging.getLogger(__name__)
+
+
+class JWTCookieAuthentication(BaseAuthentication):
+    """
+    Stateless DRF authentication from the access token cookie set by the auth service.
+
+    The token is verified with `verify_access_token` (claims of verified tokens are cached until
+    they expire) and the user comes from the process-local profile cache (see `get_profile`), so a
+    warm request touches neither the session table nor the database. The verified claims are
+    available to the view as `request.auth`.
+
+    Because the browser sends the cookie on its own, unsafe methods still go through the CSRF
+    check, exactly as with SessionAuthentication.
+
+    Select it per view for hot read endpoints:
+
+        authentication_classes = [JWTCookieAuthentication]
+
+    The cookie name is `JWT_ACCESS_COOKIE` (default "access_token").
+    """
+
+    www_authenticate_realm = "api"
+
+    def authenticate(self, request):
+        """
+        Returns `(user, claims)` for a valid access token cookie, or None when there is no cookie
+        so other authentication classes can run.
+
+        Raises:
+            AuthenticationFailed: If the token is expired or invalid, or its user does not exist.
+        """
+        token = request.COOKIES.get(getattr(settings, "JWT_ACCESS_COOKIE", "access_token"))
+        if not token:
+            return None
+
+        try:
+            claims = verify_access_token(token)
+        except jwt.ExpiredSignatureError:
+            logger.info("Expired access token cookie received.")
+            raise exceptions.AuthenticationFailed("Token has expired. Please log in again.")
+        except jwt.InvalidTokenError as e:
+            logger.warning(f"Invalid access token cookie: {e}")
+            raise exceptions.AuthenticationFailed("Invalid token. Please log in again.")
+
+        user_id = claims.get("user_id")
+        try:
+            user = get_profile(user_id)
+        except UserProfile.DoesNotExist:
+            logger.warning(f"Access token cookie for unknown user ID {user_id}")
+            raise exceptions.AuthenticationFailed("Invalid token. Please log in again.")
+
+        self.enforce_csrf(request)
+        return user, claims
+
+    def enforce_csrf(self, request):
+        """
+        Runs Django's CSRF check (a no-op for safe methods), as SessionAuthentication does.
+
+        Raises:
+            PermissionDenied: If the CSRF check fails.
+        """
+        def dummy_get_response(request):  # pragma: no cover
+            return None
+
+        check = CSRFCheck(dummy_get_response)
+        # Populates request.META["CSRF_COOKIE"], which is used in process_view()
+        check.process_request(request)
+        reason = check.process_view(request, None, (), {})
+        if reason:
+            raise exceptions.PermissionDenied(f"CSRF Failed: {reason}")
+
+    def authenticate_header(self, request):
+        # Makes DRF answer failed authentication with 401 (so the client refreshes its token)
+        return f'Bearer realm="{self.www_authenticate_realm}"'
+
+
+class OptionalJWTCookieAuthentication(JWTCookieAuthentication):
+    """
+    `JWTCookieAuthentication` for public endpoints.
+
+    A cookie that is expired, invalid or for an unknown user is treated like no cookie at all,
+    so a logged-out browser still holding a stale cookie is served anonymously instead of
+    being answered with 401. Endpoints that require a user keep `JWTCookieAuthentication`.
+    """
+
+    def authenticate(self, request):
+        """
+        Returns `(user, claims)` for a valid access token cookie, or None otherwise.
+        """
+        try:
+            return super().authenticate(request)
+        except exceptions.AuthenticationFailed:
+            return None
@@ -0,0 +1,156 @@
+import logging
+import threading
+import copy
+from collections import Counter
+from channels.db import database_sync_to_async
+from django.utils.functional import SimpleLazyObject, empty
+
+from .profile_cache import get_profile, profile_cache
+
+# Set up the logger
+logger = logging.getLogger(__name__)
+
+# Profile fields a LazyUserProfile answers without loading the profile
+CLAIM_FIELDS = ("email", "first_name", "last_name")
+
+
+class LazyProfileStats:
+    """
+    Process-wide counters for `LazyUserProfile`: how many were handed out, how many of them had
+    to load the full profile, and which attribute triggered each load.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.created = 0
+            self.loaded = 0
+            self.triggers = Counter()
+
+    def record_created(self):
+        with self._lock:
+            self.created += 1
+
+    def record_load(self, trigger):
+        with self._lock:
+            self.loaded += 1
+            self.triggers[trigger] += 1
+
+    def snapshot(self):
+        """
+        Returns the counters as a dict, e.g. for logging or a debug endpoint.
+
+        Returns:
+            dict: `{"created": int, "loaded": int, "load_ratio": float, "triggers": {name: int}}`.
+        """
+        with self._lock:
+            return {
+                "created": self.created,
+                "loaded": self.loaded,
+                "load_ratio": self.loaded / self.created if self.created else 0.0,
+                "triggers": dict(self.triggers),
+            }
+
+
+lazy_profile_stats = LazyProfileStats()
+
+
+class LazyUserProfile(SimpleLazyObject):
+    """
+    Stand-in for a UserProfile in a long-lived scope, such as a WebSocket connection.
+
+    The id and the fields in `CLAIM_FIELDS` are answered without the ORM: from this process's
+    profile cache while it holds the user (so renames published by profile events show up on
+    open sockets), otherwise from the values the proxy was built with (see `for_profile`). Any
+    other attribute, and anything Django itself needs the real instance for (`isinstance`,
+    equality, `str()`, assigning it to a foreign key), loads the profile through `get_profile`
+    once, and every load is counted in `lazy_profile_stats`.
+
+    The load runs the ORM, so in async code (e.g. a Channels consumer) either stick to the
+    fields above or `await user.aload()` first.
+
+    Attributes:
+        pk (int): The user ID, also available as `id`.
+        is_authenticated (bool): Always True; only verified tokens produce a LazyUserProfile.
+    """
+
+    def __init__(self, user_id, fields=None):
+        self.__dict__["_user_id"] = user_id
+        self.__dict__["_fields"] = {
+            name: value for name, value in (fields or {}).items() if name in CLAIM_FIELDS and value is not None
+        }
+        self.__dict__["_trigger"] = None
+        super().__init__(lambda: get_profile(user_id))
+        lazy_profile_stats.record_created()
+
+    @classmethod
+    def for_profile(cls, profile):
+        """
+        Returns a proxy for an existing profile, e.g. one just read from the profile cache.
+        """
+        return cls(profile.pk, {name: getattr(profile, name) for name in CLAIM_FIELDS})
+
+    @property
+    def pk(self):
+        return self._user_id
+
+    id = pk
+
+    @property
+    def is_authenticated(self):
+        return True
+
+    @property
+    def is_anonymous(self):
+        return False
+
+    @property
+    def is_loaded(self):
+        """
+        True once the full profile has been loaded.
+        """
+        return self._wrapped is not empty
+
+    def __getattr__(self, name):
+        if name in CLAIM_FIELDS:
+            # The profile cache is kept current by profile events; it never queries here
+            cached = profile_cache.peek(self._user_id)
+            if cached is not None:
+                return cached[name]
+            if self._wrapped is empty and name in self._fields:
+                return self._fields[name]
+        if self._wrapped is empty:
+            self.__dict__["_trigger"] = name
+        return super().__getattr__(name)
+
+    def _setup(self):
+        super()._setup()
+        trigger = self.__dict__["_trigger"] or "other"
+        lazy_profile_stats.record_load(trigger)
+        logger.debug(f"Loaded profile of user {self._user_id} for {trigger!r}")
+
+    async def aload(self):
+        """
+        Loads the full profile from async code, without blocking the event loop.
+        """
+        if self._wrapped is empty:
+            self.__dict__["_trigger"] = "aload"
+            await database_sync_to_async(self._setup)()
+        return self._wrapped
+
+    def __copy__(self):
+        if self._wrapped is empty:
+            return type(self)(self._user_id, self._fields)
+        return copy.copy(self._wrapped)
+
+    def __deepcopy__(self, memo):
+        if self._wrapped is empty:
+            return type(self)(self._user_id, self._fields)
+        return copy.deepcopy(self._wrapped, memo)
+
+    def __repr__(self):
+        state = "loaded" if self._wrapped is not empty else "lazy"
+        return f"<LazyUserProfile: {self._user_id} ({state})>"
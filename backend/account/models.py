@@ -16,6 +16,11 @@ class UserProfile(models.Model):
     first_name = models.CharField(max_length=50)
     last_name = models.CharField(max_length=50)
 
+    # Profiles only ever stand for users authenticated by a verified token; these let code check
+    # `user.is_authenticated` whether it holds a profile, a LazyUserProfile or an AnonymousUser
+    is_authenticated = True
+    is_anonymous = False
+
 def __str__(self):
     return f"{self.first_name} {self.last_name} ({self.email}) - ID: {self.id}"
 
@@ -0,0 +1,174 @@
+import logging
+import time
+from django.conf import settings
+from django.core.cache import cache
+
+from chat_core.lru import LRUCache
+from .models import UserProfile
+
+# Set up the logger
+logger = logging.getLogger(__name__)
+
+# Bumped in the shared Django cache whenever a profile event is processed
+PROFILE_GENERATION_KEY = "account:profiles:generation"
+# Ids of the profiles changed in one generation, e.g. "account:profiles:changed:42"
+PROFILE_CHANGES_KEY = "account:profiles:changed:{}"
+# A process further behind than this drops every entry instead of reading the changes one by one
+MAX_SYNCED_GENERATIONS = 1000
+
+_FIELD_NAMES = [field.attname for field in UserProfile._meta.concrete_fields]
+
+
+class ProfileCache:
+    """
+    Process-local read-through cache of UserProfile rows, bounded in size and age.
+
+    Profiles change in another process (the RabbitMQ consumer, see `rabbitmq_consumer.py`), so
+    entries are invalidated through a change log in the shared Django cache: every batch of
+    profile events bumps a generation counter and stores the ids it changed under the new
+    generation (see `publish_profile_changes`). At most once per `sync_interval`, each process
+    reads the counter and, when it moved, the ids of the generations it missed, and drops only
+    those users' entries, so a burst of registrations or renames leaves everyone else cached.
+    When part of the log is gone (expired or evicted) or the process is too far behind, it
+    drops every entry instead. The TTL bounds how stale an entry can get should the shared
+    cache be unavailable, and is also how long the log is kept: older changes only concern
+    entries that have expired anyway.
+
+    The rows are cached as plain values and every lookup builds a fresh instance, so requests
+    never share (or mutate) the same object.
+
+    Attributes:
+        ttl (float): Seconds an entry is served before it is loaded again.
+        sync_interval (float): Seconds between checks of the shared generation counter.
+    """
+
+    def __init__(self, maxsize=10000, ttl=300, sync_interval=1.0):
+        self.ttl = ttl
+        self.sync_interval = sync_interval
+        self._profiles = LRUCache(maxsize=maxsize)
+        self._generation = None
+        self._synced_at = None
+
+    def _sync(self):
+        now = time.monotonic()
+        if self._synced_at is not None and now - self._synced_at < self.sync_interval:
+            return
+        self._synced_at = now
+
+        generation = cache.get(PROFILE_GENERATION_KEY, 0)
+        if self._generation is not None and generation != self._generation:
+            changed = self._changed_since(self._generation, generation)
+            if changed is None:
+                logger.debug(f"Profiles changed (generation {generation}), dropping {len(self._profiles)} cached")
+                self._profiles.clear()
+            else:
+                for user_id in changed:
+                    self._profiles.pop(user_id)
+        self._generation = generation
+
+    @staticmethod
+    def _changed_since(old, new):
+        # The ids changed after generation `old` up to `new`, or None if they cannot all be read
+        if not old < new <= old + MAX_SYNCED_GENERATIONS:
+            return None
+        keys = [PROFILE_CHANGES_KEY.format(generation) for generation in range(old + 1, new + 1)]
+        logged = cache.get_many(keys)
+        if len(logged) < len(keys):
+            return None
+        return set().union(*logged.values())
+
+    def get(self, user_id):
+        """
+        Returns the UserProfile with the given primary key, loading it on a miss.
+
+        Raises:
+            UserProfile.DoesNotExist: If there is no such profile (misses are not cached).
+        """
+        self._sync()
+        values = self._profiles.get(user_id)
+        if values is None:
+            profile = UserProfile.objects.get(pk=user_id)
+            self.set(profile)
+            return profile
+        return UserProfile.from_db("default", _FIELD_NAMES, values)
+
+    def peek(self, user_id):
+        """
+        Returns the cached field values of a profile as a dict, or None when it is not cached.
+
+        Never queries the database (nor the shared cache), so it is safe on an event loop.
+        """
+        values = self._profiles.get(user_id)
+        if values is None:
+            return None
+        return dict(zip(_FIELD_NAMES, values))
+
+    def set(self, profile):
+        """
+        Caches the current values of a profile, e.g. right after it was saved.
+        """
+        values = [getattr(profile, name) for name in _FIELD_NAMES]
+        self._profiles.set(profile.pk, values, expires_at=time.time() + self.ttl)
+
+    def invalidate(self, user_id):
+        """
+        Drops the cached profile of one user from this process.
+        """
+        self._profiles.pop(user_id)
+
+    def clear(self):
+        self._profiles.clear()
+
+
+profile_cache = ProfileCache(
+    maxsize=getattr(settings, "USER_PROFILE_CACHE_SIZE", 10000),
+    ttl=getattr(settings, "USER_PROFILE_CACHE_TTL", 300),
+    sync_interval=getattr(settings, "USER_PROFILE_CACHE_SYNC_INTERVAL", 1.0),
+)
+
+
+def get_profile(user_id):
+    """
+    Returns the UserProfile of `user_id` from the process-local cache (see `ProfileCache`).
+
+    Raises:
+        UserProfile.DoesNotExist: If there is no such profile.
+    """
+    return profile_cache.get(user_id)
+
+
+def publish_profile_change(profile):
+    """
+    Records that a profile was created or changed.
+
+    This process's entry is refreshed with the new values, and the change is logged in the
+    shared cache so every other process drops its entry for that user at its next sync.
+
+    Args:
+        profile (UserProfile): The saved profile.
+    """
+    publish_profile_changes([profile])
+
+
+def publish_profile_changes(profiles):
+    """
+    Like `publish_profile_change` for a batch of saved profiles, bumping the shared generation
+    counter once and logging the ids of the whole batch under the new generation.
+
+    Args:
+        profiles (list): The saved UserProfile instances.
+    """
+    if not profiles:
+        return
+    for profile in profiles:
+        profile_cache.set(profile)
+    try:
+        generation = cache.incr(PROFILE_GENERATION_KEY)
+    except ValueError:
+        # First change since the shared cache was (re)started
+        if cache.add(PROFILE_GENERATION_KEY, 1, timeout=None):
+            generation = 1
+        else:
+            generation = cache.incr(PROFILE_GENERATION_KEY)
+    # A process reading the new generation before this is stored drops all its entries, which is safe
+    cache.set(PROFILE_CHANGES_KEY.format(generation), [profile.pk for profile in profiles], timeout=profile_cache.ttl)
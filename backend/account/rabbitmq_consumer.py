@@ -3,7 +3,10 @@ import json
 import logging
 from decouple import config
 import time
+from django.conf import settings
+from django.db import IntegrityError, transaction
 from .models import UserProfile
+from .profile_cache import publish_profile_change, publish_profile_changes
 
 # Initialize the logger for your consumer
 logger = logging.getLogger(__name__)
@@ -12,6 +15,19 @@ logger = logging.getLogger(__name__)
 pika_logger = logging.getLogger('pika')
 pika_logger.setLevel(logging.WARNING)  # Use WARNING to suppress DEBUG logs, or INFO for minimal output
 
+# Queue receiving the user events broadcast by the auth service
+USER_EVENTS_QUEUE = "user_registration_queue"
+
+# Queue holding messages until their retry is due; expired messages go back to USER_EVENTS_QUEUE
+RETRY_QUEUE = "retry_queue"
+
+# Redelivery policy for messages that fail to process
+MAX_RETRIES = 5  # Maximum number of retries allowed
+BASE_BACKOFF = 2  # Base backoff time in seconds
+
+# Fields of a user event copied onto the UserProfile
+PROFILE_FIELDS = ("email", "first_name", "last_name")
+
 
 def create_chat_profile(user_data):
     """
@@ -35,6 +51,9 @@ def create_chat_profile(user_data):
         This prevents the creation of duplicate profiles and ensures consistent user data
         across systems when events may be processed multiple times or user data needs to 
         be updated.
+
+        Every processed event is published to the profile caches (see `publish_profile_change`),
+        so no process keeps serving the old name or email.
     """
     try:
         # Attempt to create a new user profile using the provided data
@@ -46,6 +65,7 @@ def create_chat_profile(user_data):
                 "last_name": user_data["last_name"],
             }
         )
+        publish_profile_change(profile)
         
         if created:
             # Log success message indicating the user profile was created
@@ -61,9 +81,74 @@ def create_chat_profile(user_data):
 
 
 
+class MalformedEvent(ValueError):
+    """
+    Raised for a user event that can never be processed (not JSON, or missing fields).
+    """
+
+
+def reject(channel, method, error):
+    """
+    Rejects a message without requeueing it, which sends it to the dead-letter queue.
+
+    Used for malformed events, which would fail the same way on every retry.
+    """
+    logger.error(f"Rejecting malformed user event {method.delivery_tag}: {error}")
+    channel.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+
+
+def retry_or_dead_letter(channel, method, properties, body, error):
+    """
+    Settles a message that failed for a possibly transient reason: retried later, or dead-lettered.
+
+    The message is published to the retry queue with an incremented `retry_count` header and
+    an exponential backoff as its expiration. The retry queue dead-letters expired messages
+    back to the user events queue (see `start_consumer`), so the broker applies the delay and
+    the consumer never sleeps; the failed delivery is acknowledged, since the copy replaces it.
+    Once `MAX_RETRIES` is reached the message is rejected without requeueing instead, which
+    sends it to the dead-letter queue.
+
+    Args:
+        channel: The channel object from RabbitMQ for message communication.
+        method: Delivery method of the failed message.
+        properties: Message properties, including the `retry_count` header.
+        body (bytes): The original message body.
+        error (Exception): Why processing failed, for the logs.
+    """
+    retry_count = int((properties.headers or {}).get("retry_count", 0))
+
+    # Check if retry count has reached the max allowed retries
+    if retry_count >= MAX_RETRIES:
+        # Log and move the message to the dead-letter queue (DLQ)
+        logger.error(f"Message failed after {retry_count} retries. Moving to DLQ: {error}")
+        # Reject the message and do not requeue it, sending it to the DLQ
+        channel.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+        return
+
+    # Increment the retry count and apply exponential backoff
+    headers = dict(properties.headers or {})
+    headers["retry_count"] = retry_count + 1
+
+    # Calculate backoff time based on retry count (exponential backoff)
+    backoff_time = BASE_BACKOFF ** retry_count
+    logger.error(f"Retrying message in {backoff_time} seconds, attempt {retry_count + 1}: {error}")
+
+    # Park the message in the retry queue until its expiration sends it back
+    channel.basic_publish(
+        exchange='',
+        routing_key=RETRY_QUEUE,
+        body=body,
+        properties=pika.BasicProperties(headers=headers, delivery_mode=2, expiration=str(backoff_time * 1000)),
+    )
+
+    # The copy replaces this delivery; without the ack it would stay unacknowledged (and
+    # count against the prefetch window) until the connection closes, then be redelivered
+    channel.basic_ack(delivery_tag=method.delivery_tag)
+
+
 def callback(channel, method, properties, body):
     """
-    Callback function to process messages from the RabbitMQ queue.
+    Callback function to process messages from the RabbitMQ queue one at a time.
 
     Args:
         channel: The channel object from RabbitMQ for message communication.
@@ -72,65 +157,176 @@ def callback(channel, method, properties, body):
         body (bytes): The message body containing user data in JSON format.
 
     Process:
-        - Deserializes the message body from JSON to a Python dictionary.
+        - Deserializes and validates the message body (see `parse_user_event`).
         - Calls `create_chat_profile` to store the user data in the database.
         - Acknowledges the message if processing is successful.
-        - Implements retry logic with exponential backoff if processing fails.
-        - Moves the message to a dead-letter queue (DLQ) after exceeding the retry limit.
+        - Rejects a malformed message straight away (see `reject`).
+        - Hands any other failure to `retry_or_dead_letter`, which retries it with exponential
+          backoff and moves it to the dead-letter queue (DLQ) after exceeding the retry limit.
 
     Logs:
         - Logs errors during message processing or user profile creation.
         - Logs retry attempts and delays between retries.
     """
-    max_retries = 5  # Maximum number of retries allowed
-    base_backoff = 2  # Base backoff time in seconds
-    
     try:
-        # Deserialize the message body from JSON to a dictionary
-        user_data = json.loads(body)
-        
-        # Initialize retry_count safely, defaulting to 0 if not present
-        retry_count = int(properties.headers.get("retry_count", 0)) if properties.headers else 0
-        
+        # Deserialize and validate the message body
+        user_data = parse_user_event(body)
+    except MalformedEvent as e:
+        reject(channel, method, e)
+        return
+
+    try:
         # Create the chat profile using the deserialized user data
         create_chat_profile(user_data)
         
         # Acknowledge successful message processing to RabbitMQ
         channel.basic_ack(delivery_tag=method.delivery_tag)
     except Exception as e:
-        # Check if retry count has reached the max allowed retries
-        if retry_count >= max_retries:
-            # Log and move the message to the dead-letter queue (DLQ)
-            logger.error(f"Message failed after {retry_count} retries. Moving to DLQ: {e}")
-            # Reject the message and do not requeue it, sending it to the DLQ
-            channel.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
-        else:
-            # Increment the retry count and apply exponential backoff
-            headers = properties.headers or {}
-            headers["retry_count"] = retry_count + 1
-            
-            # Calculate backoff time based on retry count (exponential backoff)
-            backoff_time = base_backoff ** retry_count
-            logger.error(f"Retrying message in {backoff_time} seconds, attempt {retry_count + 1}: {e}")
-            
-            # Delay the retry by the calculated backoff time
-            time.sleep(backoff_time)
-            
-            # Create new properties with the updated headers
-            new_properties = pika.BasicProperties(headers=headers)
-            
-            # Requeue the message for another attempt with updated headers
-            channel.basic_publish(
-                exchange='',
-                routing_key=method.routing_key,
-                body=body,
-                properties=new_properties
+        retry_or_dead_letter(channel, method, properties, body, e)
+
+
+def parse_user_event(body):
+    """
+    Deserializes the body of a user event.
+
+    Args:
+        body (bytes): The message body, a JSON object with 'id', 'email', 'first_name' and
+            'last_name'.
+
+    Returns:
+        dict: The user data.
+
+    Raises:
+        MalformedEvent: If the body is not valid JSON or misses one of the fields.
+    """
+    try:
+        user_data = json.loads(body)
+    except ValueError as e:
+        raise MalformedEvent(f"User event is not valid JSON: {e}")
+    if not isinstance(user_data, dict):
+        raise MalformedEvent("User event is not a JSON object")
+    missing = [name for name in ("id", *PROFILE_FIELDS) if user_data.get(name) is None]
+    if missing:
+        raise MalformedEvent(f"User event is missing {', '.join(missing)}")
+    return user_data
+
+
+def profile_from_event(body):
+    """
+    Builds an unsaved UserProfile from the body of a user event.
+
+    Returns:
+        UserProfile: The profile to upsert.
+
+    Raises:
+        MalformedEvent: If the body is not a valid user event (see `parse_user_event`).
+    """
+    user_data = parse_user_event(body)
+    return UserProfile(id=user_data["id"], **{name: user_data[name] for name in PROFILE_FIELDS})
+
+
+def process_batch(channel, deliveries):
+    """
+    Upserts the profiles of a batch of user events in one transaction and acks them together.
+
+    Every delivery is parsed first; a message that cannot be parsed (a poison message) is
+    rejected on its own right away (see `reject`), as no retry could fix it. The remaining
+    events are written with a
+    single `bulk_create(update_conflicts=True)`, the last event winning when one user appears
+    several times, and acknowledged with one `basic_ack(multiple=True)` on the highest delivery
+    tag. The poison messages are settled before that, so the multiple ack covers exactly the
+    upserted ones.
+
+    If the upsert violates a constraint (e.g. an email already used by another profile), the
+    batch is processed again message by message with `callback`, so only the offending event is
+    retried. Any other database error (e.g. the database is down) would fail every message the
+    same way, so the whole batch goes to `retry_or_dead_letter` without further queries. Retries
+    are delayed by the broker, so neither path ever sleeps in the consume loop.
+
+    Args:
+        channel: The channel object from RabbitMQ for message communication.
+        deliveries (list): `(method, properties, body)` tuples, in delivery order.
+    """
+    profiles = {}
+    accepted = []
+    for method, properties, body in deliveries:
+        try:
+            profile = profile_from_event(body)
+        except MalformedEvent as e:
+            reject(channel, method, e)
+            continue
+        profiles.pop(profile.id, None)
+        profiles[profile.id] = profile
+        accepted.append((method, properties, body))
+
+    if not accepted:
+        return
+
+    try:
+        with transaction.atomic():
+            UserProfile.objects.bulk_create(
+                list(profiles.values()),
+                update_conflicts=True,
+                unique_fields=["id"],
+                update_fields=list(PROFILE_FIELDS),
             )
+    except IntegrityError as e:
+        logger.error(f"Batch upsert of {len(profiles)} user profiles failed, processing one by one: {e}")
+        for method, properties, body in accepted:
+            callback(channel, method, properties, body)
+        return
+    except Exception as e:
+        logger.error(f"Batch upsert of {len(profiles)} user profiles failed, retrying the batch: {e}")
+        for method, properties, body in accepted:
+            retry_or_dead_letter(channel, method, properties, body, e)
+        return
+
+    publish_profile_changes(list(profiles.values()))
+    channel.basic_ack(delivery_tag=max(method.delivery_tag for method, _, _ in accepted), multiple=True)
+    logger.info(f"Upserted {len(profiles)} user profiles from {len(accepted)} events")
 
 
-def start_consumer():
+def consume_batches(channel, batch_size, max_wait):
+    """
+    Consumes the user events queue in batches, handing each one to `process_batch`.
+
+    A batch is processed once it holds `batch_size` deliveries or `max_wait` seconds after its
+    first delivery, whichever comes first. The wait is checked whenever a message arrives or
+    the queue has been idle for `max_wait`, so a partial batch waits at most twice as long.
+
+    Args:
+        channel: The channel object from RabbitMQ, with its prefetch already set.
+        batch_size (int): Maximum number of deliveries per batch.
+        max_wait (float): Seconds a delivery may wait for its batch to fill up.
+    """
+    batch = []
+    deadline = None
+    for method, properties, body in channel.consume(USER_EVENTS_QUEUE, inactivity_timeout=max_wait):
+        if method is not None:
+            batch.append((method, properties, body))
+            if deadline is None:
+                deadline = time.monotonic() + max_wait
+
+        if batch and (len(batch) >= batch_size or time.monotonic() >= deadline):
+            process_batch(channel, batch)
+            batch = []
+            deadline = None
+
+
+def start_consumer(batch_size=None, batch_wait_ms=None, prefetch=None):
     """
     Start the RabbitMQ consumer to listen for messages on the 'user_registration_queue'.
+
+    With a `batch_size` above 1 the events are consumed in batches (see `consume_batches` and
+    `process_batch`); otherwise every message goes through `callback` on its own. Unset
+    arguments fall back to the USER_EVENTS_BATCH_SIZE, USER_EVENTS_BATCH_WAIT_MS and
+    USER_EVENTS_PREFETCH settings.
+
+    Args:
+        batch_size (int): Maximum number of events upserted together.
+        batch_wait_ms (int): Milliseconds an event may wait for its batch to fill up.
+        prefetch (int): Unacknowledged deliveries RabbitMQ sends ahead (`basic_qos`). It should
+            be at least `batch_size`, or batches can never fill up.
     
     Process:
         - Establish a connection to RabbitMQ using credentials from environment variables.
@@ -144,6 +340,10 @@ def start_consumer():
         - Logs when the consumer starts successfully.
         - Logs errors if the connection or channel setup fails.
     """
+    batch_size = batch_size or getattr(settings, "USER_EVENTS_BATCH_SIZE", 100)
+    batch_wait_ms = batch_wait_ms or getattr(settings, "USER_EVENTS_BATCH_WAIT_MS", 250)
+    prefetch = max(prefetch or getattr(settings, "USER_EVENTS_PREFETCH", 200), batch_size)
+
     try:
         # Establish a connection to RabbitMQ using the CloudAMQP URL from environment variables
         connection = pika.BlockingConnection(pika.URLParameters(config("CLOUDAMQP_URL")))
@@ -162,21 +362,31 @@ def start_consumer():
         channel.exchange_declare(exchange="dead_letter_exchange", exchange_type="direct")
         
         # Declare the retry queue with a TTL of 60 seconds to allow message reprocessing
-        channel.queue_declare(queue="retry_queue", arguments={
+        channel.queue_declare(queue=RETRY_QUEUE, arguments={
             'x-message-ttl': 60000,  # Time to live for messages (60 seconds)
             'x-dead-letter-exchange': '',  # Use the default exchange for rerouting
             'x-dead-letter-routing-key': 'user_registration_queue'  # Requeue messages to the original queue
         })
         
         # Bind the retry queue to the dead-letter exchange for message routing
-        channel.queue_bind(queue="retry_queue", exchange="dead_letter_exchange")
+        channel.queue_bind(queue=RETRY_QUEUE, exchange="dead_letter_exchange")
         
         # Declare the actual DLQ where messages that exhaust retries will be routed
         channel.queue_declare(queue="dead_letter_queue", durable=True)
         channel.queue_bind(queue="dead_letter_queue", exchange="dead_letter_exchange")
         
+        # Let RabbitMQ send a window of messages ahead instead of one per round trip
+        channel.basic_qos(prefetch_count=prefetch)
+
+        if batch_size > 1:
+            logger.info(
+                f"Consumer started in batch mode ({batch_size} events or {batch_wait_ms} ms, prefetch {prefetch})."
+            )
+            consume_batches(channel, batch_size, batch_wait_ms / 1000)
+            return
+
         # Start consuming messages from the main queue using the `callback` function
-        channel.basic_consume(queue="user_registration_queue", on_message_callback=callback)
+        channel.basic_consume(queue=USER_EVENTS_QUEUE, on_message_callback=callback)
         
         # Log that the consumer has started and is waiting for messages
         logger.info("Consumer started, waiting for messages.")
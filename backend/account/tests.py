@@ -1,3 +1,359 @@
+import json
+import time
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import jwt
+from django.conf import settings
+from django.core.cache import cache
+from django.db import OperationalError, connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework import exceptions
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from auth_backend.tokens import verified_tokens
+from .authenticate import JWTCookieAuthentication
+
+from .lazy_profile import LazyUserProfile, lazy_profile_stats
+from .models import UserProfile
+from .profile_cache import PROFILE_CHANGES_KEY, PROFILE_GENERATION_KEY, ProfileCache, profile_cache
+from .rabbitmq_consumer import callback, consume_batches, create_chat_profile, process_batch
+
+
+class ProfileCacheTests(TestCase):
+    """
+    UserProfile lookups are served from the process-local cache until a profile event arrives.
+    """
+
+    def setUp(self):
+        cache.delete(PROFILE_GENERATION_KEY)
+        profile_cache.clear()
+        self.addCleanup(profile_cache.clear)
+        self.user = UserProfile.objects.create(email="user@example.com", first_name="User", last_name="Test")
+
+    def test_repeated_lookups_skip_the_database(self):
+        profiles = ProfileCache(sync_interval=60)
+        with self.assertNumQueries(1):
+            first = profiles.get(self.user.pk)
+            second = profiles.get(self.user.pk)
+        self.assertEqual(first, self.user)
+        self.assertEqual(second.first_name, "User")
+
+        # Every lookup gets its own instance
+        second.first_name = "Changed"
+        self.assertEqual(profiles.get(self.user.pk).first_name, "User")
+
+    def test_missing_profiles_raise_and_are_not_cached(self):
+        profiles = ProfileCache(sync_interval=60)
+        with self.assertNumQueries(2):
+            for _ in range(2):
+                with self.assertRaises(UserProfile.DoesNotExist):
+                    profiles.get(self.user.pk + 1)
+
+    def test_entries_expire_after_the_ttl(self):
+        profiles = ProfileCache(ttl=0, sync_interval=60)
+        with self.assertNumQueries(2):
+            profiles.get(self.user.pk)
+            profiles.get(self.user.pk)
+
+    def test_consumer_events_refresh_this_process(self):
+        profile_cache.get(self.user.pk)
+        create_chat_profile(
+            {"id": self.user.pk, "email": "user@example.com", "first_name": "Renamed", "last_name": "Test"}
+        )
+        with self.assertNumQueries(0):
+            self.assertEqual(profile_cache.get(self.user.pk).first_name, "Renamed")
+
+    def test_consumer_events_invalidate_other_processes(self):
+        # A second cache stands in for another process sharing the Django cache
+        other = ProfileCache(sync_interval=0)
+        self.assertEqual(other.get(self.user.pk).first_name, "User")
+
+        create_chat_profile(
+            {"id": self.user.pk, "email": "user@example.com", "first_name": "Renamed", "last_name": "Test"}
+        )
+        self.assertEqual(cache.get(PROFILE_GENERATION_KEY), 1)
+        self.assertEqual(other.get(self.user.pk).first_name, "Renamed")
+
+        # Within the sync interval the shared generation is not read again
+        throttled = ProfileCache(sync_interval=60)
+        throttled.get(self.user.pk)
+        with patch("account.profile_cache.cache.get") as shared_get:
+            throttled.get(self.user.pk)
+        shared_get.assert_not_called()
+
+
+    def test_events_only_evict_the_changed_users_in_other_processes(self):
+        other_user = UserProfile.objects.create(email="other@example.com", first_name="Other", last_name="Test")
+        other = ProfileCache(sync_interval=0)
+        other.get(self.user.pk)
+        other.get(other_user.pk)
+
+        create_chat_profile(
+            {"id": self.user.pk, "email": "user@example.com", "first_name": "Renamed", "last_name": "Test"}
+        )
+        with self.assertNumQueries(1):
+            self.assertEqual(other.get(self.user.pk).first_name, "Renamed")
+            self.assertEqual(other.get(other_user.pk).first_name, "Other")
+
+    def test_missing_change_log_drops_every_entry(self):
+        other = ProfileCache(sync_interval=0)
+        other.get(self.user.pk)
+
+        create_chat_profile(
+            {"id": self.user.pk + 1, "email": "new@example.com", "first_name": "New", "last_name": "Test"}
+        )
+        cache.delete(PROFILE_CHANGES_KEY.format(cache.get(PROFILE_GENERATION_KEY)))
+        with self.assertNumQueries(1):
+            other.get(self.user.pk)
+
+class LazyUserProfileTests(TestCase):
+    """
+    A LazyUserProfile answers the token claims itself and loads the profile once, on demand.
+    """
+
+    def setUp(self):
+        profile_cache.clear()
+        lazy_profile_stats.reset()
+        self.addCleanup(profile_cache.clear)
+        self.user = UserProfile.objects.create(email="user@example.com", first_name="User", last_name="Test")
+
+    def test_claims_are_served_without_loading(self):
+        user = LazyUserProfile(self.user.pk, {"user_id": self.user.pk, "first_name": "User", "exp": 0})
+        with self.assertNumQueries(0):
+            self.assertEqual((user.pk, user.id, user.first_name), (self.user.pk, self.user.pk, "User"))
+            self.assertTrue(user.is_authenticated)
+            self.assertFalse(user.is_anonymous)
+        self.assertFalse(user.is_loaded)
+        self.assertEqual(lazy_profile_stats.snapshot()["loaded"], 0)
+
+    def test_other_attributes_load_the_profile_once(self):
+        user = LazyUserProfile(self.user.pk, {"first_name": "User"})
+        with self.assertNumQueries(1):
+            self.assertEqual(user.email, "user@example.com")
+            self.assertEqual(user.last_name, "Test")
+        self.assertTrue(user.is_loaded)
+        self.assertEqual(user, self.user)
+
+        stats = lazy_profile_stats.snapshot()
+        self.assertEqual((stats["created"], stats["loaded"], stats["load_ratio"]), (1, 1, 1.0))
+        self.assertEqual(stats["triggers"], {"email": 1})
+
+
+class JWTCookieAuthenticationTests(TestCase):
+    """
+    DRF endpoints can authenticate from the access token cookie without touching the session.
+    """
+
+    def setUp(self):
+        for cached in (verified_tokens, profile_cache):
+            cached.clear()
+            self.addCleanup(cached.clear)
+        cache.clear()
+        self.user = UserProfile.objects.create(email="user@example.com", first_name="User", last_name="Test")
+
+    def token(self, lifetime=300):
+        claims = {"user_id": self.user.pk, "exp": int(time.time()) + lifetime}
+        return jwt.encode(claims, settings.JWT_ACCESS_SECRET, algorithm="HS256")
+
+    def request(self, method="get", token=None, factory=None):
+        factory = factory or APIRequestFactory(enforce_csrf_checks=True)
+        request = getattr(factory, method)("/api/server/select/")
+        if token:
+            request.COOKIES["access_token"] = token
+        return Request(request)
+
+    def test_valid_cookie_authenticates_with_the_claims(self):
+        user, claims = JWTCookieAuthentication().authenticate(self.request(token=self.token()))
+        self.assertEqual(user, self.user)
+        self.assertEqual(claims["user_id"], self.user.pk)
+
+    def test_missing_cookie_leaves_it_to_other_classes(self):
+        self.assertIsNone(JWTCookieAuthentication().authenticate(self.request()))
+
+    def test_bad_tokens_and_unknown_users_fail(self):
+        authentication = JWTCookieAuthentication()
+        for token in (self.token(lifetime=-10), "not-a-token"):
+            with self.assertRaises(exceptions.AuthenticationFailed):
+                authentication.authenticate(self.request(token=token))
+
+        token = self.token()
+        self.user.delete()
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            authentication.authenticate(self.request(token=token))
+
+    def test_unsafe_methods_require_csrf(self):
+        with self.assertRaises(exceptions.PermissionDenied):
+            JWTCookieAuthentication().authenticate(self.request("post", token=self.token()))
+
+    def test_hot_endpoints_skip_the_session(self):
+        client = APIClient()
+        client.cookies["access_token"] = self.token()
+        client.cookies["sessionid"] = "stale-session"
+        client.get("/api/server/select/")
+
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get("/api/server/select/", {"by_user": "true"})
+        self.assertEqual(response.status_code, 200)
+        tables = " ".join(query["sql"] for query in queries)
+        self.assertNotIn("django_session", tables)
+        self.assertNotIn("account_userprofile", tables)
+
+        client.cookies["access_token"] = self.token(lifetime=-10)
+        self.assertEqual(client.get("/api/messages/", {"channel_id": "1"}).status_code, 401)
+
+    def test_public_listing_serves_an_expired_cookie_anonymously(self):
+        client = APIClient()
+        client.cookies["access_token"] = self.token(lifetime=-10)
+        self.assertEqual(client.get("/api/server/select/").status_code, 200)
+        client.cookies["access_token"] = "not-a-token"
+        self.assertEqual(client.get("/api/server/select/").status_code, 200)
+
+    def test_other_views_ignore_the_cookie(self):
+        client = APIClient()
+        expected = client.get("/api/server/category/").status_code
+        client.cookies["access_token"] = self.token(lifetime=-10)
+        self.assertEqual(client.get("/api/server/category/").status_code, expected)
+
+
+class FakeChannel:
+    """
+    Records what a consumer does with its deliveries, and replays `deliveries` from `consume`.
+    """
+
+    def __init__(self, deliveries=()):
+        self.deliveries = list(deliveries)
+        self.acks, self.nacks, self.published = [], [], []
+        self.batches = []
+        self.clock = 0
+
+    def basic_ack(self, delivery_tag, multiple=False):
+        self.acks.append((delivery_tag, multiple))
+
+    def basic_nack(self, delivery_tag, requeue=True):
+        self.nacks.append(delivery_tag)
+
+    def basic_publish(self, exchange, routing_key, body, properties):
+        self.published.append((routing_key, body, properties.headers, properties.expiration))
+
+    def consume(self, queue, inactivity_timeout=None):
+        for method, properties, body in self.deliveries:
+            if method is None:
+                # Idle for the whole inactivity timeout
+                self.clock += inactivity_timeout
+            yield method, properties, body
+
+
+def delivery(tag, body, retry_count=None):
+    method = SimpleNamespace(delivery_tag=tag, routing_key="")
+    properties = SimpleNamespace(headers=None if retry_count is None else {"retry_count": retry_count})
+    if not isinstance(body, bytes):
+        body = json.dumps(body).encode()
+    return method, properties, body
+
+
+def user_event(user_id, first_name="User"):
+    return {"id": user_id, "email": f"user{user_id}@example.com", "first_name": first_name, "last_name": "Test"}
+
+
+class UserEventConsumerTests(TestCase):
+    """
+    User events are upserted a batch at a time, and failing messages are settled one by one.
+    """
+
+    def setUp(self):
+        cache.delete(PROFILE_GENERATION_KEY)
+        profile_cache.clear()
+        self.addCleanup(profile_cache.clear)
+        UserProfile.objects.create(**user_event(1))
+
+    def test_batch_is_upserted_in_constant_queries_and_acked_at_once(self):
+        for size in (3, 30):
+            channel = FakeChannel()
+            deliveries = [delivery(tag, user_event(tag, first_name=f"Name{size}")) for tag in range(1, size + 1)]
+            with self.assertNumQueries(3):
+                process_batch(channel, deliveries)
+            self.assertEqual(channel.acks, [(size, True)])
+
+        self.assertEqual(UserProfile.objects.count(), 30)
+        self.assertEqual(UserProfile.objects.get(pk=1).first_name, "Name30")
+        with self.assertNumQueries(0):
+            self.assertEqual(profile_cache.get(30).first_name, "Name30")
+
+    def test_last_event_for_a_user_wins(self):
+        channel = FakeChannel()
+        process_batch(channel, [delivery(1, user_event(2, "First")), delivery(2, user_event(2, "Second"))])
+        self.assertEqual(UserProfile.objects.get(pk=2).first_name, "Second")
+        self.assertEqual(channel.acks, [(2, True)])
+
+    def test_poison_messages_are_isolated(self):
+        channel = FakeChannel()
+        process_batch(
+            channel,
+            [
+                delivery(1, user_event(2)),
+                delivery(2, b"not json"),
+                delivery(3, {"id": 3}, retry_count=5),
+                delivery(4, user_event(4)),
+            ],
+        )
+        self.assertEqual(UserProfile.objects.filter(pk__in=[2, 4]).count(), 2)
+
+        # Malformed messages are rejected outright, never retried, before the good ones are
+        # acked together
+        self.assertEqual(channel.published, [])
+        self.assertEqual(channel.nacks, [2, 3])
+        self.assertEqual(channel.acks, [(4, True)])
+
+    def test_failed_upsert_falls_back_to_single_messages(self):
+        channel = FakeChannel()
+        # Same email as profile 1 under another id: only this event can fail
+        clash = {**user_event(5), "email": "user1@example.com"}
+        process_batch(channel, [delivery(1, user_event(2)), delivery(2, clash), delivery(3, user_event(3))])
+
+        self.assertEqual(set(UserProfile.objects.values_list("pk", flat=True)), {1, 2, 3})
+        self.assertEqual(channel.acks, [(1, False), (2, False), (3, False)])
+        self.assertEqual(len(channel.published), 1)
+
+    def test_batches_flush_on_size_and_idle_timeout(self):
+        events = [delivery(tag, user_event(tag + 1)) for tag in range(1, 6)]
+        # None marks the queue going idle for the whole wait
+        channel = FakeChannel(events + [(None, None, None)])
+        with patch("account.rabbitmq_consumer.time.monotonic", lambda: channel.clock), patch(
+            "account.rabbitmq_consumer.process_batch", side_effect=lambda ch, batch: ch.batches.append(batch)
+        ):
+            consume_batches(channel, batch_size=2, max_wait=60)
+        batches = [[method.delivery_tag for method, _, _ in batch] for batch in channel.batches]
+        self.assertEqual(batches, [[1, 2], [3, 4], [5]])
+
+    def test_database_outage_retries_the_batch_without_per_message_queries(self):
+        channel = FakeChannel()
+        deliveries = [delivery(tag, user_event(tag + 1), retry_count=2) for tag in range(1, 4)]
+        with patch.object(UserProfile.objects, "bulk_create", side_effect=OperationalError("database is down")):
+            with CaptureQueriesContext(connection) as queries:
+                process_batch(channel, deliveries)
+        # Only the transaction's savepoint; no message is tried on its own
+        self.assertFalse([query for query in queries if "account_userprofile" in query["sql"]])
+
+        # Parked in the retry queue with a 4 s backoff, and the deliveries acked
+        self.assertEqual(
+            [(key, headers, expiration) for key, _, headers, expiration in channel.published],
+            [("retry_queue", {"retry_count": 3}, "4000")] * 3,
+        )
+        self.assertEqual(channel.acks, [(1, False), (2, False), (3, False)])
+
+    def test_single_message_callback(self):
+        channel = FakeChannel()
+        callback(channel, *delivery(6, b"{}"))
+        self.assertEqual((channel.nacks, channel.published), ([6], []))
+
+        with patch("account.rabbitmq_consumer.create_chat_profile", side_effect=OperationalError("down")):
+            callback(channel, *delivery(7, user_event(7)))
+        self.assertEqual(channel.published[0][2], {"retry_count": 1})
+        self.assertEqual(channel.acks, [(7, False)])
 
-# Create your tests here.
+        callback(channel, *delivery(8, user_event(8)))
+        self.assertEqual(channel.acks[-1], (8, False))
+        self.assertTrue(UserProfile.objects.filter(pk=8).exists())
@@ -1,8 +1,9 @@
 import jwt
 import logging
-from django.conf import settings
 from django.contrib.auth.backends import BaseBackend
 from account.models import UserProfile  # Adjust this import if necessary
+from account.profile_cache import get_profile
+from .tokens import verify_access_token
 
 # Set up logging for the authentication backend
 logger = logging.getLogger(__name__)
@@ -28,7 +29,8 @@ class JWTAuthenticationBackend(BaseBackend):
         """
         Authenticate a user based on the JWT token provided.
 
-        This method extracts and decodes the JWT token to retrieve the user's ID.
+        This method verifies the JWT token to retrieve the user's ID. Verified tokens are cached
+        until they expire (see `verify_access_token`), so repeated requests skip the decoding.
         If the token is valid and the user exists, the user object is returned.
         If the token is invalid, expired, or the user does not exist, None is returned.
 
@@ -44,14 +46,14 @@ class JWTAuthenticationBackend(BaseBackend):
             return None
 
         try:
-            # Decode the JWT token to extract the user ID
+            # Verify the JWT token to extract the user ID
             logger.debug("Decoding JWT token.")
-            payload = jwt.decode(token, settings.JWT_ACCESS_SECRET, algorithms=["HS256"])
+            payload = verify_access_token(token)
             user_id = payload.get("user_id")
             logger.debug(f"Token payload decoded successfully. User ID: {user_id}")
 
-            # Fetch the user from the database based on the user ID
-            user = UserProfile.objects.get(pk=user_id)
+            # Fetch the user based on the user ID, from the profile cache when possible
+            user = get_profile(user_id)
             logger.info(f"User {user_id} authenticated successfully via JWT.")
             return user
         
@@ -74,8 +76,9 @@ class JWTAuthenticationBackend(BaseBackend):
         """
         Retrieve a user instance by user_id.
 
-        This method is used by Django to fetch a user instance from the database.
-        It is typically called after the user has been authenticated.
+        This method is used by Django to fetch a user instance. It is typically called after
+        the user has been authenticated, so it is served from the process-local profile cache
+        (see `get_profile`) rather than the database.
 
         Parameters:
             user_id (int): The ID of the user to retrieve.
@@ -85,7 +88,7 @@ class JWTAuthenticationBackend(BaseBackend):
         """
         try:
             # Attempt to retrieve the user by their ID
-            return UserProfile.objects.get(pk=user_id)
+            return get_profile(user_id)
         except UserProfile.DoesNotExist:
             # Log an error if the user does not exist
             logger.error(f"User with ID {user_id} not found.")
@@ -1,3 +1,82 @@
+import time
+from unittest.mock import patch
+
+import jwt
+from django.conf import settings
 from django.test import TestCase
 
-# Create your tests here.
+from account.models import UserProfile
+from account.profile_cache import profile_cache
+from chat_core.lru import LRUCache
+from .backends import JWTAuthenticationBackend
+from .tokens import verified_tokens, verify_access_token
+
+
+class AccessTokenVerificationTests(TestCase):
+    """
+    Verified access tokens are cached by digest until their own expiry.
+    """
+
+    def setUp(self):
+        verified_tokens.clear()
+        profile_cache.clear()
+        self.addCleanup(verified_tokens.clear)
+        self.addCleanup(profile_cache.clear)
+        self.user = UserProfile.objects.create(email="user@example.com", first_name="User", last_name="Test")
+
+    def token(self, lifetime=300, secret=None):
+        claims = {"user_id": self.user.pk, "exp": int(time.time()) + lifetime}
+        return jwt.encode(claims, secret or settings.JWT_ACCESS_SECRET, algorithm="HS256")
+
+    def test_repeated_verification_skips_decoding(self):
+        token = self.token()
+        with patch("auth_backend.tokens.jwt.decode", wraps=jwt.decode) as decode:
+            for _ in range(3):
+                self.assertEqual(verify_access_token(token)["user_id"], self.user.pk)
+        self.assertEqual(decode.call_count, 1)
+
+        # Callers get their own copy of the cached claims
+        verify_access_token(token)["user_id"] = None
+        self.assertEqual(verify_access_token(token)["user_id"], self.user.pk)
+
+    def test_entries_expire_with_the_token(self):
+        token = self.token(lifetime=60)
+        verify_access_token(token)
+
+        # Past the token's exp the cached claims are gone and the token is decoded again
+        with patch("chat_core.lru.time.time", return_value=time.time() + 61):
+            with patch("auth_backend.tokens.jwt.decode", wraps=jwt.decode) as decode:
+                verify_access_token(token)
+        decode.assert_called_once()
+
+        with self.assertRaises(jwt.ExpiredSignatureError):
+            verify_access_token(self.token(lifetime=-10))
+
+    def test_invalid_tokens_are_never_cached(self):
+        token = self.token(secret="not-the-secret")
+        for _ in range(2):
+            with self.assertRaises(jwt.InvalidSignatureError):
+                verify_access_token(token)
+        self.assertEqual(len(verified_tokens), 0)
+
+    def test_backend_authenticates_with_cached_claims(self):
+        backend = JWTAuthenticationBackend()
+        token = self.token()
+        self.assertEqual(backend.authenticate(None, token=token), self.user)
+        with patch("auth_backend.tokens.jwt.decode") as decode:
+            self.assertEqual(backend.authenticate(None, token=token), self.user)
+        decode.assert_not_called()
+        self.assertIsNone(backend.authenticate(None, token=self.token(lifetime=-10)))
+
+
+class LRUCacheExpiryTests(TestCase):
+    def test_expired_entries_read_as_absent(self):
+        cache = LRUCache(maxsize=3)
+        cache.set("fresh", 1, expires_at=time.time() + 60)
+        cache.set("stale", 2, expires_at=time.time() - 1)
+        cache.set("forever", 3)
+
+        self.assertEqual(cache.get("fresh"), 1)
+        self.assertNotIn("stale", cache)
+        self.assertIsNone(cache.pop("stale"))
+        self.assertEqual(cache.get("forever"), 3)
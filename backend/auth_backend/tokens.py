@@ -0,0 +1,53 @@
+import hashlib
+import logging
+import jwt
+from django.conf import settings
+
+from chat_core.lru import LRUCache
+
+# Set up the logger
+logger = logging.getLogger(__name__)
+
+# Claims of verified access tokens, keyed by the SHA-256 digest of the token. Each entry is
+# dropped at the token's own `exp`, so an expired token is always decoded (and rejected) again.
+verified_tokens = LRUCache(maxsize=getattr(settings, "JWT_VERIFICATION_CACHE_SIZE", 4096))
+
+
+def token_digest(token):
+    """
+    Returns the cache key for a token: its SHA-256 digest, so raw tokens are never kept around.
+    """
+    if isinstance(token, str):
+        token = token.encode()
+    return hashlib.sha256(token).digest()
+
+
+def verify_access_token(token):
+    """
+    Verifies an HS256 access token and returns its claims.
+
+    Every HTTP request and WebSocket connect of a client presents the same token until it
+    expires, so the claims of a verified token are cached until its `exp`: repeated calls
+    (e.g. a reconnect storm) cost one SHA-256 and a dict lookup instead of the HMAC check and
+    the JSON parsing. Tokens without an `exp` claim are verified every time.
+
+    Args:
+        token (str): The encoded JWT, e.g. from the "access_token" cookie.
+
+    Returns:
+        dict: The token's claims (a copy, so callers may modify it).
+
+    Raises:
+        jwt.ExpiredSignatureError: If the token has expired.
+        jwt.InvalidTokenError: If the token is malformed or its signature does not match
+            `JWT_ACCESS_SECRET`.
+    """
+    key = token_digest(token)
+    claims = verified_tokens.get(key)
+    if claims is None:
+        claims = jwt.decode(token, settings.JWT_ACCESS_SECRET, algorithms=["HS256"])
+        if claims.get("exp") is not None:
+            verified_tokens.set(key, claims, expires_at=claims["exp"])
+    else:
+        logger.debug("Access token claims served from the verification cache")
+    return dict(claims)
@@ -12,6 +12,7 @@ django_application = get_asgi_application()
 
 import chat_core.urls as urls
 from chatapp.auth_middleware import JWTWSMiddleware
+from chatapp.lifespan import ChatLifespanApp
 # Define the ASGI application
 application = ProtocolTypeRouter(
     {
@@ -24,6 +25,9 @@ application = ProtocolTypeRouter(
                     URLRouter(urls.websocket_urlpatterns)
             )
         ),
+
+        # Flush write-behind chat messages when the server shuts down
+        "lifespan": ChatLifespanApp(),
     }
 )
 
@@ -33,7 +37,8 @@ ASGI config for chat_core project.
 This module contains the ASGI application used for serving HTTP and WebSocket
 protocols. The application is configured to route HTTP requests to Django's
 ASGI application handler and WebSocket connections to URLRouter with allowed
-hosts validation.
+hosts validation. Lifespan events are handled so pending chat messages are
+flushed on shutdown.
 
 Classes:
     - AllowedHostsOriginValidator: Validates WebSocket origins against allowed hosts.
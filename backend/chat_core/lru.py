@@ -0,0 +1,88 @@
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    Thread-safe, size-bounded mapping that evicts the least recently used entry.
+
+    Used for the small process-wide caches that sit in front of hot lookups (for example
+    channel_id -> conversation id) where an unbounded dict would grow with every key ever seen.
+
+    Entries can also be given an expiry time (for example the `exp` claim of a verified token),
+    after which they read as absent and are dropped.
+
+    Attributes:
+        maxsize (int): Maximum number of entries kept before the oldest one is evicted.
+    """
+
+    def __init__(self, maxsize=1024):
+        if maxsize <= 0:
+            raise ValueError("maxsize must be a positive integer")
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _live_entry(self, key):
+        # The (value, expires_at) entry for `key`, or _MISSING if absent or expired (caller holds the lock)
+        entry = self._data.get(key, _MISSING)
+        if entry is _MISSING:
+            return _MISSING
+        if entry[1] is not None and entry[1] <= time.time():
+            del self._data[key]
+            return _MISSING
+        return entry
+
+    def get(self, key, default=None):
+        """
+        Return the value for `key` and mark it as most recently used, or `default` if absent
+        or expired.
+        """
+        with self._lock:
+            entry = self._live_entry(key)
+            if entry is _MISSING:
+                return default
+            self._data.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value, expires_at=None):
+        """
+        Store `value` under `key`, evicting the least recently used entry when full.
+
+        Args:
+            key: The cache key.
+            value: The value to store.
+            expires_at (float): Unix timestamp from which the entry reads as absent, or None
+                to keep it until it is evicted.
+        """
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        """
+        Remove `key` and return its value, or `default` if it was not cached (or expired).
+        """
+        with self._lock:
+            entry = self._live_entry(key)
+            if entry is _MISSING:
+                return default
+            del self._data[key]
+            return entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key):
+        with self._lock:
+            return self._live_entry(key) is not _MISSING
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
@@ -10,6 +10,22 @@ julia_fiesta_logs()
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 SECRET_KEY = config('SECRET_KEY')
+# Signing key of the access tokens, read once here for every auth path (see auth_backend/tokens.py)
+JWT_ACCESS_SECRET = config("JWT_ACCESS_SECRET")
+# Verified access tokens kept in each process, each until its own expiry
+JWT_VERIFICATION_CACHE_SIZE = config("JWT_VERIFICATION_CACHE_SIZE", default=4096, cast=int)
+# UserProfile rows cached in each process (see account/profile_cache.py): how many, for how
+# many seconds, and how often (seconds) to check for profile changes made by the RabbitMQ consumer
+USER_PROFILE_CACHE_SIZE = config("USER_PROFILE_CACHE_SIZE", default=10000, cast=int)
+USER_PROFILE_CACHE_TTL = config("USER_PROFILE_CACHE_TTL", default=300, cast=int)
+USER_PROFILE_CACHE_SYNC_INTERVAL = config("USER_PROFILE_CACHE_SYNC_INTERVAL", default=1.0, cast=float)
+
+# RabbitMQ user-event consumer (see account/rabbitmq_consumer.py): events upserted per batch
+# (1 processes them one by one), how long (ms) an event may wait for its batch to fill up, and
+# how many unacknowledged deliveries RabbitMQ sends ahead
+USER_EVENTS_BATCH_SIZE = config("USER_EVENTS_BATCH_SIZE", default=100, cast=int)
+USER_EVENTS_BATCH_WAIT_MS = config("USER_EVENTS_BATCH_WAIT_MS", default=250, cast=int)
+USER_EVENTS_PREFETCH = config("USER_EVENTS_PREFETCH", default=200, cast=int)
 DEBUG = config('DEBUG', default=True, cast=bool)
 ALLOWED_HOSTS = [
     '127.0.0.1',  # Localhost IP for backend
@@ -135,10 +151,15 @@ REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
         "rest_framework.authentication.SessionAuthentication",
         # "rest_framework_simplejwt.authentication.JWTAuthentication",
+        # Stateless auth from the access_token cookie (account/authenticate.py) is selected per
+        # view with `authentication_classes`, e.g. on MessageViewSet and ServerListViewSet
         # "account.authenticate.JWTCookieAuthentication",
     ],
 }
 
+# Cookie holding the access token issued by the auth service
+JWT_ACCESS_COOKIE = config("JWT_ACCESS_COOKIE", default="access_token")
+
 # Update AUTHENTICATION_BACKENDS
 AUTHENTICATION_BACKENDS = [
     'django.contrib.auth.backends.ModelBackend',
@@ -186,4 +207,73 @@ else:
                 "hosts": [("127.0.0.1", 6379)],
             },
         },
-    }
\ No newline at end of file
+    }
+
+# Cache holding the server and category listing versions (see server/cache.py).
+# It must be shared by every process, otherwise one process can keep answering
+# 304 for a listing that another process has changed.
+if DEBUG:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": "redis://127.0.0.1:6379/1",
+        }
+    }
+
+# Response cache for the server and category listings (see server/cache.py).
+# "lru" keeps responses in each process; "django" stores them in the SERVER_LISTING_CACHE_ALIAS
+# cache so every process shares them. Either way, entries are invalidated through the listing
+# versions kept in the default cache above.
+SERVER_LISTING_CACHE = config("SERVER_LISTING_CACHE", default="lru")
+SERVER_LISTING_CACHE_SIZE = config("SERVER_LISTING_CACHE_SIZE", default=1024, cast=int)
+SERVER_LISTING_CACHE_ALIAS = config("SERVER_LISTING_CACHE_ALIAS", default="default")
+SERVER_LISTING_CACHE_TIMEOUT = config("SERVER_LISTING_CACHE_TIMEOUT", default=300, cast=int)
+
+# Server image processing (see server/image_pipeline.py)
+# "inline" scales banners and icons inside Server.save(); "background" queues them in the
+# ImageJob table for `manage.py run_image_worker` and returns straight away.
+SERVER_IMAGE_PROCESSING = config("SERVER_IMAGE_PROCESSING", default="inline")
+SERVER_IMAGE_WORKER_PROCESSES = config("SERVER_IMAGE_WORKER_PROCESSES", default=None, cast=lambda v: v if v is None else int(v))
+# Image budgets, checked from the headers before anything is decoded (see server/utils/image_probe.py):
+# pixels per frame, frames per animation, and pixels across all frames
+SERVER_IMAGE_MAX_PIXELS = config("SERVER_IMAGE_MAX_PIXELS", default=25_000_000, cast=int)
+SERVER_IMAGE_MAX_FRAMES = config("SERVER_IMAGE_MAX_FRAMES", default=300, cast=int)
+SERVER_IMAGE_MAX_TOTAL_PIXELS = config("SERVER_IMAGE_MAX_TOTAL_PIXELS", default=100_000_000, cast=int)
+# Seconds before a job claimed by a worker that died is queued again, and tries per job
+SERVER_IMAGE_JOB_TIMEOUT = config("SERVER_IMAGE_JOB_TIMEOUT", default=300, cast=int)
+SERVER_IMAGE_JOB_MAX_ATTEMPTS = config("SERVER_IMAGE_JOB_MAX_ATTEMPTS", default=3, cast=int)
+
+# Chat message persistence
+# "sync" inserts every message before it is broadcast.
+# "batched" broadcasts first and writes messages behind in bulk_create batches, flushed
+# when CHAT_MESSAGE_BATCH_SIZE messages are pending or after CHAT_MESSAGE_FLUSH_INTERVAL seconds.
+# Each process running in batched mode must set a distinct CHAT_WORKER_ID (0-31); it refuses
+# to start without one.
+# Batched mode gives messages time-based ids, far above the auto-increment ones. Every flush
+# advances the table's id sequence past them, so switching back to "sync" keeps ids increasing
+# (messages flushed by older releases: run the SQL from `manage.py sqlsequencereset chatapp`
+# once first). All processes must run in the same mode.
+CHAT_MESSAGE_PERSISTENCE = config("CHAT_MESSAGE_PERSISTENCE", default="sync")
+CHAT_MESSAGE_BATCH_SIZE = config("CHAT_MESSAGE_BATCH_SIZE", default=100, cast=int)
+CHAT_MESSAGE_FLUSH_INTERVAL = config("CHAT_MESSAGE_FLUSH_INTERVAL", default=0.5, cast=float)
+CHAT_WORKER_ID = config("CHAT_WORKER_ID", default=None, cast=lambda v: v if v is None else int(v))
+# Message sequence numbers reserved per database round trip in batched mode. With 0 (default)
+# seq is the time-ordered message id, which follows send order across processes without
+# touching the database. Resume and replay treat seq as the room's total order, which reserved
+# blocks only keep across processes with 1; use more only when a single process writes to each room.
+CHAT_SEQ_BLOCK_SIZE = config("CHAT_SEQ_BLOCK_SIZE", default=0, cast=int)
+
+# Number of channel_id -> conversation id entries cached per process
+CHAT_CONVERSATION_CACHE_SIZE = config("CHAT_CONVERSATION_CACHE_SIZE", default=10000, cast=int)
+
+# Recent messages kept in memory per room and sent as the "history" frame on join
+CHAT_HISTORY_SIZE = config("CHAT_HISTORY_SIZE", default=50, cast=int)
+CHAT_HISTORY_MAX_ROOMS = config("CHAT_HISTORY_MAX_ROOMS", default=1000, cast=int)
+# Longest gap replayed to a resuming socket before it gets a fresh history frame instead
+CHAT_REPLAY_LIMIT = config("CHAT_REPLAY_LIMIT", default=500, cast=int)
@@ -5,6 +5,7 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf.urls.static import static
 from chatapp.consumer import ChatAppConsumer
+from server.media_blobs import serve_media
 
 # drf-spectacular
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
@@ -24,4 +25,5 @@ websocket_urlpatterns = [
 ]
 
 if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    # Content-addressed media (media/blobs/) is served with immutable cache headers
+    urlpatterns += static(settings.MEDIA_URL, view=serve_media, document_root=settings.MEDIA_ROOT)
@@ -1,12 +1,12 @@
 import logging
 from channels.db import database_sync_to_async
-from decouple import config
 import jwt
 from django.contrib.auth.models import AnonymousUser
+from account.lazy_profile import LazyUserProfile
+from account.profile_cache import get_profile
+from auth_backend.tokens import verify_access_token
 from .models import UserProfile
 
-JWT_ACCESS_SECRET = config("JWT_ACCESS_SECRET")
-
 # Set up the logger
 logger = logging.getLogger(__name__)
 
@@ -15,8 +15,14 @@ def get_user_from_token(token):
     """
     Retrieve a user based on the provided JWT token asynchronously.
     
-    This function decodes the JWT token using the secret key, extracts the user ID from the token payload,
-    and fetches the corresponding UserProfile object from the database.
+    This function verifies the JWT token (see `verify_access_token`, which caches the claims of
+    verified tokens until they expire), extracts the user ID from the token payload, and checks
+    that the corresponding UserProfile exists through the process-local profile cache (see
+    `get_profile`), which usually answers without a query.
+
+    The user is returned as a `LazyUserProfile`: the consumer only needs the id and the name for
+    its messages, and the proxy reads the name from the profile cache, so renames published by
+    profile events reach open sockets. The token's own name claims are never used.
     
     The @database_sync_to_async decorator is required because this function interacts with the database,
     which is normally a blocking operation. In asynchronous Django applications (such as those using 
@@ -28,7 +34,7 @@ def get_user_from_token(token):
         token (str): The JWT token to be decoded and validated.
         
     Returns:
-        UserProfile or None: The UserProfile object if the token is valid and the user exists;
+        LazyUserProfile or None: The user if the token is valid and the user exists;
                             None if the token is expired, invalid, or the user does not exist.
     """
     try:
@@ -36,19 +42,19 @@ def get_user_from_token(token):
         logger.debug(f"Decoding token: {token}")
         
 
-        # Decode the JWT using the access secret key
-        payload = jwt.decode(token, JWT_ACCESS_SECRET, algorithms=["HS256"])
+        # Verify the JWT with the access secret key, or reuse the claims of an earlier verification
+        payload = verify_access_token(token)
         logger.info(f"Token decoded successfully: {payload}")
 
         # Extract the user ID from the token payload
         user_id = payload.get("user_id")
         logger.debug(f"Extracted user ID from token: {user_id}")
 
-        # Fetch the corresponding UserProfile from the database
-        user = UserProfile.objects.get(pk=user_id)
-        logger.info(f"User profile found for user ID {user_id}: {user}")
+        # Confirm the profile exists, from the profile cache when possible
+        profile = get_profile(user_id)
+        logger.info(f"User profile found for user ID {user_id}")
 
-        return user
+        return LazyUserProfile.for_profile(profile)
 
     except jwt.ExpiredSignatureError:
         logger.warning("Token has expired")
@@ -136,7 +142,7 @@ class JWTWSMiddleware:
             user = await get_user_from_token(access_token)
             if user:
                 scope["user"] = user
-                logger.info(f"User {user.email} authenticated successfully")
+                logger.info(f"User {user.pk} authenticated successfully")
             else:
                 logger.warning("User authentication failed, treating as AnonymousUser. ")
                 scope["user"] = AnonymousUser()
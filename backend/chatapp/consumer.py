@@ -1,101 +1,211 @@
 import logging
-from channels.generic.websocket import JsonWebsocketConsumer
-from asgiref.sync import async_to_sync
-from .models import Conversation, Message
-from django.contrib.auth.models import AnonymousUser
+from urllib.parse import parse_qs
+from django.conf import settings
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from channels.db import database_sync_to_async
+from .conversations import conversation_ids, resolve_conversation_id
+from .history import load_frames_after, load_recent_frames, message_frame, recent_messages
+from .message_writer import get_message_writer
 
 
 # Create a logger instance
 logger = logging.getLogger(__name__)
 
-class ChatAppConsumer(JsonWebsocketConsumer):
+class ChatAppConsumer(AsyncJsonWebsocketConsumer):
+    """
+    Async WebSocket consumer for a single chat channel.
+
+    Every handler runs on the event loop: the channel layer is awaited directly and the
+    blocking ORM work is pushed to the database thread with `database_sync_to_async`,
+    so a connect, message or disconnect no longer hops through the threadpool just to
+    talk to the channel layer.
+
+    Wire protocol:
+        - inbound:  {"type": "message", "message": "<text>"}
+        - inbound:  {"type": "resume", "after": <seq>}
+        - outbound: {"id": int, "sender": str, "content": str, "timestamp": iso8601, "seq": int}
+        - on join:  {"type": "history", "messages": [<outbound frame>, ...]}
+        - on resume: {"type": "replay", "after": <seq>, "messages": [<outbound frame>, ...]}
+
+    A reconnecting client passes the last `seq` it saw, either as `?resume_after=<seq>` on
+    the connect URL or in a "resume" frame, and receives only the messages it missed.
+    """
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.channel_id = None
         self.user_profile = None
         self.room_name = None
+        self.joined = False
+        self.conversation_id = None
 
-    def connect(self):
-        # Get the authenticated user from the scope, which is set by the JWTWebsocketAuthMiddleware
+    async def connect(self):
+        # Get the authenticated user from the scope, which is set by the JWTWebsocketAuthMiddleware.
+        # It is usually a LazyUserProfile: only its pk and first_name are used on the event loop,
+        # anything else would load the profile there.
         self.user_profile = self.scope.get("user")
-        
-        if self.user_profile is None or isinstance(self.user_profile, AnonymousUser):
+
+        if self.user_profile is None or not self.user_profile.is_authenticated:
             # Log connection rejection due to unauthenticated user
             logger.warning("WebSocket connection rejected: Unauthenticated user")
-            self.close(code=4001)
+            await self.close(code=4001)
             return
-        
+
         # Log successful connection
-        logger.info(f"WebSocket connection accepted for user: {self.user_profile.email}")
-        self.accept()
+        logger.info(f"WebSocket connection accepted for user: {self.user_profile.pk}")
+        await self.accept()
 
         # Extract channel_id from the URL route parameters
         self.channel_id = self.scope["url_route"]["kwargs"]["channelId"]
-        
+
         # Create a unique group name for the conversation
         self.room_name = f"conversation_{self.channel_id}"
-        
+
+        # Resolve the conversation once for the lifetime of this socket
+        self.conversation_id = conversation_ids.get(self.channel_id)
+        if self.conversation_id is None:
+            self.conversation_id = await database_sync_to_async(resolve_conversation_id)(self.channel_id)
+
         # Log joining the conversation group
-        logger.info(f"User {self.user_profile.email} joining conversation: {self.room_name}")
-        
-        # Add the channel to the group
-        async_to_sync(self.channel_layer.group_add)(
-            self.room_name,
-            self.channel_name
-        )
-
-    def receive_json(self, content, **kwargs):
+        logger.info(f"User {self.user_profile.pk} joining conversation: {self.room_name}")
+
+        # Add the channel to the group; from now on this process receives the room's broadcasts
+        await self.channel_layer.group_add(self.room_name, self.channel_name)
+        recent_messages.join(self.channel_id, self.channel_name)
+        self.joined = True
+
+        # A reconnecting client only needs the gap; anyone else gets the recent history
+        resume_after = self.get_resume_after()
+        if resume_after is not None:
+            await self.send_replay(resume_after)
+        else:
+            await self.send_history()
+
+    async def receive_json(self, content, **kwargs):
+        if content.get("type") == "resume":
+            try:
+                await self.send_replay(int(content.get("after")))
+            except (TypeError, ValueError):
+                logger.warning(f"Invalid resume frame in conversation {self.room_name}: {content}")
+            return
+
         message = content.get("message")
-        
+
         if message:
             sender = self.user_profile # use the authenticated user profile
-            
-            # Ensure the conversation exists, create if it doesn't
-            conversation = Conversation.objects.get_or_create(channel_id=self.channel_id)[0]
-            
-            # Create a new message in the conversation
-            new_message = Message.objects.create(
-                conversation=conversation,
-                sender=sender,
-                content=message
-            )
-            
-            
+
+            # Persist the message (immediately, or write-behind in batched mode)
+            new_message = await get_message_writer().write(self.conversation_id, sender, message)
+
             # Log the received message
-            logger.info(f"Message received from {sender.email} in conversation {self.room_name}: {message}")
-            
-            # Broadcast the message to the group
-            async_to_sync(self.channel_layer.group_send)(
-                self.room_name,
-                {
-                    "type": "chat_message",
-                    "message": {
-                        "id": new_message.id,
-                        "sender": new_message.sender.first_name,
-                        "content": new_message.content,
-                        "timestamp": new_message.timestamp.isoformat(),
-                    },
-                }
+            logger.info(f"Message received from user {sender.pk} in conversation {self.room_name}: {message}")
+
+            frame = message_frame(
+                new_message.id, sender.first_name, new_message.content, new_message.timestamp, new_message.seq
+            )
+            recent_messages.record(self.channel_id, frame)
+
+            # Encode the frame once here; every member of the room forwards the same text
+            await self.channel_layer.group_send(
+                self.room_name, {"type": "chat_message", "text": await self.encode_json(frame)}
             )
         else:
             # Log the case where no message was provided
             logger.warning(f"Empty message received in conversation {self.room_name}")
 
-    def chat_message(self, event):
+    async def chat_message(self, event):
+        text = event.get("text")
+        if text is not None:
+            # One socket per process keeps the room history warm, decoding the frame once
+            if recent_messages.is_recorder(self.channel_id, self.channel_name):
+                recent_messages.record(self.channel_id, await self.decode_json(text))
+
+            # Pre-encoded frame: forward the raw text without decoding or re-encoding it
+            logger.debug(f"Forwarding message to client in conversation {self.room_name}")
+            await self.send(text_data=text)
+            return
+
+        # Events from workers that still broadcast the unencoded dict
         message = event.get("message")
         if message:
             # Log the outgoing message
             logger.info(f"Sending message to clients in conversation {self.room_name}: {message['content']}")
-            self.send_json(message)
+            await self.send_json(message)
 
-    def disconnect(self, code):
-        if self.user_profile:
-            logger.info(f"User {self.user_profile.email} disconnected from conversation {self.room_name} with code {code}")
+    async def disconnect(self, code):
+        if self.user_profile is not None and self.user_profile.is_authenticated:
+            logger.info(f"User {self.user_profile.pk} disconnected from conversation {self.room_name} with code {code}")
         else:
             logger.info(f"Anonymous user disconnected from conversation {self.room_name} with code {code}")
-        
-        
+
+        # Rejected connections never joined a group
+        if self.room_name is None:
+            return
+
         # Leave the conversation group
-        async_to_sync(self.channel_layer.group_discard)(
-            self.room_name, self.channel_name
-        )
+        await self.channel_layer.group_discard(self.room_name, self.channel_name)
+        if self.joined:
+            recent_messages.leave(self.channel_id, self.channel_name)
+
+    async def send_history(self):
+        """
+        Send the room's recent messages as a single "history" frame.
+
+        Served from the in-memory ring buffer when it is warm; otherwise the last messages
+        are loaded from the database once and used to prime the buffer for later joins.
+        """
+        frames = recent_messages.get(self.channel_id)
+        if frames is None:
+            rows = await database_sync_to_async(load_recent_frames)(self.conversation_id, recent_messages.size)
+            rows = self.add_pending_frames(rows, after_seq=0)[-recent_messages.size:]
+            frames = recent_messages.prime(self.channel_id, rows)
+
+        await self.send_json({"type": "history", "messages": frames})
+
+    async def send_replay(self, after_seq):
+        """
+        Send the messages with a sequence number above `after_seq` as a "replay" frame.
+
+        The gap is served from the ring buffer when it reaches back far enough, otherwise with
+        an indexed range query. A gap longer than `CHAT_REPLAY_LIMIT` is not replayed; the
+        client gets a fresh "history" frame instead and starts over from it.
+        """
+        limit = getattr(settings, "CHAT_REPLAY_LIMIT", 500)
+
+        frames = recent_messages.get_after(self.channel_id, after_seq)
+        if frames is None:
+            frames = await database_sync_to_async(load_frames_after)(self.conversation_id, after_seq, limit + 1)
+            frames = self.add_pending_frames(frames, after_seq)
+
+        if len(frames) > limit:
+            logger.info(f"Gap after seq {after_seq} in conversation {self.room_name} is too long to replay")
+            await self.send_history()
+            return
+
+        await self.send_json({"type": "replay", "after": after_seq, "messages": frames})
+
+    def add_pending_frames(self, frames, after_seq):
+        """
+        Append messages that the write-behind writer has broadcast but not stored yet.
+        """
+        last_seq = frames[-1]["seq"] if frames else after_seq
+        pending = [
+            message_frame(message.id, message.sender.first_name, message.content, message.timestamp, message.seq)
+            for message in get_message_writer().pending(self.conversation_id)
+            if message.seq > last_seq
+        ]
+        return frames + sorted(pending, key=lambda frame: frame["seq"])
+
+    def get_resume_after(self):
+        """
+        Return the `resume_after` sequence number from the connect URL, if any.
+        """
+        query = parse_qs(self.scope.get("query_string", b"").decode("utf-8"))
+        value = query.get("resume_after", [None])[0]
+        if value is None:
+            return None
+        try:
+            return int(value)
+        except ValueError:
+            logger.warning(f"Ignoring invalid resume_after={value!r} in conversation {self.room_name}")
+            return None
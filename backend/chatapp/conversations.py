@@ -0,0 +1,45 @@
+import logging
+from django.conf import settings
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from chat_core.lru import LRUCache
+from .history import recent_messages
+from .models import Conversation
+
+# Set up the logger
+logger = logging.getLogger(__name__)
+
+# Process-wide channel_id -> conversation id map shared by every socket in this process,
+# so reconnects and additional members of a room skip the get_or_create round trip.
+conversation_ids = LRUCache(maxsize=getattr(settings, "CHAT_CONVERSATION_CACHE_SIZE", 10000))
+
+
+def resolve_conversation_id(channel_id):
+    """
+    Return the id of the conversation for `channel_id`, creating the conversation if needed.
+
+    This is a blocking ORM call on a cache miss; async callers should check
+    `conversation_ids` first and wrap this in `database_sync_to_async` otherwise.
+
+    Args:
+        channel_id (str): The channel the conversation belongs to.
+
+    Returns:
+        int: The conversation id.
+    """
+    conversation_id = conversation_ids.get(channel_id)
+    if conversation_id is None:
+        conversation_id = Conversation.objects.get_or_create(channel_id=channel_id)[0].id
+        conversation_ids.set(channel_id, conversation_id)
+        logger.debug(f"Resolved conversation {conversation_id} for channel {channel_id}")
+    return conversation_id
+
+
+@receiver(post_delete, sender=Conversation)
+def forget_deleted_conversation(sender, instance, **kwargs):
+    """
+    Drop a deleted conversation from the caches so the next message recreates it.
+    """
+    conversation_ids.pop(instance.channel_id)
+    recent_messages.forget(instance.channel_id)
@@ -0,0 +1,214 @@
+import bisect
+import logging
+from collections import deque
+from django.conf import settings
+
+from chat_core.lru import LRUCache
+from .models import Message
+
+# Set up the logger
+logger = logging.getLogger(__name__)
+
+
+FRAME_FIELDS = ("id", "sender__first_name", "content", "timestamp", "seq")
+
+
+def message_frame(message_id, sender_name, content, timestamp, seq):
+    """
+    Build the outbound WebSocket frame for a message, as sent on every broadcast.
+    """
+    return {
+        "id": message_id,
+        "sender": sender_name,
+        "content": content,
+        "timestamp": timestamp.isoformat(),
+        "seq": seq,
+    }
+
+
+def load_recent_frames(conversation_id, limit):
+    """
+    Load the last `limit` messages of a conversation from the database, oldest first.
+
+    This is the cold path used when a room has no warm buffer in this process.
+    It is a blocking ORM call; async callers wrap it in `database_sync_to_async`.
+    """
+    rows = (
+        Message.objects.filter(conversation_id=conversation_id)
+        .order_by("-seq")
+        .values_list(*FRAME_FIELDS)[:limit]
+    )
+    return [message_frame(*row) for row in reversed(rows)]
+
+
+def load_frames_after(conversation_id, after_seq, limit):
+    """
+    Load up to `limit` messages with a sequence number above `after_seq`, oldest first.
+
+    Served by the (conversation, seq) unique index as a range scan. Blocking ORM call.
+    """
+    rows = (
+        Message.objects.filter(conversation_id=conversation_id, seq__gt=after_seq)
+        .order_by("seq")
+        .values_list(*FRAME_FIELDS)[:limit]
+    )
+    return [message_frame(*row) for row in rows]
+
+
+class RoomHistory:
+    """
+    Ring buffer of the most recent frames broadcast in one room, kept in `seq` order.
+
+    A buffer starts cold. Broadcasts are recorded straight away, so nothing sent while the
+    database backfill is in flight is lost, and `prime()` later merges the backfilled
+    frames with them. Only a primed buffer can answer a join on its own.
+
+    Frames may arrive out of order (ids from different workers, or rows committed out of
+    order), so a late one is inserted at its `seq` position rather than appended, and a frame
+    already buffered (same id) is ignored. The ids of the buffered frames are kept in a set,
+    so recording a frame costs O(1) in the usual in-order case.
+    """
+
+    def __init__(self, size):
+        self.frames = deque(maxlen=size)
+        self.ids = set()
+        self.primed = False
+
+    def record(self, frame):
+        # The sender and the room's recorder both report a local broadcast; keep the first copy
+        if frame["id"] in self.ids:
+            return
+
+        if not self.frames or frame["seq"] > self.frames[-1]["seq"]:
+            position = len(self.frames)
+        else:
+            position = bisect.bisect_right(self.frames, frame["seq"], key=lambda existing: existing["seq"])
+        if len(self.frames) == self.frames.maxlen:
+            if position == 0:
+                # Older than everything kept in a full buffer
+                return
+            self.ids.discard(self.frames.popleft()["id"])
+            position -= 1
+        self.frames.insert(position, frame)
+        self.ids.add(frame["id"])
+
+    def prime(self, frames):
+        if self.primed:
+            return
+        loaded = {frame["id"] for frame in frames}
+        merged = list(frames) + [frame for frame in self.frames if frame["id"] not in loaded]
+        self.frames.clear()
+        self.frames.extend(sorted(merged, key=lambda frame: frame["seq"]))
+        self.ids = {frame["id"] for frame in self.frames}
+        self.primed = True
+
+    def snapshot(self):
+        return list(self.frames)
+
+    def frames_after(self, after_seq):
+        """
+        Return the buffered frames after `after_seq`, or None if the buffer does not reach
+        back far enough to prove nothing in between is missing.
+        """
+        if not self.primed or not self.frames or self.frames[0]["seq"] > after_seq:
+            return None
+        return [frame for frame in self.frames if frame["seq"] > after_seq]
+
+
+class RecentMessages:
+    """
+    Process-wide map of channel_id -> `RoomHistory`.
+
+    The number of rooms is bounded by an LRU so idle rooms fall out of memory, and each
+    room keeps at most `size` frames.
+
+    A room's buffer is only kept up to date while this process has a socket in the room:
+    that is what subscribes it to the room's broadcasts. Consumers therefore report `join()`
+    and `leave()`, and the buffer is dropped when the last local socket leaves, so a later
+    join reloads the history instead of serving a buffer with a silent gap.
+
+    Every local socket receives each broadcast, but only one of them, the room's recorder
+    (the longest-joined local socket, see `is_recorder`), records it, so a broadcast is
+    decoded and recorded once per process rather than once per socket.
+
+    Attributes:
+        size (int): Number of recent frames kept per room.
+    """
+
+    def __init__(self, size=50, max_rooms=1000):
+        self.size = size
+        self._rooms = LRUCache(maxsize=max_rooms)
+        # channel_id -> {channel name: None} of the local sockets, in join order
+        self._members = {}
+
+    def room(self, channel_id):
+        room = self._rooms.get(channel_id)
+        if room is None:
+            room = RoomHistory(self.size)
+            self._rooms.set(channel_id, room)
+        return room
+
+    def record(self, channel_id, frame):
+        """
+        Add a broadcast frame to the room's buffer.
+        """
+        self.room(channel_id).record(frame)
+
+    def get(self, channel_id):
+        """
+        Return the buffered frames for a room, or None if the buffer is still cold.
+        """
+        room = self._rooms.get(channel_id)
+        if room is None or not room.primed:
+            return None
+        return room.snapshot()
+
+    def get_after(self, channel_id, after_seq):
+        """
+        Return the buffered frames after `after_seq`, or None if the buffer cannot cover the gap.
+        """
+        room = self._rooms.get(channel_id)
+        if room is None:
+            return None
+        return room.frames_after(after_seq)
+
+    def prime(self, channel_id, frames):
+        """
+        Fill a cold room from the database and return its frames.
+        """
+        room = self.room(channel_id)
+        room.prime(frames)
+        return room.snapshot()
+
+    def join(self, channel_id, channel_name):
+        """
+        Register a local socket that now receives the room's broadcasts.
+        """
+        self._members.setdefault(channel_id, {})[channel_name] = None
+
+    def leave(self, channel_id, channel_name):
+        """
+        Unregister a local socket; once none is left the room's buffer is forgotten.
+
+        If it was the room's recorder, the next local socket in join order takes over.
+        """
+        members = self._members.get(channel_id, {})
+        members.pop(channel_name, None)
+        if not members:
+            self._members.pop(channel_id, None)
+            self.forget(channel_id)
+
+    def is_recorder(self, channel_id, channel_name):
+        """
+        Return True if this socket records the room's broadcasts for the whole process.
+        """
+        return next(iter(self._members.get(channel_id, ())), None) == channel_name
+
+    def forget(self, channel_id):
+        self._rooms.pop(channel_id)
+
+
+recent_messages = RecentMessages(
+    size=getattr(settings, "CHAT_HISTORY_SIZE", 50),
+    max_rooms=getattr(settings, "CHAT_HISTORY_MAX_ROOMS", 1000),
+)
@@ -0,0 +1,31 @@
+import logging
+from .message_writer import get_message_writer
+
+# Set up the logger
+logger = logging.getLogger(__name__)
+
+
+class ChatLifespanApp:
+    """
+    Minimal ASGI lifespan handler.
+
+    On server shutdown it flushes the chat messages that the write-behind writer still
+    holds in memory, so a graceful restart never drops messages that were already
+    broadcast to clients.
+    """
+
+    async def __call__(self, scope, receive, send):
+        while True:
+            message = await receive()
+
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+
+            elif message["type"] == "lifespan.shutdown":
+                try:
+                    await get_message_writer().close()
+                    logger.info("Flushed pending chat messages on shutdown")
+                except Exception as e:
+                    logger.exception(f"Failed to flush pending chat messages on shutdown: {e}")
+                await send({"type": "lifespan.shutdown.complete"})
+                return
@@ -1,13 +1,33 @@
 from django.core.management.base import BaseCommand
-from backend.account.rabbitmq_consumer import start_consumer
+from account.rabbitmq_consumer import start_consumer
 
 # TODO lEARN HOW TO RECONFIGURE IN PRODUCTION TO AN INDEPENDENT DYNO ON HEROKU
 
 class Command(BaseCommand):
     help = 'Start the RabbitMQ consumer'
 
-    def handle(self, *args, **kwargs):
-        start_consumer()  # Call the function to start the consumer
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            help="Events upserted per batch; 1 processes them one by one (default: USER_EVENTS_BATCH_SIZE).",
+        )
+        parser.add_argument(
+            "--batch-wait-ms",
+            type=int,
+            help="Milliseconds an event may wait for its batch to fill up (default: USER_EVENTS_BATCH_WAIT_MS).",
+        )
+        parser.add_argument(
+            "--prefetch",
+            type=int,
+            help="Unacknowledged deliveries RabbitMQ sends ahead (default: USER_EVENTS_PREFETCH).",
+        )
 
+    def handle(self, *args, **options):
+        # Call the function to start the consumer
+        start_consumer(
+            batch_size=options["batch_size"], batch_wait_ms=options["batch_wait_ms"], prefetch=options["prefetch"]
+        )
 
-# to run - python manage.py start_consumer_command
+
+# to run - python manage.py start_consumer_command [--batch-size 100 --batch-wait-ms 250 --prefetch 200]
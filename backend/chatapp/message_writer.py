@@ -0,0 +1,321 @@
+import asyncio
+import atexit
+import logging
+import threading
+import time
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Conversation, Message
+from .sequences import SequenceBlocks, reserve_sequence_block
+
+# Set up the logger
+logger = logging.getLogger(__name__)
+
+PERSISTENCE_SYNC = "sync"
+PERSISTENCE_BATCHED = "batched"
+
+
+class MessageIdGenerator:
+    """
+    Time-ordered id generator for messages that are broadcast before they are inserted.
+
+    Ids are built from the milliseconds elapsed since 2024-01-01, a worker id and a per
+    millisecond sequence. They keep growing with time, are always larger than the
+    auto-increment ids already in the table, and stay below 2**53 so the frontend can
+    hold them in a JavaScript number without losing precision.
+
+    Layout (53 bits): 41 bits of milliseconds | 5 bits of worker id | 7 bits of sequence.
+
+    Every process that writes messages in batched mode needs its own worker id, set
+    explicitly with `CHAT_WORKER_ID`.
+
+    The table's own id sequence is advanced past these ids on every flush (see
+    `BatchedMessageWriter._advance_id_sequence`), so switching back to sync mode keeps ids,
+    and the keyset cursors and ETags built on them, increasing.
+    """
+    EPOCH_MS = 1704067200000  # 2024-01-01T00:00:00Z
+    WORKER_BITS = 5
+    SEQUENCE_BITS = 7
+    MAX_WORKER_ID = (1 << WORKER_BITS) - 1
+    MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+
+    def __init__(self, worker_id):
+        if not 0 <= worker_id <= self.MAX_WORKER_ID:
+            raise ValueError(f"worker_id must be between 0 and {self.MAX_WORKER_ID}")
+        self.worker_id = worker_id
+        self._last_ms = -1
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+    def next_id(self):
+        with self._lock:
+            now_ms = int(time.time() * 1000) - self.EPOCH_MS
+            # Never go backwards, even if the wall clock does
+            now_ms = max(now_ms, self._last_ms)
+
+            if now_ms == self._last_ms:
+                self._sequence = (self._sequence + 1) & self.MAX_SEQUENCE
+                if self._sequence == 0:
+                    # Sequence exhausted for this millisecond, borrow the next one
+                    now_ms += 1
+            else:
+                self._sequence = 0
+
+            self._last_ms = now_ms
+            return (now_ms << (self.WORKER_BITS + self.SEQUENCE_BITS)) | (self.worker_id << self.SEQUENCE_BITS) | self._sequence
+
+
+class SyncMessageWriter:
+    """
+    Inserts every message as soon as it is received (one INSERT per message).
+
+    The sequence number is reserved in the same transaction as the insert, so numbers
+    are gap-free and follow commit order even with several processes in one room.
+    """
+
+    async def write(self, conversation_id, sender, content):
+        """
+        Persist a message and return the saved instance.
+        """
+        return await database_sync_to_async(self._create)(conversation_id, sender, content)
+
+    def _create(self, conversation_id, sender, content):
+        with transaction.atomic():
+            return Message.objects.create(
+                conversation_id=conversation_id,
+                sender_id=sender.pk,
+                content=content,
+                seq=reserve_sequence_block(conversation_id),
+            )
+
+    def pending(self, conversation_id):
+        """Nothing is ever pending in synchronous mode."""
+        return []
+
+    async def flush(self):
+        """Nothing is ever pending in synchronous mode."""
+
+    async def close(self):
+        """Nothing is ever pending in synchronous mode."""
+
+    def flush_sync(self):
+        """Nothing is ever pending in synchronous mode."""
+
+
+class BatchedMessageWriter:
+    """
+    Write-behind persistence for chat messages.
+
+    `write()` gives the message its id, sequence number and timestamp straight away and
+    returns it so the consumer can broadcast without waiting on the database. By default the
+    sequence number is the message id: ids are time-ordered across processes (see
+    `MessageIdGenerator`), so seq follows send order across processes without a database
+    round trip per message, and `Conversation.last_seq` is advanced past them when the batch
+    is flushed. With `seq_block_size` set, numbers come from blocks reserved per conversation
+    instead (see `SequenceBlocks`).
+
+    Pending messages are flushed with a single `bulk_create` once `batch_size` of them have
+    queued up, or `flush_interval` seconds after the first one was queued, whichever comes first.
+
+    Background flushes run as tasks that the writer keeps until they finish, so none is
+    garbage-collected mid-flight and their failures are logged. Messages still pending when
+    the process stops are written by `close()` from the ASGI lifespan shutdown event, which
+    also waits for the running flushes, or by `flush_sync()` which is registered with `atexit`.
+
+    Attributes:
+        batch_size (int): Number of pending messages that triggers an immediate flush.
+        flush_interval (float): Maximum number of seconds a message stays pending.
+    """
+
+    def __init__(self, batch_size=100, flush_interval=0.5, worker_id=0, seq_block_size=0):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.id_generator = MessageIdGenerator(worker_id)
+        self.sequences = SequenceBlocks(block_size=seq_block_size) if seq_block_size else None
+        self._pending = []
+        self._timer = None
+        self._tasks = set()
+        # Guards the pending list against the atexit flush running on another thread
+        self._lock = threading.Lock()
+
+    async def write(self, conversation_id, sender, content):
+        """
+        Queue a message for insertion and return it with its id, seq and timestamp already set.
+        """
+        message_id = self.id_generator.next_id()
+        seq = message_id if self.sequences is None else await self.sequences.next_seq(conversation_id)
+        message = Message(
+            id=message_id,
+            conversation_id=conversation_id,
+            sender_id=sender.pk,
+            content=content,
+            timestamp=timezone.now(),
+            seq=seq,
+        )
+        # Keep the sender for pending frames without assigning it through the foreign key, which
+        # would load a LazyUserProfile on the event loop
+        Message.sender.field.set_cached_value(message, sender)
+
+        with self._lock:
+            self._pending.append(message)
+            pending = len(self._pending)
+
+        if pending >= self.batch_size:
+            # Flush in the background so the sender's broadcast is not held up by the INSERT
+            self._flush_in_background()
+        elif self._timer is None:
+            loop = asyncio.get_running_loop()
+            self._timer = loop.call_later(self.flush_interval, self._flush_in_background)
+
+        return message
+
+    def pending(self, conversation_id):
+        """
+        Return the messages of a conversation that were broadcast but are not stored yet.
+
+        Database reads that must see every message (history backfill, resume) add these in.
+        """
+        with self._lock:
+            return [message for message in self._pending if message.conversation_id == conversation_id]
+
+    async def flush(self):
+        """
+        Write every pending message to the database.
+        """
+        batch = self._take_pending()
+        if batch:
+            await database_sync_to_async(self._insert)(batch)
+
+    async def close(self):
+        """
+        Write every pending message and wait for the background flushes still running.
+        """
+        await self.flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def _flush_in_background(self):
+        # Take the batch now: writes no longer yield to the loop, so a burst would otherwise
+        # queue a flush per message before the first one ran
+        batch = self._take_pending()
+        if not batch:
+            return
+        task = asyncio.get_running_loop().create_task(database_sync_to_async(self._insert)(batch))
+        # The loop only keeps weak references to tasks; hold on to it until it is done
+        self._tasks.add(task)
+        task.add_done_callback(self._flush_done)
+
+    def _flush_done(self, task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Background flush of chat messages failed: {task.exception()!r}")
+
+    def flush_sync(self):
+        """
+        Write every pending message from a context without an event loop (e.g. at exit).
+        """
+        batch = self._take_pending()
+        if batch:
+            self._insert(batch)
+
+    def _take_pending(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        with self._lock:
+            batch, self._pending = self._pending, []
+        return batch
+
+    def _insert(self, batch):
+        try:
+            with transaction.atomic():
+                Message.objects.bulk_create(batch, batch_size=self.batch_size)
+            logger.debug(f"Flushed {len(batch)} messages")
+        except Exception as e:
+            # One bad row (e.g. its sender was deleted meanwhile) must not lose the whole batch
+            logger.error(f"Batched insert of {len(batch)} messages failed, retrying one by one: {e}")
+            for message in batch:
+                try:
+                    # Each row in its own savepoint, so a failure cannot break an outer transaction
+                    with transaction.atomic():
+                        message.save(force_insert=True)
+                except Exception:
+                    logger.exception(f"Dropping message {message.id} that could not be stored")
+
+        self._advance_id_sequence(batch)
+        if self.sequences is None:
+            self._advance_last_seq(batch)
+
+    @staticmethod
+    def _advance_id_sequence(batch):
+        # Explicit ids do not move a PostgreSQL sequence (SQLite and MySQL follow the largest id
+        # on their own); keep it above them, so messages inserted in sync mode later still get
+        # larger ids. nextval() first, so the sequence never goes back
+        if connection.vendor != "postgresql":
+            return
+        table = Message._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT setval(pg_get_serial_sequence(%s, 'id'), "
+                "GREATEST(nextval(pg_get_serial_sequence(%s, 'id')), %s))",
+                [table, table, max(message.id for message in batch)],
+            )
+
+    @staticmethod
+    def _advance_last_seq(batch):
+        # Keeps sequence numbers reserved later (sync mode, sequence blocks) above the id-derived ones
+        last_seqs = {}
+        for message in batch:
+            last_seqs[message.conversation_id] = max(message.seq, last_seqs.get(message.conversation_id, 0))
+        for conversation_id, seq in last_seqs.items():
+            Conversation.objects.filter(pk=conversation_id, last_seq__lt=seq).update(last_seq=seq)
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_message_writer():
+    """
+    Return the process-wide message writer selected by `CHAT_MESSAGE_PERSISTENCE`.
+
+    "sync" (default) inserts each message before it is broadcast; "batched" enables the
+    write-behind `BatchedMessageWriter`.
+    """
+    global _writer
+
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                mode = getattr(settings, "CHAT_MESSAGE_PERSISTENCE", PERSISTENCE_SYNC)
+                if mode == PERSISTENCE_BATCHED:
+                    worker_id = getattr(settings, "CHAT_WORKER_ID", None)
+                    if worker_id is None:
+                        # A derived id (e.g. from the pid) can collide between processes, and
+                        # colliding ids make their messages overwrite or drop each other
+                        raise ImproperlyConfigured(
+                            "Batched chat persistence needs CHAT_WORKER_ID, unique per process "
+                            f"(0-{MessageIdGenerator.MAX_WORKER_ID})"
+                        )
+                    writer = BatchedMessageWriter(
+                        batch_size=getattr(settings, "CHAT_MESSAGE_BATCH_SIZE", 100),
+                        flush_interval=getattr(settings, "CHAT_MESSAGE_FLUSH_INTERVAL", 0.5),
+                        worker_id=worker_id,
+                        seq_block_size=getattr(settings, "CHAT_SEQ_BLOCK_SIZE", 0),
+                    )
+                    atexit.register(writer.flush_sync)
+                elif mode == PERSISTENCE_SYNC:
+                    writer = SyncMessageWriter()
+                else:
+                    raise ValueError(f"Unknown CHAT_MESSAGE_PERSISTENCE mode: {mode!r}")
+
+                logger.info(f"Chat messages are persisted in {mode} mode")
+                _writer = writer
+
+    return _writer
@@ -5,7 +5,8 @@ from channels.middleware import BaseMiddleware
 from channels.db import database_sync_to_async
 from django.contrib.auth.models import AnonymousUser
 from account.models import UserProfile
-from decouple import config
+from account.profile_cache import get_profile
+from auth_backend.tokens import verify_access_token
 
 # Set up the logger
 logger = logging.getLogger(__name__)
@@ -28,16 +29,16 @@ def get_user_from_token(token):
     try:
         logger.debug(f"Decoding token: {token}")
 
-        # Decode the JWT using the access secret key
-        payload = jwt.decode(token, config("JWT_ACCESS_SECRET"), algorithms=["HS256"])
+        # Verify the JWT with the access secret key, or reuse the claims of an earlier verification
+        payload = verify_access_token(token)
         logger.info(f"Token decoded successfully: {payload}")
 
         # Extract the user ID from the token payload
         user_id = payload.get("user_id")
         logger.debug(f"Extracted user ID from token: {user_id}")
 
-        # Fetch the corresponding UserProfile from the database
-        user = UserProfile.objects.get(pk=user_id)
+        # Fetch the corresponding UserProfile, from the profile cache when possible
+        user = get_profile(user_id)
         logger.info(f"User profile found for user ID {user_id}: {user}")
 
         return user
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.6 on 2026-10-18 06:20
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chatapp", "0003_alter_message_sender"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="message",
+            name="timestamp",
+            field=models.DateTimeField(
+                default=django.utils.timezone.now,
+                help_text="Date and time marking when the message was dispatched.",
+                verbose_name="Timestamp",
+            ),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.0.6 on 2026-10-18 06:24
+
+from django.db import migrations, models
+
+
+def merge_duplicate_conversations(apps, schema_editor):
+    """
+    Fold conversations that share a channel_id into the oldest one before the
+    unique constraint is added, moving their messages along.
+    """
+    Conversation = apps.get_model("chatapp", "Conversation")
+    Message = apps.get_model("chatapp", "Message")
+
+    duplicated = (
+        Conversation.objects.values("channel_id")
+        .annotate(total=models.Count("id"))
+        .filter(total__gt=1)
+        .values_list("channel_id", flat=True)
+    )
+    for channel_id in list(duplicated):
+        ids = list(
+            Conversation.objects.filter(channel_id=channel_id)
+            .order_by("id")
+            .values_list("id", flat=True)
+        )
+        keep, extra = ids[0], ids[1:]
+        Message.objects.filter(conversation_id__in=extra).update(conversation_id=keep)
+        Conversation.objects.filter(id__in=extra).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chatapp", "0004_message_timestamp_default"),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_conversations, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="conversation",
+            name="channel_id",
+            field=models.CharField(
+                help_text="Distinct identifier for each conversation.",
+                max_length=255,
+                unique=True,
+                verbose_name="Channel ID",
+            ),
+        ),
+    ]
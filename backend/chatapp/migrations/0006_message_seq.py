@@ -0,0 +1,59 @@
+# Generated by Django 5.0.6 on 2026-10-18 06:31
+
+from django.db import migrations, models
+
+
+def number_existing_messages(apps, schema_editor):
+    """
+    Give existing messages their per-conversation sequence number in id order and
+    set each conversation's counter to the last number used.
+    """
+    Conversation = apps.get_model("chatapp", "Conversation")
+    Message = apps.get_model("chatapp", "Message")
+
+    for conversation in Conversation.objects.all().iterator():
+        messages = list(Message.objects.filter(conversation=conversation).order_by("id").only("id"))
+        for seq, message in enumerate(messages, start=1):
+            message.seq = seq
+        Message.objects.bulk_update(messages, ["seq"], batch_size=500)
+        conversation.last_seq = len(messages)
+        conversation.save(update_fields=["last_seq"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chatapp", "0005_conversation_channel_id_unique"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="conversation",
+            name="last_seq",
+            field=models.PositiveBigIntegerField(
+                default=0,
+                help_text="The highest message sequence number handed out in this conversation.",
+                verbose_name="Last Sequence Number",
+            ),
+        ),
+        migrations.AddField(
+            model_name="message",
+            name="seq",
+            field=models.PositiveBigIntegerField(null=True),
+        ),
+        migrations.RunPython(number_existing_messages, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="message",
+            name="seq",
+            field=models.PositiveBigIntegerField(
+                help_text="Position of the message in its conversation, increasing with every message.",
+                verbose_name="Sequence Number",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="message",
+            constraint=models.UniqueConstraint(
+                fields=("conversation", "seq"), name="unique_message_seq_per_conversation"
+            ),
+        ),
+    ]
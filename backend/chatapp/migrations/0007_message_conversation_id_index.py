@@ -0,0 +1,19 @@
+# Generated by Django 5.0.6 on 2026-10-18 06:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chatapp", "0006_message_seq"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="message",
+            index=models.Index(
+                fields=["conversation", "id"], name="message_conversation_id_idx"
+            ),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from account.models import UserProfile
 
 class Conversation(models.Model):
@@ -8,10 +9,12 @@ class Conversation(models.Model):
     Attributes:
         channel_id (str): Distinct identifier for each conversation.
         created_at (datetime): Date and time marking the start of the conversation.
+        last_seq (int): The highest message sequence number handed out in this conversation.
     """
 
     channel_id = models.CharField(
         max_length=255,
+        unique=True,
         verbose_name="Channel ID",
         help_text="Distinct identifier for each conversation."
     )
@@ -20,6 +23,11 @@ class Conversation(models.Model):
         verbose_name="Created At",
         help_text="Date and time marking the start of the conversation."
     )
+    last_seq = models.PositiveBigIntegerField(
+        default=0,
+        verbose_name="Last Sequence Number",
+        help_text="The highest message sequence number handed out in this conversation."
+    )
 
     def __str__(self):
         return f"Conversation {self.channel_id}"
@@ -34,6 +42,7 @@ class Message(models.Model):
         sender (User): The user responsible for this message.
         content (str): The actual text of the message.
         timestamp (datetime): Date and time marking when the message was dispatched.
+        seq (int): Position of the message in its conversation, increasing with every message.
     """
 
     conversation = models.ForeignKey(
@@ -54,11 +63,27 @@ class Message(models.Model):
         verbose_name="Content",
         help_text="The actual text of the message."
     )
+    # Defaulted rather than auto_now_add so the write-behind path can stamp a message when it
+    # is broadcast and keep that value when the row is flushed later with bulk_create.
     timestamp = models.DateTimeField(
-        auto_now_add=True,
+        default=timezone.now,
         verbose_name="Timestamp",
         help_text="Date and time marking when the message was dispatched."
     )
+    seq = models.PositiveBigIntegerField(
+        verbose_name="Sequence Number",
+        help_text="Position of the message in its conversation, increasing with every message."
+    )
+
+    class Meta:
+        constraints = [
+            # Also serves the "everything after seq N" range scans used to resume a socket
+            models.UniqueConstraint(fields=["conversation", "seq"], name="unique_message_seq_per_conversation"),
+        ]
+        indexes = [
+            # Keyset pagination of a conversation's history by id (before/after cursors)
+            models.Index(fields=["conversation", "id"], name="message_conversation_id_idx"),
+        ]
 
     def __str__(self):
         return f"Message from {self.sender} in conversation {self.conversation.channel_id} at {self.timestamp}"
\ No newline at end of file
@@ -0,0 +1,96 @@
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class MessageKeysetPagination(BasePagination):
+    """
+    Keyset (cursor) pagination over message ids for a single conversation.
+
+    Pages are selected with `WHERE id < before` / `WHERE id > after` plus `LIMIT`, which the
+    (conversation, id) index answers with a short range scan, so fetching any page costs the
+    same no matter how long the channel's history is. Unlike OFFSET pagination, no rows are
+    skipped over and pages do not shift when new messages arrive.
+
+    Query parameters:
+        - `before` (int, optional): Return the newest messages with an id lower than this.
+        - `after` (int, optional): Return the oldest messages with an id higher than this.
+        - `limit` (int, optional): Page size, default `default_limit`, capped at `max_limit`.
+
+    Without a cursor the newest page is returned. Every page is ordered oldest first, and the
+    cursors for the neighbouring pages are sent in a `Link` header (rel="prev" for older
+    messages, rel="next" for newer ones) so the response body stays a plain list.
+    """
+    default_limit = 50
+    max_limit = 200
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        before = self._get_int("before")
+        after = self._get_int("after")
+        limit = self._get_limit()
+
+        if before is not None and after is not None:
+            raise ValidationError({"detail": "Use either before or after, not both."})
+
+        # Fetch one extra row to find out whether another page exists in that direction; the
+        # other direction is whatever lies on the far side of the cursor, one indexed EXISTS
+        if after is not None:
+            rows = list(queryset.filter(id__gt=after).order_by("id")[: limit + 1])
+            has_more = len(rows) > limit
+            rows = rows[:limit]
+            self.has_older, self.has_newer = queryset.filter(id__lte=after).exists(), has_more
+        elif before is not None:
+            rows = list(queryset.filter(id__lt=before).order_by("-id")[: limit + 1])
+            has_more = len(rows) > limit
+            rows = rows[:limit][::-1]
+            self.has_older, self.has_newer = has_more, queryset.filter(id__gte=before).exists()
+        else:
+            rows = list(queryset.order_by("-id")[: limit + 1])
+            has_more = len(rows) > limit
+            rows = rows[:limit][::-1]
+            self.has_older, self.has_newer = has_more, False
+
+        self.first_id = self._row_id(rows[0]) if rows else None
+        self.last_id = self._row_id(rows[-1]) if rows else None
+        return rows
+
+    def get_paginated_response(self, data):
+        response = Response(data)
+        links = []
+        if self.has_older and self.first_id is not None:
+            links.append(f'<{self._page_url("before", self.first_id)}>; rel="prev"')
+        if self.has_newer and self.last_id is not None:
+            links.append(f'<{self._page_url("after", self.last_id)}>; rel="next"')
+        if links:
+            response["Link"] = ", ".join(links)
+        return response
+
+    @staticmethod
+    def _row_id(row):
+        # Works for model instances and for rows from a values() projection
+        return row["id"] if isinstance(row, dict) else row.id
+
+    def _page_url(self, cursor, value):
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, "before")
+        url = remove_query_param(url, "after")
+        return replace_query_param(url, cursor, value)
+
+    def _get_int(self, name):
+        value = self.request.query_params.get(name)
+        if value in (None, ""):
+            return None
+        try:
+            return int(value)
+        except ValueError:
+            raise ValidationError({"detail": f"{name} must be an integer."})
+
+    def _get_limit(self):
+        limit = self._get_int("limit")
+        if limit is None:
+            return self.default_limit
+        if limit < 1:
+            raise ValidationError({"detail": "limit must be a positive integer."})
+        return min(limit, self.max_limit)
@@ -11,6 +11,29 @@ list_message_docs = extend_schema(
             location=OpenApiParameter.QUERY,
             description="ID of the channel",
             required=True,
-        )
+        ),
+        OpenApiParameter(
+            name="before",
+            type=OpenApiTypes.INT,
+            location=OpenApiParameter.QUERY,
+            description="Return the newest messages with an id lower than this one (older page).",
+        ),
+        OpenApiParameter(
+            name="after",
+            type=OpenApiTypes.INT,
+            location=OpenApiParameter.QUERY,
+            description="Return the oldest messages with an id higher than this one (newer page). Cannot be combined with before.",
+        ),
+        OpenApiParameter(
+            name="limit",
+            type=OpenApiTypes.INT,
+            location=OpenApiParameter.QUERY,
+            description="Number of messages per page (default 50, maximum 200).",
+        ),
     ],
+    description=(
+        "Messages are returned oldest first. Without a cursor the newest page is returned. "
+        'Cursors for neighbouring pages are sent in the Link header: rel="prev" for older messages, '
+        'rel="next" for newer ones.'
+    ),
 )
\ No newline at end of file
@@ -0,0 +1,100 @@
+import asyncio
+import logging
+from channels.db import database_sync_to_async
+from django.db import connection, transaction
+
+from chat_core.lru import LRUCache
+from .models import Conversation
+
+# Set up the logger
+logger = logging.getLogger(__name__)
+
+# Backends that support `UPDATE ... RETURNING` (SQLite from 3.35); the others lock and re-read
+UPDATE_RETURNING_VENDORS = {"postgresql", "sqlite"}
+
+
+def reserve_sequence_block(conversation_id, size=1):
+    """
+    Atomically reserve `size` consecutive sequence numbers for a conversation.
+
+    The counter lives in `Conversation.last_seq` and is advanced with a single
+    `UPDATE ... RETURNING`, one round trip that takes the row lock, so two processes can
+    never be handed overlapping numbers. Call it inside the transaction that inserts the
+    message to keep a reservation of one gap-free.
+
+    Args:
+        conversation_id (int): The conversation to reserve numbers for.
+        size (int): How many numbers to reserve.
+
+    Returns:
+        int: The first reserved sequence number.
+
+    Raises:
+        Conversation.DoesNotExist: If there is no such conversation.
+    """
+    if connection.vendor not in UPDATE_RETURNING_VENDORS:
+        with transaction.atomic():
+            conversation = Conversation.objects.select_for_update().only("last_seq").get(pk=conversation_id)
+            last_seq = conversation.last_seq + size
+            Conversation.objects.filter(pk=conversation_id).update(last_seq=last_seq)
+        return last_seq - size + 1
+
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {quote(Conversation._meta.db_table)} SET {quote('last_seq')} = {quote('last_seq')} + %s "
+            f"WHERE {quote('id')} = %s RETURNING {quote('last_seq')}",
+            [size, conversation_id],
+        )
+        row = cursor.fetchone()
+    if row is None:
+        raise Conversation.DoesNotExist(f"No conversation with id {conversation_id}")
+    return row[0] - size + 1
+
+
+class SequenceBlock:
+    """
+    The numbers a process still holds for one conversation, and the lock taken to refill them.
+    """
+
+    def __init__(self):
+        self.next = 1
+        self.last = 0
+        self.lock = asyncio.Lock()
+
+
+class SequenceBlocks:
+    """
+    Hands out per-conversation sequence numbers from blocks reserved in the database.
+
+    Used by the write-behind writer when `CHAT_SEQ_BLOCK_SIZE` is set. Numbers are unique and
+    increase within a process. Each conversation has its own lock, kept in the LRU next to its
+    block, so only the sends of a room whose block ran out wait for the database; the other
+    rooms keep broadcasting. With a block of one, every message reserves its own number and
+    seq follows send order across processes; larger blocks save the round trip per message,
+    but blocks held by different processes interleave, so only use them when a single process
+    writes to each room.
+
+    Attributes:
+        block_size (int): How many numbers are reserved per database round trip.
+    """
+
+    def __init__(self, block_size=1, max_conversations=10000):
+        self.block_size = block_size
+        self._blocks = LRUCache(maxsize=max_conversations)
+
+    async def next_seq(self, conversation_id):
+        block = self._blocks.get(conversation_id)
+        if block is None:
+            block = SequenceBlock()
+            self._blocks.set(conversation_id, block)
+
+        async with block.lock:
+            if block.next > block.last:
+                start = await database_sync_to_async(reserve_sequence_block)(conversation_id, self.block_size)
+                block.next, block.last = start, start + self.block_size - 1
+                logger.debug(f"Reserved seq {block.next}-{block.last} for conversation {conversation_id}")
+
+            seq = block.next
+            block.next += 1
+            return seq
@@ -1,3 +1,511 @@
-from django.test import TestCase
+import asyncio
+import json
+import time
+from unittest.mock import patch
 
-# Create your tests here.
+import jwt
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from account.lazy_profile import LazyUserProfile, lazy_profile_stats
+from account.models import UserProfile
+from account.profile_cache import PROFILE_GENERATION_KEY, profile_cache
+from account.rabbitmq_consumer import create_chat_profile
+from auth_backend.tokens import verified_tokens
+from chat_core.urls import websocket_urlpatterns
+from .auth_middleware import get_user_from_token
+from .conversations import conversation_ids
+from .history import message_frame, recent_messages
+from . import message_writer
+from .message_writer import BatchedMessageWriter, SyncMessageWriter, get_message_writer
+from .models import Conversation, Message
+from .sequences import SequenceBlocks, reserve_sequence_block
+from .serializers import MessageSerializer
+
+
+class MessageHistoryQueryCountTests(TestCase):
+    """
+    The message history endpoint must cost a fixed number of queries per page,
+    however many messages and distinct senders the page contains.
+    """
+
+    def setUp(self):
+        self.client = APIClient(SERVER_NAME="localhost")
+        self.conversation = Conversation.objects.create(channel_id="history")
+        self.senders = [
+            UserProfile.objects.create(email=f"user{i}@example.com", first_name=f"User{i}", last_name="Test")
+            for i in range(10)
+        ]
+
+    def add_messages(self, count):
+        start = self.conversation.messages.count()
+        Message.objects.bulk_create(
+            Message(
+                conversation=self.conversation,
+                sender=self.senders[(start + i) % len(self.senders)],
+                content=f"message {start + i}",
+                seq=start + i + 1,
+            )
+            for i in range(count)
+        )
+
+    def get_history(self, **params):
+        headers = {key: params.pop(key) for key in list(params) if key.startswith("HTTP_")}
+        return self.client.get("/api/messages/", {"channel_id": "history", **params}, **headers)
+
+    def test_query_count_does_not_grow_with_page_size(self):
+        self.add_messages(1)
+        # One query for the ETag, one for the conversation, one for the page
+        with self.assertNumQueries(3):
+            response = self.get_history()
+        self.assertEqual(len(response.json()), 1)
+
+        self.add_messages(99)
+        with self.assertNumQueries(3):
+            response = self.get_history(limit=100)
+        self.assertEqual(len(response.json()), 100)
+
+    def test_matches_message_serializer_output(self):
+        self.add_messages(3)
+        expected = MessageSerializer(self.conversation.messages.order_by("id"), many=True).data
+        self.assertEqual(self.get_history().json(), [dict(item) for item in expected])
+
+    def test_deleted_sender_is_serialized_as_null(self):
+        self.add_messages(2)
+        self.senders[0].delete()
+
+        response = self.get_history()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([message["sender"] for message in response.json()], [None, "User1"])
+
+    def test_unchanged_history_returns_not_modified(self):
+        self.add_messages(3)
+        etag = self.get_history()["ETag"]
+
+        # Only the latest-id lookup runs; nothing is loaded or serialized
+        with self.assertNumQueries(1):
+            response = self.get_history(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.add_messages(1)
+        response = self.get_history(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+
+class MessageKeysetPaginationTests(TestCase):
+    """
+    History pages are selected by id cursor, with Link headers only towards pages that exist.
+    """
+
+    def setUp(self):
+        self.client = APIClient(SERVER_NAME="localhost")
+        self.conversation = Conversation.objects.create(channel_id="keyset")
+        self.sender = UserProfile.objects.create(email="user@example.com", first_name="User", last_name="Test")
+        self.ids = [
+            Message.objects.create(conversation=self.conversation, sender=self.sender, content=f"message {i}", seq=i).id
+            for i in range(1, 6)
+        ]
+
+    def get_page(self, **params):
+        response = self.client.get("/api/messages/", {"channel_id": self.conversation.channel_id, **params})
+        self.assertEqual(response.status_code, 200)
+        links = {
+            rel: url for url, rel in (link.split("; ") for link in response.headers.get("Link", "").split(", ") if link)
+        }
+        return [message["id"] for message in response.json()], links
+
+    def assertLinks(self, links, prev=None, next=None):
+        expected = {}
+        if prev is not None:
+            expected['rel="prev"'] = f"before={prev}"
+        if next is not None:
+            expected['rel="next"'] = f"after={next}"
+        self.assertEqual(set(links), set(expected))
+        for rel, cursor in expected.items():
+            self.assertIn(cursor, links[rel])
+
+    def test_newest_page_without_a_cursor(self):
+        ids, links = self.get_page(limit=2)
+        self.assertEqual(ids, self.ids[3:])
+        self.assertLinks(links, prev=self.ids[3])
+
+    def test_before(self):
+        ids, links = self.get_page(before=self.ids[3], limit=2)
+        self.assertEqual(ids, self.ids[1:3])
+        self.assertLinks(links, prev=self.ids[1], next=self.ids[2])
+
+        ids, links = self.get_page(before=self.ids[2], limit=2)
+        self.assertEqual(ids, self.ids[:2])
+        self.assertLinks(links, next=self.ids[1])
+
+    def test_after(self):
+        ids, links = self.get_page(after=self.ids[0], limit=2)
+        self.assertEqual(ids, self.ids[1:3])
+        self.assertLinks(links, prev=self.ids[1], next=self.ids[2])
+
+        ids, links = self.get_page(after=self.ids[2], limit=2)
+        self.assertEqual(ids, self.ids[3:])
+        self.assertLinks(links, prev=self.ids[3])
+
+    def test_cursors_past_either_end(self):
+        # Nothing is older than the oldest message, so the first page has no prev link
+        ids, links = self.get_page(after=self.ids[0] - 1, limit=2)
+        self.assertEqual(ids, self.ids[:2])
+        self.assertLinks(links, next=self.ids[1])
+
+        # Nothing is newer than the newest message, so the last page has no next link
+        ids, links = self.get_page(before=self.ids[-1] + 1, limit=2)
+        self.assertEqual(ids, self.ids[3:])
+        self.assertLinks(links, prev=self.ids[3])
+
+        for params in ({"after": self.ids[-1]}, {"before": self.ids[0]}):
+            ids, links = self.get_page(**params)
+            self.assertEqual(ids, [])
+            self.assertLinks(links)
+
+    def test_empty_channel(self):
+        Message.objects.all().delete()
+        for params in ({}, {"before": self.ids[-1]}, {"after": 0}):
+            ids, links = self.get_page(**params)
+            self.assertEqual(ids, [])
+            self.assertLinks(links)
+
+
+class LazyWebSocketUserTests(TestCase):
+    """
+    The WebSocket scope gets a LazyUserProfile for users whose profile exists, and sending a
+    message with it never loads the profile.
+    """
+
+    def setUp(self):
+        cache.delete(PROFILE_GENERATION_KEY)
+        for cached in (verified_tokens, profile_cache):
+            cached.clear()
+            self.addCleanup(cached.clear)
+        lazy_profile_stats.reset()
+        self.user = UserProfile.objects.create(email="user@example.com", first_name="User", last_name="Test")
+        self.conversation = Conversation.objects.create(channel_id="1")
+
+    def token(self, **claims):
+        claims = {"user_id": self.user.pk, "exp": int(time.time()) + 300, **claims}
+        return jwt.encode(claims, settings.JWT_ACCESS_SECRET, algorithm="HS256")
+
+    def test_existing_profiles_give_a_lazy_user(self):
+        with self.assertNumQueries(1):
+            user = async_to_sync(get_user_from_token)(self.token())
+        self.assertIsInstance(user, LazyUserProfile)
+        self.assertEqual((user.pk, user.first_name), (self.user.pk, "User"))
+        self.assertTrue(user.is_authenticated)
+
+        # Later connects are answered by the profile cache
+        with self.assertNumQueries(0):
+            async_to_sync(get_user_from_token)(self.token())
+
+        with CaptureQueriesContext(connection) as queries:
+            message = async_to_sync(SyncMessageWriter().write)(self.conversation.id, user, "hello")
+        self.assertFalse([query for query in queries if "account_userprofile" in query["sql"]])
+        self.assertEqual(message.sender_id, self.user.pk)
+        self.assertFalse(user.is_loaded)
+        self.assertEqual(lazy_profile_stats.snapshot()["loaded"], 0)
+
+    def test_unknown_users_are_rejected(self):
+        token = self.token()
+        self.user.delete()
+        self.assertIsNone(async_to_sync(get_user_from_token)(token))
+
+    def test_name_comes_from_the_profile_not_the_token(self):
+        user = async_to_sync(get_user_from_token)(self.token(first_name="Stale"))
+        self.assertEqual(user.first_name, "User")
+
+        # A rename arriving as a profile event reaches the open socket
+        create_chat_profile(
+            {"id": self.user.pk, "email": "user@example.com", "first_name": "Renamed", "last_name": "Test"}
+        )
+        with self.assertNumQueries(0):
+            self.assertEqual(user.first_name, "Renamed")
+
+
+class ConsumerTestMixin:
+    """
+    Connects WebSocket clients straight to the chat consumer, as an authenticated user.
+    """
+
+    def setUp(self):
+        super().setUp()
+        for cache in (recent_messages._rooms, recent_messages._members, conversation_ids):
+            cache.clear()
+        self.user = UserProfile.objects.create(email="user@example.com", first_name="User", last_name="Test")
+
+    async def connect(self, channel_id="1", query=""):
+        path = f"/1/{channel_id}/" + (f"?{query}" if query else "")
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), path)
+        communicator.scope["user"] = self.user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator, await communicator.receive_json_from()
+
+    async def send(self, communicator, text):
+        await communicator.send_json_to({"type": "message", "message": text})
+        return await communicator.receive_json_from()
+
+    @database_sync_to_async
+    def store_elsewhere(self, channel_id, text):
+        # A message written and broadcast by another process, which this one never saw
+        conversation = Conversation.objects.get(channel_id=channel_id)
+        return Message.objects.create(
+            conversation=conversation, sender=self.user, content=text, seq=reserve_sequence_block(conversation.id)
+        )
+
+
+class RoomHistoryConsumerTests(ConsumerTestMixin, TestCase):
+    """
+    The history served on join must never be stale, and must keep every frame in seq order.
+    """
+
+    async def test_join_after_the_last_local_socket_left_reloads_history(self):
+        communicator, history = await self.connect()
+        self.assertEqual(history["messages"], [])
+        await self.send(communicator, "one")
+        await communicator.disconnect()
+
+        # Nobody here listens to the room any more, so its buffer must not survive
+        self.assertIsNone(recent_messages.get("1"))
+        await self.store_elsewhere("1", "two")
+
+        communicator, history = await self.connect()
+        self.assertEqual([frame["content"] for frame in history["messages"]], ["one", "two"])
+        await communicator.disconnect()
+
+    async def test_buffer_survives_while_another_local_socket_stays(self):
+        first, _ = await self.connect()
+        second, _ = await self.connect()
+        await self.send(first, "one")
+        await second.receive_json_from()
+        await first.disconnect()
+
+        self.assertEqual([frame["content"] for frame in recent_messages.get("1")], ["one"])
+        await second.disconnect()
+
+    async def test_broadcast_is_recorded_once_per_process(self):
+        first, _ = await self.connect()
+        second, _ = await self.connect()
+        layer = get_channel_layer()
+
+        with patch.object(layer, "group_send", wraps=layer.group_send) as group_send:
+            await self.send(first, "one")
+        await second.receive_json_from()
+        # Only the encoded text travels to every member
+        self.assertEqual(set(group_send.call_args.args[1]), {"type", "text"})
+
+        frame = message_frame(900, "User", "from elsewhere", timezone.now(), 900)
+        with patch.object(recent_messages, "record", wraps=recent_messages.record) as record:
+            await layer.group_send("conversation_1", {"type": "chat_message", "text": json.dumps(frame)})
+            await first.receive_from()
+            await second.receive_from()
+        record.assert_called_once_with("1", frame)
+        await first.disconnect()
+        await second.disconnect()
+
+    async def test_next_socket_records_once_the_recorder_leaves(self):
+        first, _ = await self.connect()
+        second, _ = await self.connect()
+        await first.disconnect()
+
+        frame = message_frame(900, "User", "from elsewhere", timezone.now(), 900)
+        await get_channel_layer().group_send("conversation_1", {"type": "chat_message", "text": json.dumps(frame)})
+        await second.receive_from()
+        self.assertEqual([frame["content"] for frame in recent_messages.get("1")], ["from elsewhere"])
+        await second.disconnect()
+
+    async def test_interleaved_broadcasts_are_kept_in_seq_order(self):
+        communicator, _ = await self.connect()
+        now = timezone.now()
+        frames = [message_frame(id_, "User", f"message {seq}", now, seq) for id_, seq in ((900, 3), (800, 2))]
+        layer = get_channel_layer()
+        # Out of seq (and id) order, and the first one reported twice
+        for frame in frames + frames[:1]:
+            await layer.group_send("conversation_1", {"type": "chat_message", "text": json.dumps(frame)})
+            await communicator.receive_from()
+
+        late, history = await self.connect()
+        self.assertEqual([frame["seq"] for frame in history["messages"]], [2, 3])
+        await late.disconnect()
+        await communicator.disconnect()
+
+
+class ResumeConsumerTests(ConsumerTestMixin, TestCase):
+    """
+    A reconnecting client gets exactly the messages after the last seq it saw.
+    """
+
+    async def send_messages(self, count):
+        communicator, _ = await self.connect()
+        seqs = [(await self.send(communicator, f"message {i}"))["seq"] for i in range(count)]
+        return communicator, seqs
+
+    async def test_resume_from_the_buffer(self):
+        communicator, seqs = await self.send_messages(3)
+        self.assertEqual(seqs, [1, 2, 3])
+
+        resumed, replay = await self.connect(query="resume_after=1")
+        self.assertEqual((replay["type"], [frame["seq"] for frame in replay["messages"]]), ("replay", [2, 3]))
+        await resumed.disconnect()
+        await communicator.disconnect()
+
+    async def test_resume_from_the_database(self):
+        communicator, _ = await self.send_messages(3)
+        await communicator.disconnect()
+
+        resumed, replay = await self.connect(query="resume_after=2")
+        self.assertEqual([frame["content"] for frame in replay["messages"]], ["message 2"])
+        await resumed.disconnect()
+
+    async def test_resume_frame_covers_out_of_order_broadcasts(self):
+        communicator, _ = await self.send_messages(1)
+        layer = get_channel_layer()
+        now = timezone.now()
+        # seq 3 is broadcast before seq 2 reaches this process
+        for id_, seq in ((900, 3), (800, 2)):
+            frame = message_frame(id_, "User", f"seq {seq}", now, seq)
+            await layer.group_send("conversation_1", {"type": "chat_message", "text": json.dumps(frame)})
+            await communicator.receive_from()
+
+        await communicator.send_json_to({"type": "resume", "after": 1})
+        replay = await communicator.receive_json_from()
+        self.assertEqual([frame["seq"] for frame in replay["messages"]], [2, 3])
+        await communicator.disconnect()
+
+    async def test_invalid_resume_after_falls_back_to_history(self):
+        communicator, history = await self.connect(query="resume_after=abc")
+        self.assertEqual(history["type"], "history")
+        await communicator.disconnect()
+
+
+class SequenceTests(TestCase):
+    """
+    Sequence numbers are reserved in one statement, and a room waiting for its block never
+    holds up the others.
+    """
+
+    def setUp(self):
+        self.first = Conversation.objects.create(channel_id="first")
+        self.second = Conversation.objects.create(channel_id="second")
+
+    def test_reservation_is_a_single_statement(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(reserve_sequence_block(self.first.id, 10), 1)
+        self.assertEqual(reserve_sequence_block(self.first.id), 11)
+        self.assertEqual(reserve_sequence_block(self.second.id), 1)
+        with self.assertRaises(Conversation.DoesNotExist):
+            reserve_sequence_block(0)
+
+    async def test_rooms_do_not_wait_for_each_other(self):
+        blocks = SequenceBlocks()
+        release = asyncio.Event()
+
+        def reserve(reserve_block):
+            async def reserve_async(conversation_id, size):
+                if conversation_id == self.first.id:
+                    await release.wait()
+                return 1
+
+            return reserve_async
+
+        with patch("chatapp.sequences.database_sync_to_async", reserve):
+            waiting = asyncio.ensure_future(blocks.next_seq(self.first.id))
+            await asyncio.sleep(0)
+            self.assertEqual(await asyncio.wait_for(blocks.next_seq(self.second.id), 1), 1)
+            self.assertFalse(waiting.done())
+            release.set()
+            self.assertEqual(await waiting, 1)
+
+
+class BatchedMessageWriterTests(TestCase):
+    """
+    Write-behind messages are flushed by size, by timer and on close, and a bad row in a batch
+    only costs that row.
+    """
+
+    def setUp(self):
+        self.user = UserProfile.objects.create(email="user@example.com", first_name="User", last_name="Test")
+        self.conversation = Conversation.objects.create(channel_id="batched")
+
+    async def write(self, writer, count):
+        return [await writer.write(self.conversation.id, self.user, f"message {i}") for i in range(count)]
+
+    @database_sync_to_async
+    def stored(self):
+        messages = Message.objects.filter(conversation=self.conversation).order_by("seq")
+        return list(messages.values_list("content", flat=True))
+
+    async def test_full_batch_is_flushed_in_the_background(self):
+        writer = BatchedMessageWriter(batch_size=2, flush_interval=60)
+        await self.write(writer, 3)
+        self.assertEqual(len(writer._tasks), 1)
+        await asyncio.gather(*writer._tasks)
+
+        self.assertEqual(await self.stored(), ["message 0", "message 1"])
+        self.assertEqual(len(writer.pending(self.conversation.id)), 1)
+        await writer.close()
+        self.assertEqual(len(await self.stored()), 3)
+        self.assertEqual(writer._tasks, set())
+
+    async def test_pending_messages_are_flushed_by_the_timer(self):
+        writer = BatchedMessageWriter(batch_size=100, flush_interval=0.01)
+        await self.write(writer, 2)
+        await asyncio.sleep(0.05)
+        await writer.close()
+        self.assertEqual(await self.stored(), ["message 0", "message 1"])
+
+    async def test_failed_batch_is_retried_row_by_row(self):
+        writer = BatchedMessageWriter(batch_size=100, flush_interval=60)
+        first, second, third = await self.write(writer, 3)
+        # A row with the id of a stored message fails the bulk insert, and only that row
+        await database_sync_to_async(Message.objects.create)(
+            id=second.id, conversation=self.conversation, sender=self.user, content="existing", seq=third.seq + 1
+        )
+        with self.assertLogs("chatapp.message_writer", "ERROR") as logs:
+            await writer.close()
+        self.assertEqual(await self.stored(), ["message 0", "message 2", "existing"])
+        self.assertIn(f"Dropping message {second.id}", "\n".join(logs.output))
+
+    async def test_seq_is_the_message_id_without_a_database_round_trip(self):
+        writer = BatchedMessageWriter(batch_size=100, flush_interval=60)
+        with patch("chatapp.sequences.reserve_sequence_block") as reserve:
+            messages = await self.write(writer, 3)
+        reserve.assert_not_called()
+        self.assertEqual([message.seq for message in messages], [message.id for message in messages])
+        self.assertEqual(sorted(message.seq for message in messages), [message.seq for message in messages])
+
+        # Numbers reserved later, e.g. after switching to sync mode, stay above them
+        await writer.close()
+        self.assertGreater(await database_sync_to_async(reserve_sequence_block)(self.conversation.id), messages[-1].seq)
+
+    async def test_sync_mode_after_batched_mode_keeps_ids_increasing(self):
+        writer = BatchedMessageWriter(batch_size=100, flush_interval=60)
+        batched = await self.write(writer, 2)
+        await writer.close()
+
+        message = await SyncMessageWriter().write(self.conversation.id, self.user, "sync again")
+        self.assertGreater(message.id, batched[-1].id)
+        self.assertGreater(message.seq, batched[-1].seq)
+
+    def test_batched_mode_requires_a_worker_id(self):
+        self.addCleanup(setattr, message_writer, "_writer", message_writer._writer)
+        message_writer._writer = None
+        with override_settings(CHAT_MESSAGE_PERSISTENCE="batched", CHAT_WORKER_ID=None):
+            with self.assertRaises(ImproperlyConfigured):
+                get_message_writer()
@@ -1,23 +1,66 @@
+import hashlib
+from django.utils.decorators import method_decorator
+from django.utils.http import quote_etag
+from django.views.decorators.http import condition
 from rest_framework import viewsets, status
 from rest_framework.response import Response
+from account.authenticate import JWTCookieAuthentication
 from .models import Message, Conversation
-from .serializers import MessageSerializer
+from .serializers import message_history_values, serialize_message_history
 from .schemas import list_message_docs
+from .pagination import MessageKeysetPagination
+
+def message_list_etag(request, *args, **kwargs):
+    """
+    ETag for a page of message history.
+
+    Built from the conversation's latest message id and the page cursor, which costs one
+    indexed lookup. When nothing has been posted since the client's copy, the request is
+    answered with 304 before any message is loaded or serialized.
+    """
+    channel_id = request.GET.get("channel_id")
+    if not channel_id:
+        return None
+
+    latest_id = (
+        Message.objects.filter(conversation__channel_id=channel_id)
+        .order_by("-id")
+        .values_list("id", flat=True)
+        .first()
+    )
+    if latest_id is None:
+        return None
+
+    page = (channel_id, latest_id, request.GET.get("before"), request.GET.get("after"), request.GET.get("limit"))
+    return quote_etag(hashlib.md5(repr(page).encode()).hexdigest())
+
 
 class MessageViewSet(viewsets.ViewSet):
     """
     A ViewSet for viewing and manipulating the Message instances.
     
     list:
-    Retrieve a list of messages associated with a specific channel_id.
-    """   
+    Retrieve a page of messages associated with a specific channel_id.
+
+    Authenticated from the access token cookie only (see `JWTCookieAuthentication`), so reading
+    history never loads a session.
+    """
+    authentication_classes = [JWTCookieAuthentication]
+    pagination_class = MessageKeysetPagination
+
     @list_message_docs
+    @method_decorator(condition(etag_func=message_list_etag))
     def list(self, request):
         """
-        Fetches the list of messages for a provided channel_id.
+        Fetches a page of messages for a provided channel_id.
 
         The channel_id is required as a query parameter. If the channel_id is not provided or if there's no conversation
         associated with the provided channel_id, appropriate error responses are returned.
+
+        Without a cursor the newest `limit` messages are returned; `before`/`after` page through older or newer
+        messages by id (see `MessageKeysetPagination`). Messages are always ordered oldest first.
+
+        Responses carry an ETag (see `message_list_etag`); a matching If-None-Match gets 304 Not Modified.
         """
         # Fetch channel_id from query parameters.
         channel_id = request.query_params.get("channel_id")
@@ -32,9 +75,10 @@ class MessageViewSet(viewsets.ViewSet):
         except Conversation.DoesNotExist:
             return Response([], status=status.HTTP_404_NOT_FOUND)  # Changed to 404 to indicate not found
         
-        # Fetch all messages associated with the fetched conversation.
-        messages = conversation.messages.all()
-        serializer = MessageSerializer(messages, many=True)
+        # Fetch one page of the conversation's messages using the before/after/limit cursor.
+        # Rows are projected with the sender's name joined in, so the page is a single query.
+        paginator = self.pagination_class()
+        rows = paginator.paginate_queryset(message_history_values(conversation.messages.all()), request, view=self)
         
-        # Return the serialized list of messages.
-        return Response(serializer.data, status=status.HTTP_200_OK)  # Explicitly set 200 OK status
+        # Return the serialized page; cursors for neighbouring pages go in the Link header.
+        return paginator.get_paginated_response(serialize_message_history(rows))
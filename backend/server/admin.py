@@ -1,8 +1,11 @@
 from django.contrib import admin
-from .models import Channel, Category, Server
+from .models import Channel, Category, ImageJob, MediaBlob, Server, SpriteSheet
 
 admin.site.register(Channel)
 admin.site.register(Category)
 admin.site.register(Server)
+admin.site.register(ImageJob)
 
 
+admin.site.register(MediaBlob)
+admin.site.register(SpriteSheet)
@@ -1,6 +1,26 @@
 from django.apps import AppConfig
 
 
+def image_limits(settings):
+    """
+    Returns the image budgets from the settings, as keyword arguments for `configure_image_limits`.
+    """
+    return {
+        "max_pixels": getattr(settings, "SERVER_IMAGE_MAX_PIXELS", None),
+        "max_frames": getattr(settings, "SERVER_IMAGE_MAX_FRAMES", None),
+        "max_total_pixels": getattr(settings, "SERVER_IMAGE_MAX_TOTAL_PIXELS", None),
+    }
+
+
 class ServerConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "server"
+
+    def ready(self):
+        # Connect the cache invalidation receivers
+        from . import signals  # noqa: F401
+        from django.conf import settings
+        from .utils.image_probe import configure_image_limits
+
+        # Apply the image budgets to every image this process opens (see utils/image_probe.py)
+        configure_image_limits(**image_limits(settings))
@@ -0,0 +1,150 @@
+import hashlib
+import logging
+import time
+from django.conf import settings
+from django.core.cache import cache, caches
+
+from chat_core.lru import LRUCache
+
+# Set up the logger
+logger = logging.getLogger(__name__)
+
+# Listings served from the response cache, each with its own version counter
+CATEGORY_LISTING = "categories"
+SERVER_LISTING = "servers"
+
+LISTING_VERSION_KEY = "server:listing:{listing}:version"
+
+
+def get_listing_version(listing):
+    """
+    Return the current version of a listing's data.
+
+    The version changes whenever a row the listing is built from changes (see `signals.py`),
+    so it can be used as a cheap validator for responses and as part of cache keys.
+    It is stored in the default Django cache; configure a shared cache (e.g. Redis) in
+    production so that every process sees the same version.
+
+    If the key is missing (cold or flushed cache), it is seeded from the clock, so a
+    restart never reissues a version that an earlier dataset already used.
+
+    Args:
+        listing (str): `CATEGORY_LISTING` or `SERVER_LISTING`.
+
+    Returns:
+        int: The listing version.
+    """
+    key = LISTING_VERSION_KEY.format(listing=listing)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_listing_version(*listings):
+    """
+    Mark every cached or client-held response of the given listings as stale.
+    """
+    for listing in listings:
+        key = LISTING_VERSION_KEY.format(listing=listing)
+        try:
+            version = cache.incr(key)
+        except ValueError:
+            # Key missing: seeding it is enough to invalidate everything issued before
+            get_listing_version(listing)
+            continue
+        logger.debug(f"{listing} listing version bumped to {version}")
+
+
+class LRUResponseCache:
+    """
+    In-process response cache backed by `LRUCache`.
+
+    Nothing is shared between processes, but lookups cost no network round trip. Entries
+    never need deleting: their keys carry the listing version, so stale ones simply stop
+    being read and fall out as the LRU evicts them.
+    """
+
+    def __init__(self, maxsize=1024):
+        self._cache = LRUCache(maxsize=maxsize)
+
+    def get(self, key):
+        return self._cache.get(key)
+
+    def set(self, key, value):
+        self._cache.set(key, value)
+
+
+class DjangoResponseCache:
+    """
+    Response cache backed by a Django cache alias, shared by every process using it.
+
+    Attributes:
+        timeout (int): Seconds an entry is kept; stale versions expire on their own.
+    """
+
+    def __init__(self, alias="default", timeout=300):
+        self.alias = alias
+        self.timeout = timeout
+
+    def get(self, key):
+        return caches[self.alias].get(key)
+
+    def set(self, key, value):
+        caches[self.alias].set(key, value, timeout=self.timeout)
+
+
+RESPONSE_CACHE_BACKENDS = {
+    "lru": lambda: LRUResponseCache(maxsize=getattr(settings, "SERVER_LISTING_CACHE_SIZE", 1024)),
+    "django": lambda: DjangoResponseCache(
+        alias=getattr(settings, "SERVER_LISTING_CACHE_ALIAS", "default"),
+        timeout=getattr(settings, "SERVER_LISTING_CACHE_TIMEOUT", 300),
+    ),
+}
+
+_response_cache = None
+
+
+def get_response_cache():
+    """
+    Return the process-wide listing response cache selected by `SERVER_LISTING_CACHE`
+    ("lru" or "django").
+    """
+    global _response_cache
+
+    if _response_cache is None:
+        backend = getattr(settings, "SERVER_LISTING_CACHE", "lru")
+        if backend not in RESPONSE_CACHE_BACKENDS:
+            raise ValueError(f"Unknown SERVER_LISTING_CACHE backend: {backend!r}")
+        _response_cache = RESPONSE_CACHE_BACKENDS[backend]()
+        logger.info(f"Server listings are cached with the {backend} backend")
+
+    return _response_cache
+
+
+def cached_listing(listing, params, build):
+    """
+    Return a listing's serialized data from the response cache, building it on a miss.
+
+    The cache key is made of the listing version and the normalized query parameters. The
+    version is read before `build()` runs, so data built while a change is being saved is
+    stored under the old version and can never be served once the change is visible.
+
+    Args:
+        listing (str): `CATEGORY_LISTING` or `SERVER_LISTING`.
+        params (tuple): Normalized, hashable query parameters.
+        build (callable): Returns the serialized data when it is not cached.
+
+    Returns:
+        list: The serialized listing.
+    """
+    digest = hashlib.md5(repr(params).encode()).hexdigest()
+    key = f"server:listing:{listing}:{get_listing_version(listing)}:{digest}"
+
+    response_cache = get_response_cache()
+    data = response_cache.get(key)
+    if data is None:
+        data = build()
+        response_cache.set(key, data)
+    return data
@@ -0,0 +1,454 @@
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db.models import Exists, F, OuterRef
+from django.utils import timezone
+
+from .apps import image_limits
+from .cache import SERVER_LISTING, bump_listing_version
+from .media_blobs import acquire_blobs, intern_file, is_blob, release_blobs
+from .models import ImageJob
+from .utils.image_probe import configure_image_limits
+from .utils.image_path import is_default_media
+from .utils.image_processors import process_image
+from .utils.image_variants import delete_stored_variants, stored_variant_names, to_stored_variants
+
+# Set up the logger
+logger = logging.getLogger(__name__)
+
+# (model label, field name) -> name of the processor run on that field's file (see `utils.image_processors`)
+# Each field stores its variants (see `utils.image_variants`) in a "<field>_variants" JSONField
+# and its placeholder (see `utils.image_placeholder`) in a "<field>_placeholder" JSONField.
+IMAGE_FIELDS = {
+    ("server.server", "banner_img"): "banner",
+    ("server.server", "icon"): "icon",
+    ("server.category", "icon"): "category_icon",
+}
+
+
+def needs_processing(instance, field_name):
+    """
+    Returns True if the field holds a file that has not been through the pipeline yet.
+
+    A processed file is recorded as the source of the field's stored variants, so re-saving
+    an object whose images did not change does not process them again. Content-addressed files
+    are processed output already and, like the default images (see `share_default_image`), are
+    shared, so they must never be processed in place.
+    """
+    field_file = getattr(instance, field_name)
+    if not field_file or is_blob(field_file.name) or is_default_media(field_file.name):
+        return False
+    stored = getattr(instance, f"{field_name}_variants") or {}
+    return stored.get("source") != field_file.name
+
+
+def store_variants(model, pk, field_name, source_name, variants, placeholder=None):
+    """
+    Move a processed image and its variants into the content-addressed store (see
+    `media_blobs.py`), point the field at them and release the files they replace.
+
+    Every file is stored under the hash of its content, so identical output (the same logo on
+    several servers) is kept once and shared. Nothing is stored
+    if the field has meanwhile moved on to another file; the new variants are deleted instead,
+    since the job for the newer file will generate its own.
+
+    Args:
+        model (Model class): The model owning the field.
+        pk (int): Primary key of the instance.
+        field_name (str): Name of the image field.
+        source_name (str): Storage name of the file the variants were generated from, which
+            the processor has replaced with its scaled-down fallback.
+        variants (dict): Output of `generate_variants`, with absolute paths.
+        placeholder (dict): Output of `compute_placeholder`, stored alongside.
+
+    Returns:
+        dict: The stored value, whose "source" is the new name of the field's file, or None if
+        the variants were discarded.
+    """
+    variants_field = f"{field_name}_variants"
+    generated = to_stored_variants(source_name, variants)
+
+    current = model.objects.filter(pk=pk).values(field_name, variants_field).first()
+    if current is None or current[field_name] != source_name:
+        delete_stored_variants(generated)
+        return None
+
+    new = {
+        "source": intern_file(default_storage.path(source_name)),
+        "formats": {
+            name: {density: intern_file(default_storage.path(path)) for density, path in renditions.items()}
+            for name, renditions in generated["formats"].items()
+        },
+    }
+    stored_names = [new["source"], *stored_variant_names(new)]
+
+    updated = model.objects.filter(pk=pk, **{field_name: source_name}).update(
+        **{field_name: new["source"], variants_field: new, f"{field_name}_placeholder": placeholder or {}}
+    )
+    if not updated:
+        release_blobs(stored_names)
+        return None
+
+    release_blobs(stored_variant_names(current[variants_field]))
+    return new
+
+
+def reuse_processed(instance, field_name):
+    """
+    Point a new upload at the processed files of an identical one, skipping the pipeline.
+
+    Uploads are fingerprinted (see `replace_changed_images`). If another instance of the same
+    model uploaded the same content to the same field and it has been processed, its blobs are
+    exactly what processing this upload would produce, so they are shared instead and the
+    upload itself is deleted.
+
+    Returns:
+        bool: True if the field now points at processed files.
+    """
+    fingerprint = getattr(instance, f"{field_name}_fingerprint", "")
+    if not fingerprint:
+        return False
+
+    model = type(instance)
+    variants_field = f"{field_name}_variants"
+    placeholder_field = f"{field_name}_placeholder"
+    candidates = (
+        model.objects.filter(**{f"{field_name}_fingerprint": fingerprint})
+        .exclude(pk=instance.pk)
+        .values_list(field_name, variants_field, placeholder_field)[:10]
+    )
+    for name, stored, placeholder in candidates:
+        if is_blob(name) and (stored or {}).get("source") == name:
+            break
+    else:
+        return False
+
+    upload_name = getattr(instance, field_name).name
+    shared_names = [stored["source"], *stored_variant_names(stored)]
+    acquire_blobs(shared_names)
+    if not model.objects.filter(pk=instance.pk, **{field_name: upload_name}).update(
+        **{field_name: stored["source"], variants_field: stored, placeholder_field: placeholder}
+    ):
+        release_blobs(shared_names)
+        return False
+
+    release_blobs([upload_name])
+    setattr(instance, field_name, stored["source"])
+    setattr(instance, variants_field, stored)
+    setattr(instance, placeholder_field, placeholder)
+    logger.info(f"Reused the processed {field_name} of an identical upload for {model._meta.label_lower} {instance.pk}")
+    return True
+
+
+def processed_default(model, field_name, default_name):
+    """
+    Return the processed output of one of the shared default images, processing it only once.
+
+    The variants and placeholder of a default image are the same for every instance using it,
+    so they are taken from an instance that already has them. The default is only run through
+    its processor when none has, and then on a temporary copy, since the processor replaces the
+    file it is given with its scaled-down fallback.
+
+    Args:
+        model (Model class): The model owning the field.
+        field_name (str): Name of the image field.
+        default_name (str): Storage name of the default image the field holds.
+
+    Returns:
+        tuple: The stored variants (whose "source" is the default's name), the placeholder and
+        whether the variants were just stored (their references are then already taken), or
+        None if the default could not be processed.
+    """
+    variants_field = f"{field_name}_variants"
+    shared = (
+        model.objects.filter(**{field_name: default_name, f"{variants_field}__source": default_name})
+        .values_list(variants_field, f"{field_name}_placeholder")
+        .first()
+    )
+    if shared is not None:
+        return shared[0], shared[1], False
+
+    path = default_storage.path(default_name)
+    if not os.path.isfile(path):
+        logger.debug(f"Default image {default_name} is missing, leaving it unprocessed")
+        return None
+
+    processor = IMAGE_FIELDS[(model._meta.label_lower, field_name)]
+    # Created inside the media directory, so the variants are moved into the store, not copied
+    with tempfile.TemporaryDirectory(dir=default_storage.path("")) as workdir:
+        copy = os.path.join(workdir, os.path.basename(path))
+        shutil.copyfile(path, copy)
+        try:
+            variants, placeholder = process_image(processor, copy)
+        except Exception as e:
+            logger.error(f"Processing the default image {default_name} failed: {e}")
+            return None
+
+        stored = {
+            "source": default_name,
+            "formats": {
+                name: {density: intern_file(rendition) for density, rendition in renditions.items()}
+                for name, renditions in variants.items()
+            },
+        }
+    logger.info(f"Processed the default image {default_name}")
+    return stored, placeholder, True
+
+
+def share_default_image(instance, field_name):
+    """
+    Give an instance holding one of the default images the shared variants and placeholder of
+    that default (see `processed_default`).
+
+    The field keeps pointing at the default file itself, which is never processed in place nor
+    deleted. Instances whose default was already given its variants are left alone.
+
+    Returns:
+        bool: True if the variants and placeholder were stored on the instance.
+    """
+    field_file = getattr(instance, field_name)
+    variants_field = f"{field_name}_variants"
+    placeholder_field = f"{field_name}_placeholder"
+    current = getattr(instance, variants_field) or {}
+    if not field_file or not is_default_media(field_file.name) or current.get("source") == field_file.name:
+        return False
+
+    model = type(instance)
+    processed = processed_default(model, field_name, field_file.name)
+    if processed is None:
+        return False
+
+    stored, placeholder, owned = processed
+    shared_names = stored_variant_names(stored)
+    if not owned:
+        acquire_blobs(shared_names)
+    if not model.objects.filter(pk=instance.pk, **{field_name: field_file.name}).update(
+        **{variants_field: stored, placeholder_field: placeholder}
+    ):
+        release_blobs(shared_names)
+        return False
+
+    release_blobs(stored_variant_names(current))
+    setattr(instance, variants_field, stored)
+    setattr(instance, placeholder_field, placeholder)
+    return True
+
+
+def process_inline(instance, field_name):
+    """
+    Run the pipeline for one field inside the request (the "inline" mode and category icons).
+
+    Errors are logged and swallowed, like the scalers always did, so a bad image never makes
+    the save fail. A default image is not processed, but given the shared output of its default
+    (see `share_default_image`).
+
+    Returns:
+        bool: True if the file was processed, False if there was nothing to do or it failed.
+    """
+    share_default_image(instance, field_name)
+    if not needs_processing(instance, field_name):
+        return False
+    if reuse_processed(instance, field_name):
+        return True
+
+    field_file = getattr(instance, field_name)
+    processor = IMAGE_FIELDS[(instance._meta.label_lower, field_name)]
+    try:
+        variants, placeholder = process_image(processor, field_file.path)
+    except Exception as e:
+        logger.error(f"Processing {field_name} of {instance._meta.label_lower} {instance.pk} failed: {e}")
+        return False
+
+    stored = store_variants(type(instance), instance.pk, field_name, field_file.name, variants, placeholder)
+    if stored is not None:
+        setattr(instance, field_name, stored["source"])
+        setattr(instance, f"{field_name}_variants", stored)
+        setattr(instance, f"{field_name}_placeholder", placeholder)
+    return True
+
+
+def enqueue_image_jobs(instance, field_names):
+    """
+    Queue the given image fields of a saved instance for background processing and flag the
+    instance as pending until the worker has finished with them.
+
+    Jobs still pending for the same fields are superseded, so re-saving an object before the
+    worker got to it does not process its images twice. Uploads identical to an already
+    processed one reuse its files and default images get the shared output of their default,
+    so neither is queued at all (see `reuse_processed` and `share_default_image`).
+
+    Args:
+        instance (Model): A saved Server (any model registered in `IMAGE_FIELDS`).
+        field_names (list): Names of the image fields holding a file to process.
+    """
+    label = instance._meta.label_lower
+    field_names = [name for name in field_names if (label, name) in IMAGE_FIELDS]
+    for name in field_names:
+        share_default_image(instance, name)
+    field_names = [
+        name for name in field_names if needs_processing(instance, name) and not reuse_processed(instance, name)
+    ]
+    if not field_names:
+        return
+
+    ImageJob.objects.filter(
+        model=label, object_id=instance.pk, field_name__in=field_names, status=ImageJob.PENDING
+    ).update(status=ImageJob.DONE, error="superseded")
+    ImageJob.objects.bulk_create(
+        ImageJob(model=label, object_id=instance.pk, field_name=name, file_name=getattr(instance, name).name)
+        for name in field_names
+    )
+
+    type(instance).objects.filter(pk=instance.pk).update(images_pending=True)
+    instance.images_pending = True
+    bump_listing_version(SERVER_LISTING)
+    logger.info(f"Queued {', '.join(field_names)} of {label} {instance.pk} for processing")
+
+
+def claim_jobs(limit):
+    """
+    Claim up to `limit` pending jobs for this worker, oldest first.
+
+    Each job is claimed with a conditional UPDATE on its status, so several workers can poll
+    the same table without ever running a job twice. Jobs left in "processing" for longer than
+    `SERVER_IMAGE_JOB_TIMEOUT` (their worker died) are put back in the queue first.
+
+    Returns:
+        list: The claimed `ImageJob` instances.
+    """
+    now = timezone.now()
+    timeout = timedelta(seconds=getattr(settings, "SERVER_IMAGE_JOB_TIMEOUT", 300))
+    stale = ImageJob.objects.filter(status=ImageJob.PROCESSING, locked_at__lt=now - timeout).update(
+        status=ImageJob.PENDING
+    )
+    if stale:
+        logger.warning(f"Requeued {stale} image jobs abandoned by a worker")
+
+    claimed = []
+    for job in ImageJob.objects.filter(status=ImageJob.PENDING).order_by("id")[:limit]:
+        updated = ImageJob.objects.filter(pk=job.pk, status=ImageJob.PENDING).update(
+            status=ImageJob.PROCESSING, locked_at=now, attempts=F("attempts") + 1
+        )
+        if updated:
+            job.attempts += 1
+            claimed.append(job)
+    return claimed
+
+
+def resolve_job_path(job):
+    """
+    Return the absolute path of the file a job should process, or None if the job is
+    superseded (the object is gone or its field now points at another file) or was queued for
+    one of the default images, which are never processed in place.
+    """
+    if is_default_media(job.file_name):
+        return None
+
+    instance = apps.get_model(job.model).objects.filter(pk=job.object_id).first()
+    if instance is None:
+        return None
+
+    field_file = getattr(instance, job.field_name)
+    if not field_file or field_file.name != job.file_name:
+        return None
+    return field_file.path
+
+
+def finish_job(job, error=None):
+    """
+    Record the outcome of a job and clear the owner's pending flag once none of its jobs are left.
+
+    A failed job goes back in the queue until it has used up `SERVER_IMAGE_JOB_MAX_ATTEMPTS`.
+    """
+    if error is None:
+        status = ImageJob.DONE
+    elif job.attempts < getattr(settings, "SERVER_IMAGE_JOB_MAX_ATTEMPTS", 3):
+        status = ImageJob.PENDING
+    else:
+        status = ImageJob.FAILED
+    ImageJob.objects.filter(pk=job.pk).update(status=status, error=error or "")
+
+    if status == ImageJob.PENDING:
+        return
+
+    # Done in one UPDATE so a job queued meanwhile keeps the flag set
+    unfinished = ImageJob.objects.filter(
+        model=job.model,
+        object_id=OuterRef("pk"),
+        status__in=(ImageJob.PENDING, ImageJob.PROCESSING),
+    )
+    model = apps.get_model(job.model)
+    if model.objects.filter(pk=job.object_id).exclude(Exists(unfinished)).update(images_pending=False):
+        bump_listing_version(SERVER_LISTING)
+
+
+def run_worker(processes=None, batch_size=None, poll_interval=1.0, once=False):
+    """
+    Process queued image jobs with a pool of worker processes.
+
+    Decoding and resizing are CPU bound, so they run in a `ProcessPoolExecutor` rather than
+    threads; the database bookkeeping stays in this process. Pool processes are spawned rather
+    than forked, so they never inherit this process's database connections. Each round claims
+    enough jobs to keep every pool process busy and waits for them before claiming more.
+
+    Args:
+        processes (int): Size of the process pool (defaults to the number of CPUs).
+        batch_size (int): Jobs claimed per round (defaults to twice the pool size).
+        poll_interval (float): Seconds to sleep when the queue is empty.
+        once (bool): Stop as soon as the queue is empty instead of polling forever.
+    """
+    processes = processes or os.cpu_count() or 1
+    batch_size = batch_size or processes * 2
+
+    pool = ProcessPoolExecutor(
+        max_workers=processes,
+        mp_context=multiprocessing.get_context("spawn"),
+        # Spawned processes do not load Django, so hand them the image budgets explicitly
+        initializer=configure_image_limits,
+        initargs=tuple(image_limits(settings).values()),
+    )
+    with pool:
+        logger.info(f"Image worker started with {processes} processes")
+
+        while True:
+            jobs = claim_jobs(batch_size)
+            if not jobs:
+                if once:
+                    return
+                time.sleep(poll_interval)
+                continue
+
+            futures = {}
+            for job in jobs:
+                path = resolve_job_path(job)
+                if path is None:
+                    logger.info(f"Skipping superseded image job {job}")
+                    finish_job(job)
+                    continue
+                processor = IMAGE_FIELDS[(job.model, job.field_name)]
+                futures[pool.submit(process_image, processor, path)] = job
+
+            for future in as_completed(futures):
+                job = futures[future]
+                # Storing can fail too (database errors, a source moved meanwhile); such a job is
+                # retried like a failed decode instead of taking the worker down with it
+                try:
+                    variants, placeholder = future.result()
+                    store_variants(
+                        apps.get_model(job.model), job.object_id, job.field_name, job.file_name, variants, placeholder
+                    )
+                except Exception as e:
+                    logger.error(f"Image job {job} failed (attempt {job.attempts}): {e}")
+                    finish_job(job, error=repr(e))
+                else:
+                    logger.info(f"Processed image job {job}")
+                    finish_job(job)
@@ -0,0 +1,131 @@
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from PIL import Image, ImageDraw, ImageSequence
+
+from server.utils.animated_image import write_animated_gif
+from server.utils.atomic_save import save_image_atomically
+from server.utils.image_processors import BANNER_SIZE
+from server.utils.scale_image import scale_down_image
+
+
+def scale_gif_buffered(image_path, max_size=BANNER_SIZE):
+    """
+    The GIF branch `scale_down_image` used before frames were streamed: every frame is
+    converted and kept in a list until the whole animation is saved. Kept as the baseline.
+    """
+    with Image.open(image_path) as img:
+        frames = []
+        for frame in ImageSequence.Iterator(img):
+            frame = frame.convert("RGBA")
+            frame.thumbnail(max_size, Image.LANCZOS)
+            background = Image.new("RGBA", max_size, (255, 255, 255, 0))
+            offset = ((max_size[0] - frame.width) // 2, (max_size[1] - frame.height) // 2)
+            background.paste(frame, offset)
+            frames.append(background)
+        save_image_atomically(
+            frames[0], image_path, save_all=True, append_images=frames[1:], loop=0, duration=img.info.get("duration", 100)
+        )
+
+
+def scale_gif_streaming(image_path, max_size=BANNER_SIZE):
+    scale_down_image(image_path, max_size=max_size, raise_errors=True)
+
+
+def peak_rss_kib():
+    """
+    Returns the peak resident set size of this process, in KiB.
+
+    On Linux it is read from VmHWM, which starts afresh when a program is exec'd. `ru_maxrss`
+    is carried over through fork and exec there, so a child could never report less than the
+    peak of the process that launched it. Elsewhere `ru_maxrss` is used (bytes on macOS).
+    """
+    try:
+        with open("/proc/self/status") as fp:
+            for line in fp:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+
+# Each implementation runs in a fresh interpreter, which prints its peak RSS when done
+IMPLEMENTATIONS = {
+    "baseline": lambda image_path: None,
+    "buffered": scale_gif_buffered,
+    "streaming": scale_gif_streaming,
+}
+
+CHILD_SCRIPT = """
+import sys
+from server.management.commands.benchmark_gif_scaling import IMPLEMENTATIONS, peak_rss_kib
+IMPLEMENTATIONS[sys.argv[1]](sys.argv[2])
+print(peak_rss_kib())
+"""
+
+
+def synthetic_frames(count, size):
+    """
+    Yields `count` frames of a square moving over a gradient, every tenth one repeated.
+    """
+    background = Image.linear_gradient("L").resize(size).convert("RGBA")
+    side = min(size) // 4
+    for index in range(count):
+        if index % 10 == 9:
+            yield frame, 40
+            continue
+        frame = background.copy()
+        x = (index * 7) % (size[0] - side)
+        ImageDraw.Draw(frame).rectangle([x, side, x + side, 2 * side], fill=(200, 40, 40, 255))
+        yield frame, 40
+
+
+class Command(BaseCommand):
+    help = "Compare the peak memory of buffered and streaming animated GIF scaling"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--frames", type=int, default=200, help="Frames in the generated GIF")
+        parser.add_argument("--size", type=int, default=800, help="Width and height of the generated GIF")
+        parser.add_argument("--gif", help="Benchmark this GIF instead of generating one")
+
+    def peak_rss(self, implementation, source):
+        # Work on a copy: both implementations replace the file in place
+        with tempfile.TemporaryDirectory() as directory:
+            image_path = os.path.join(directory, "banner.gif")
+            shutil.copyfile(source, image_path)
+            result = subprocess.run(
+                [sys.executable, "-c", CHILD_SCRIPT, implementation, image_path],
+                cwd=settings.BASE_DIR,
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+        return int(result.stdout.split()[-1])
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            source = options["gif"]
+            if not source:
+                source = os.path.join(directory, "source.gif")
+                size = (options["size"], options["size"])
+                with open(source, "wb") as fp:
+                    write_animated_gif(synthetic_frames(options["frames"], size), fp, size)
+            with Image.open(source) as img:
+                self.stdout.write(f"Source: {img.width}x{img.height}, {getattr(img, 'n_frames', 1)} frames")
+
+            results = {name: self.peak_rss(name, source) for name in IMPLEMENTATIONS}
+
+        baseline = results["baseline"]
+        for name, rss in results.items():
+            self.stdout.write(f"{name:>10}: peak RSS {rss / 1024:.1f} MiB ({(rss - baseline) / 1024:+.1f} MiB over baseline)")
+
+
+# to run - python manage.py benchmark_gif_scaling [--frames 200] [--size 800] [--gif path/to/file.gif]
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from server.sprites import rebuild_category_sprite, sprite_map
+
+
+class Command(BaseCommand):
+    help = "Repaint the category icon sprite sheet from scratch"
+
+    def handle(self, *args, **options):
+        sheet = rebuild_category_sprite()
+        data = sprite_map(sheet)
+        self.stdout.write(
+            self.style.SUCCESS(f"Packed {len(data['icons'])} icons into {data['url']} ({data['width']}x{data['height']})")
+        )
+
+
+# to run - python manage.py rebuild_category_sprite
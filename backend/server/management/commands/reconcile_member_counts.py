@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from server.cache import SERVER_LISTING, bump_listing_version
+from server.member_counts import find_drift, recount_members
+
+
+class Command(BaseCommand):
+    help = "Repair Server.member_count values that no longer match the members table"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report the servers whose count has drifted",
+        )
+
+    def handle(self, *args, **options):
+        drift = find_drift()
+        for server_id, stored, actual in drift:
+            self.stdout.write(f"Server {server_id}: member_count={stored}, actual={actual}")
+
+        if not drift:
+            self.stdout.write(self.style.SUCCESS("All member counts are correct"))
+            return
+
+        if options["dry_run"]:
+            self.stdout.write(self.style.WARNING(f"{len(drift)} servers have drifted (dry run, nothing changed)"))
+            return
+
+        recount_members([server_id for server_id, _, _ in drift])
+        bump_listing_version(SERVER_LISTING)
+        self.stdout.write(self.style.SUCCESS(f"Repaired member_count for {len(drift)} servers"))
+
+
+# to run - python manage.py reconcile_member_counts [--dry-run]
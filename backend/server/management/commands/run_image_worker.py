@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from server.image_pipeline import run_worker
+
+
+class Command(BaseCommand):
+    help = "Run the background worker that scales uploaded server images"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=getattr(settings, "SERVER_IMAGE_WORKER_PROCESSES", None),
+            help="Size of the process pool (defaults to the number of CPUs)",
+        )
+        parser.add_argument("--batch-size", type=int, default=None, help="Jobs claimed per polling round")
+        parser.add_argument("--poll-interval", type=float, default=1.0, help="Seconds between polls of an empty queue")
+        parser.add_argument("--once", action="store_true", help="Exit once the queue is empty")
+
+    def handle(self, *args, **options):
+        run_worker(
+            processes=options["processes"],
+            batch_size=options["batch_size"],
+            poll_interval=options["poll_interval"],
+            once=options["once"],
+        )
+
+
+# to run - python manage.py run_image_worker [--processes N] [--once]
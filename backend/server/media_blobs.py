@@ -0,0 +1,154 @@
+import hashlib
+import logging
+import os
+from collections import Counter
+
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.views.static import serve
+
+from .models import MediaBlob
+from .utils.image_path import is_default_media
+
+# Set up the logger
+logger = logging.getLogger(__name__)
+
+# Directory of the content-addressed files, relative to the media root
+BLOB_PREFIX = "blobs/"
+
+# A blob's name changes with its content, so a URL can be cached forever
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def is_blob(name):
+    """
+    Returns True if `name` is the storage name of a content-addressed file.
+    """
+    return bool(name) and name.startswith(BLOB_PREFIX)
+
+
+def blob_name(digest, extension):
+    """
+    Returns the storage name for content with the given SHA-256 hex digest, e.g.
+    "blobs/ab/ab12...ef.webp". Files are spread over 256 directories by the first byte.
+    """
+    return f"{BLOB_PREFIX}{digest[:2]}/{digest}{extension.lower()}"
+
+
+def file_digest(path):
+    """
+    Returns the SHA-256 hex digest of a file, read in chunks.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as fp:
+        for chunk in iter(lambda: fp.read(64 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def acquire_blob(name):
+    """
+    Adds one reference to a blob, creating its row on first use.
+    """
+    if MediaBlob.objects.filter(name=name).update(refcount=F("refcount") + 1):
+        return
+    try:
+        with transaction.atomic():
+            MediaBlob.objects.create(name=name, refcount=1)
+    except IntegrityError:
+        # Created by someone else in the meantime
+        MediaBlob.objects.filter(name=name).update(refcount=F("refcount") + 1)
+
+
+def intern_file(path):
+    """
+    Moves a processed file into the content-addressed store and takes a reference to it.
+
+    The reference is taken before the file is put in place, so a concurrent release of the same
+    content can never delete it in between. If the content is already stored, the existing file
+    is simply overwritten with the same bytes.
+
+    Args:
+        path (str): Absolute path of the file, e.g. a scaled banner or one of its variants.
+
+    Returns:
+        str: The storage name of the blob.
+    """
+    name = blob_name(file_digest(path), os.path.splitext(path)[1])
+    acquire_blob(name)
+
+    blob_path = default_storage.path(name)
+    os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+    os.replace(path, blob_path)
+    return name
+
+
+def acquire_blobs(names):
+    """
+    Adds one reference to each of the given blobs, e.g. when an image reuses processed files.
+    """
+    for name in names:
+        acquire_blob(name)
+
+
+def release_blobs(names):
+    """
+    Drops one reference to each of the given media files and deletes the files left unused.
+
+    Blobs are only deleted once their reference count reaches zero. Files outside the store
+    (uploads that were never processed, images from before the store existed) belong to a
+    single field and are deleted once released, except for the shared default images, which
+    are never deleted.
+
+    Only the reference counts change straight away. The files are deleted once the current
+    transaction commits (see `delete_unused_files`), so a rollback never leaves a row pointing
+    at a deleted file.
+
+    Args:
+        names (iterable): Storage names; empty names are ignored and a name may repeat.
+    """
+    counts = Counter(name for name in names if name and not is_default_media(name))
+    for name, count in counts.items():
+        if is_blob(name):
+            MediaBlob.objects.filter(name=name).update(refcount=F("refcount") - count)
+    if counts:
+        transaction.on_commit(lambda: delete_unused_files(list(counts)))
+
+
+def delete_unused_files(names):
+    """
+    Deletes released files that nothing references any more (see `release_blobs`).
+
+    Each unused blob is deleted while its row is locked at a zero reference count. A concurrent
+    `acquire_blob` for the same content waits for the lock, so it either took its reference
+    first and the blob is kept, or finds the row gone and stores the file anew once the
+    deletion is over.
+    """
+    blob_names = []
+    for name in names:
+        if is_blob(name):
+            blob_names.append(name)
+        else:
+            default_storage.delete(name)
+
+    with transaction.atomic():
+        unused = list(
+            MediaBlob.objects.select_for_update()
+            .filter(name__in=blob_names, refcount__lte=0)
+            .values_list("name", flat=True)
+        )
+        for name in unused:
+            logger.debug(f"Deleting unreferenced blob {name}")
+            default_storage.delete(name)
+        MediaBlob.objects.filter(name__in=unused).delete()
+
+
+def serve_media(request, path, document_root=None, show_indexes=False):
+    """
+    `django.views.static.serve` for media, marking content-addressed files as immutable.
+    """
+    response = serve(request, path, document_root=document_root, show_indexes=show_indexes)
+    if is_blob(path):
+        response["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+    return response
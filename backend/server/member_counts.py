@@ -0,0 +1,58 @@
+import logging
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Server
+
+# Set up the logger
+logger = logging.getLogger(__name__)
+
+
+def member_count_subquery():
+    """
+    Correlated subquery counting the members of the outer server in the join table.
+    """
+    return Coalesce(
+        Subquery(
+            Server.members.through.objects.filter(server_id=OuterRef("pk"))
+            .order_by()
+            .values("server_id")
+            .annotate(total=Count("*"))
+            .values("total")
+        ),
+        0,
+    )
+
+
+def add_members(server_ids, count=1):
+    """
+    Increase `member_count` by `count` for the given servers, in a single UPDATE.
+
+    The increment is done with F() in the database, so concurrent joins never overwrite
+    each other's counts.
+    """
+    Server.objects.filter(pk__in=server_ids).update(member_count=F("member_count") + count)
+
+
+def recount_members(server_ids=None):
+    """
+    Recompute `member_count` from the join table for the given servers (all when None).
+
+    Used where the number of rows actually removed is unknown (remove/clear) and to repair drift.
+
+    Returns:
+        int: Number of servers updated.
+    """
+    servers = Server.objects.all() if server_ids is None else Server.objects.filter(pk__in=server_ids)
+    return servers.update(member_count=member_count_subquery())
+
+
+def find_drift():
+    """
+    Return (server id, stored count, actual count) for every server whose counter is off.
+    """
+    return list(
+        Server.objects.annotate(actual=member_count_subquery())
+        .exclude(member_count=F("actual"))
+        .values_list("id", "member_count", "actual")
+    )
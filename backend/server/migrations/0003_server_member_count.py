@@ -0,0 +1,43 @@
+# Generated by Django 5.0.6 on 2026-10-18 06:32
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_existing_members(apps, schema_editor):
+    """
+    Fill member_count for existing servers from the members join table.
+    """
+    Server = apps.get_model("server", "Server")
+    Membership = Server.members.through
+
+    counts = (
+        Membership.objects.filter(server_id=OuterRef("pk"))
+        .order_by()
+        .values("server_id")
+        .annotate(total=Count("*"))
+        .values("total")
+    )
+    Server.objects.update(member_count=Coalesce(Subquery(counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("server", "0002_alter_category_description_alter_category_icon_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="server",
+            name="member_count",
+            field=models.PositiveIntegerField(
+                default=0,
+                editable=False,
+                help_text="Number of members, maintained automatically. Run reconcile_member_counts to repair drift.",
+                verbose_name="Member Count",
+            ),
+        ),
+        migrations.RunPython(count_existing_members, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,127 @@
+# Generated by Django 5.0.6 on 2026-10-18 06:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("server", "0003_server_member_count"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="server",
+            name="images_pending",
+            field=models.BooleanField(
+                default=False,
+                editable=False,
+                help_text="True while the banner or icon is waiting to be processed in the background.",
+                verbose_name="Images Pending",
+            ),
+        ),
+        migrations.CreateModel(
+            name="ImageJob",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "model",
+                    models.CharField(
+                        help_text="Label of the model owning the image, e.g. server.server.",
+                        max_length=100,
+                        verbose_name="Model",
+                    ),
+                ),
+                (
+                    "object_id",
+                    models.PositiveBigIntegerField(
+                        help_text="Primary key of the instance owning the image.",
+                        verbose_name="Object ID",
+                    ),
+                ),
+                (
+                    "field_name",
+                    models.CharField(
+                        help_text="Name of the image field to process.",
+                        max_length=50,
+                        verbose_name="Field Name",
+                    ),
+                ),
+                (
+                    "file_name",
+                    models.CharField(
+                        help_text="The stored file name when the job was queued.",
+                        max_length=255,
+                        verbose_name="File Name",
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Pending"),
+                            ("processing", "Processing"),
+                            ("done", "Done"),
+                            ("failed", "Failed"),
+                        ],
+                        default="pending",
+                        help_text="Where the job is in its lifecycle.",
+                        max_length=20,
+                        verbose_name="Status",
+                    ),
+                ),
+                (
+                    "attempts",
+                    models.PositiveSmallIntegerField(
+                        default=0,
+                        help_text="How many times a worker has started the job.",
+                        verbose_name="Attempts",
+                    ),
+                ),
+                (
+                    "error",
+                    models.TextField(
+                        blank=True,
+                        default="",
+                        help_text="The last error raised while processing.",
+                        verbose_name="Error",
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        auto_now_add=True,
+                        help_text="When the job was queued.",
+                        verbose_name="Created At",
+                    ),
+                ),
+                (
+                    "locked_at",
+                    models.DateTimeField(
+                        blank=True,
+                        help_text="When a worker last claimed the job.",
+                        null=True,
+                        verbose_name="Locked At",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["status", "id"], name="imagejob_status_id_idx"
+                    ),
+                    models.Index(
+                        fields=["model", "object_id"], name="imagejob_object_idx"
+                    ),
+                ],
+            },
+        ),
+    ]
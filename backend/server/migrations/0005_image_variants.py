@@ -0,0 +1,46 @@
+# Generated by Django 5.0.6 on 2026-10-18 06:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("server", "0004_image_jobs"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="category",
+            name="icon_variants",
+            field=models.JSONField(
+                blank=True,
+                default=dict,
+                editable=False,
+                help_text="Renditions of the icon per format and pixel density.",
+                verbose_name="Icon Variants",
+            ),
+        ),
+        migrations.AddField(
+            model_name="server",
+            name="banner_img_variants",
+            field=models.JSONField(
+                blank=True,
+                default=dict,
+                editable=False,
+                help_text="Renditions of the banner per format and pixel density.",
+                verbose_name="Banner Image Variants",
+            ),
+        ),
+        migrations.AddField(
+            model_name="server",
+            name="icon_variants",
+            field=models.JSONField(
+                blank=True,
+                default=dict,
+                editable=False,
+                help_text="Renditions of the icon per format and pixel density.",
+                verbose_name="Icon Variants",
+            ),
+        ),
+    ]
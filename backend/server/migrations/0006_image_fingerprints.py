@@ -0,0 +1,49 @@
+# Generated by Django 5.0.6 on 2026-10-18 06:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("server", "0005_image_variants"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="category",
+            name="icon_fingerprint",
+            field=models.CharField(
+                blank=True,
+                default="",
+                editable=False,
+                help_text="SHA-256 of the uploaded icon.",
+                max_length=64,
+                verbose_name="Icon Fingerprint",
+            ),
+        ),
+        migrations.AddField(
+            model_name="server",
+            name="banner_img_fingerprint",
+            field=models.CharField(
+                blank=True,
+                default="",
+                editable=False,
+                help_text="SHA-256 of the uploaded banner image.",
+                max_length=64,
+                verbose_name="Banner Image Fingerprint",
+            ),
+        ),
+        migrations.AddField(
+            model_name="server",
+            name="icon_fingerprint",
+            field=models.CharField(
+                blank=True,
+                default="",
+                editable=False,
+                help_text="SHA-256 of the uploaded icon.",
+                max_length=64,
+                verbose_name="Icon Fingerprint",
+            ),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.0.6 on 2026-10-18 06:43
+
+import server.utils.image_path
+import server.validators.image_validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("server", "0006_image_fingerprints"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="category",
+            name="icon",
+            field=models.FileField(
+                blank=True,
+                default=server.utils.image_path.default_category_icon,
+                help_text="An optional icon for the category.",
+                null=True,
+                upload_to=server.utils.image_path.category_icon_upload_path,
+                validators=[
+                    server.validators.image_validators.validate_image_file_extension,
+                    server.validators.image_validators.validate_image_budget,
+                    server.validators.image_validators.validate_icon_image_size,
+                ],
+                verbose_name="Icon",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="server",
+            name="banner_img",
+            field=models.ImageField(
+                blank=True,
+                default=server.utils.image_path.default_server_banner_img_path,
+                help_text="An optional banner image for the server.",
+                null=True,
+                upload_to=server.utils.image_path.server_banner_img_upload_path,
+                validators=[
+                    server.validators.image_validators.validate_image_file_extension,
+                    server.validators.image_validators.validate_image_budget,
+                ],
+                verbose_name="Banner Image",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="server",
+            name="icon",
+            field=models.ImageField(
+                blank=True,
+                help_text="An optional icon for the server.",
+                null=True,
+                upload_to=server.utils.image_path.server_icon_upload_path,
+                validators=[
+                    server.validators.image_validators.validate_image_file_extension,
+                    server.validators.image_validators.validate_image_budget,
+                ],
+                verbose_name="Icon",
+            ),
+        ),
+    ]
@@ -0,0 +1,91 @@
+# Generated by Django 5.0.6 on 2026-10-18 06:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("server", "0007_image_budget_validators"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MediaBlob",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "name",
+                    models.CharField(
+                        help_text="Storage name of the file, derived from the hash of its content.",
+                        max_length=255,
+                        unique=True,
+                        verbose_name="Name",
+                    ),
+                ),
+                (
+                    "refcount",
+                    models.PositiveIntegerField(
+                        default=0,
+                        help_text="Number of image fields and variants pointing at the file.",
+                        verbose_name="Reference Count",
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        auto_now_add=True,
+                        help_text="When the content was first stored.",
+                        verbose_name="Created At",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AlterField(
+            model_name="category",
+            name="icon_fingerprint",
+            field=models.CharField(
+                blank=True,
+                db_index=True,
+                default="",
+                editable=False,
+                help_text="SHA-256 of the uploaded icon.",
+                max_length=64,
+                verbose_name="Icon Fingerprint",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="server",
+            name="banner_img_fingerprint",
+            field=models.CharField(
+                blank=True,
+                db_index=True,
+                default="",
+                editable=False,
+                help_text="SHA-256 of the uploaded banner image.",
+                max_length=64,
+                verbose_name="Banner Image Fingerprint",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="server",
+            name="icon_fingerprint",
+            field=models.CharField(
+                blank=True,
+                db_index=True,
+                default="",
+                editable=False,
+                help_text="SHA-256 of the uploaded icon.",
+                max_length=64,
+                verbose_name="Icon Fingerprint",
+            ),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.0.6 on 2026-10-18 06:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("server", "0008_media_blobs"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="category",
+            name="icon_placeholder",
+            field=models.JSONField(
+                blank=True,
+                default=dict,
+                editable=False,
+                help_text="BlurHash and dominant colour of the icon, shown while it loads.",
+                verbose_name="Icon Placeholder",
+            ),
+        ),
+        migrations.AddField(
+            model_name="server",
+            name="banner_img_placeholder",
+            field=models.JSONField(
+                blank=True,
+                default=dict,
+                editable=False,
+                help_text="BlurHash and dominant colour of the banner, shown while it loads.",
+                verbose_name="Banner Image Placeholder",
+            ),
+        ),
+        migrations.AddField(
+            model_name="server",
+            name="icon_placeholder",
+            field=models.JSONField(
+                blank=True,
+                default=dict,
+                editable=False,
+                help_text="BlurHash and dominant colour of the icon, shown while it loads.",
+                verbose_name="Icon Placeholder",
+            ),
+        ),
+    ]
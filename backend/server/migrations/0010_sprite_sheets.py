@@ -0,0 +1,84 @@
+# Generated by Django 5.0.6 on 2026-10-18 06:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("server", "0009_image_placeholders"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SpriteSheet",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "name",
+                    models.CharField(
+                        help_text="What the sheet holds, e.g. categories.",
+                        max_length=50,
+                        unique=True,
+                        verbose_name="Name",
+                    ),
+                ),
+                (
+                    "image",
+                    models.CharField(
+                        blank=True,
+                        default="",
+                        help_text="Storage name of the sheet image.",
+                        max_length=255,
+                        verbose_name="Image",
+                    ),
+                ),
+                (
+                    "cell_size",
+                    models.PositiveSmallIntegerField(
+                        help_text="Width and height of a cell in pixels.",
+                        verbose_name="Cell Size",
+                    ),
+                ),
+                (
+                    "columns",
+                    models.PositiveSmallIntegerField(
+                        help_text="Number of cells per row.", verbose_name="Columns"
+                    ),
+                ),
+                (
+                    "rows",
+                    models.PositiveSmallIntegerField(
+                        default=0,
+                        help_text="Number of rows of cells in the image.",
+                        verbose_name="Rows",
+                    ),
+                ),
+                (
+                    "slots",
+                    models.JSONField(
+                        blank=True,
+                        default=dict,
+                        help_text="Owner primary key -> cell index.",
+                        verbose_name="Slots",
+                    ),
+                ),
+                (
+                    "updated_at",
+                    models.DateTimeField(
+                        auto_now=True,
+                        help_text="When the sheet was last repainted.",
+                        verbose_name="Updated At",
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -1,13 +1,16 @@
 import logging
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 from django.dispatch import receiver
-from django.shortcuts import get_object_or_404
 from django.dispatch import receiver
 
-from .utils.scale_image import scale_down_image
-from .utils.scale_icon import scale_down_icon
-from .validators.image_validators import validate_icon_image_size, validate_image_file_extension
+from .utils.dirty_fields import DirtyFieldsMixin, file_fingerprint
+from .utils.image_variants import stored_variant_names
+from .validators.image_validators import (
+    validate_icon_image_size,
+    validate_image_budget,
+    validate_image_file_extension,
+)
 from .utils.image_path import (
     category_icon_upload_path,
     default_category_icon,
@@ -18,7 +21,64 @@ from .utils.image_path import (
 
 logger = logging.getLogger(__name__)
 
-class Category(models.Model):
+
+def release_media(names):
+    """
+    Drops one reference to each of the given media files (see `media_blobs.release_blobs`).
+    """
+    from .media_blobs import release_blobs
+
+    release_blobs(names)
+
+
+def replace_changed_images(instance, field_names):
+    """
+    Prepares the changed image fields of an instance that is about to be saved.
+
+    For each image field that changed since the instance was loaded (see `DirtyFieldsMixin`):
+
+    - A new upload is fingerprinted (SHA-256 of its content). If it is the same image as the
+      one already stored, the field is pointed back at the stored file, so nothing is written,
+      deleted or processed again.
+    - Otherwise the new fingerprint is recorded and the old file and its variants are released
+      (see `release_media`): they are only deleted if nothing else uses them.
+
+    Unchanged fields are left alone, so saving a name or description change never touches the
+    images or queries the row again.
+
+    Args:
+        instance (Model): A Category or Server using `DirtyFieldsMixin`.
+        field_names (iterable): The image fields to check; each has `<name>_fingerprint`,
+            `<name>_variants` and `<name>_placeholder` companions.
+    """
+    if not instance._state.adding and not instance.has_snapshot():
+        instance.load_snapshot()
+
+    changed = instance.changed_fields()
+    for name in field_names:
+        if name not in changed:
+            continue
+
+        field_file = getattr(instance, name)
+        old_name = instance.original_value(name, None)
+        if field_file and not field_file._committed:
+            fingerprint = file_fingerprint(field_file)
+            if old_name and fingerprint == instance.original_value(f"{name}_fingerprint", None):
+                logger.debug(f"Re-uploaded {name} of {instance} is unchanged, keeping {old_name}")
+                setattr(instance, name, old_name)
+                continue
+            setattr(instance, f"{name}_fingerprint", fingerprint)
+        else:
+            setattr(instance, f"{name}_fingerprint", "")
+
+        if old_name:
+            logger.debug(f"Releasing old {name} of {instance}")
+            release_media([old_name, *stored_variant_names(instance.original_value(f"{name}_variants", {}))])
+            setattr(instance, f"{name}_variants", {})
+            setattr(instance, f"{name}_placeholder", {})
+
+
+class Category(DirtyFieldsMixin, models.Model):
     """
     Category that can be assigned to servers in the system.
     
@@ -28,7 +88,13 @@ class Category(models.Model):
         name (str): The name of the category.
         description (str): A brief description of the category.
         icon (FileField): An optional icon for the category.
+        icon_variants (dict): WebP/AVIF/fallback renditions of the icon per pixel density
+            (see `utils/image_variants.py`).
+        icon_fingerprint (str): SHA-256 of the uploaded icon, used to spot re-uploads.
+        icon_placeholder (dict): `{"blurhash": ..., "color": "#rrggbb"}` painted while the icon
+            loads (see `utils/image_placeholder.py`).
     """
+    tracked_fields = ("icon", "icon_variants", "icon_fingerprint")
 
     name = models.CharField(
         max_length=50,
@@ -45,51 +111,81 @@ class Category(models.Model):
         upload_to=category_icon_upload_path,
         null=True,
         blank=True,
-        validators=[validate_icon_image_size, validate_image_file_extension],
+        validators=[validate_image_file_extension, validate_image_budget, validate_icon_image_size],
         default=default_category_icon,
         verbose_name="Icon",
         help_text="An optional icon for the category."
     )
+    icon_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name="Icon Variants",
+        help_text="Renditions of the icon per format and pixel density."
+    )
+    icon_fingerprint = models.CharField(
+        max_length=64,
+        blank=True,
+        default="",
+        editable=False,
+        db_index=True,
+        verbose_name="Icon Fingerprint",
+        help_text="SHA-256 of the uploaded icon."
+    )
+    icon_placeholder = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name="Icon Placeholder",
+        help_text="BlurHash and dominant colour of the icon, shown while it loads."
+    )
 
     def save(self, *args, **kwargs):
         """
         Overwrites the default save method to handle deletion of the old icon
         when a new one is uploaded.
 
-        First, the function checks if the instance already has an ID. The presence of an ID indicates
-        that this is an existing Category in the database, not a new instance being created.
-        This check is crucial because we only want to attempt deletion of the previous icon for
-        an existing Category that is being updated.
-
-        If the Category is already in the database, the function fetches the current Category
-        instance from the database using Django's get_object_or_404 function. This function will
-        return the Category object if it exists, and if it doesn't, it will raise a Http404 exception.
-
-        The function then compares the existing icon with the new icon. If they differ, it means a
-        new icon has been uploaded. When a new icon is uploaded, the function deletes the old
-        icon file from the filesystem. It's important to note that the `delete` method of a
-        FileField takes an optional `save` argument. By default, `save` is `True`, and it will save
-        the model after deleting the associated file. In this case, however, we pass `save=False`
-        to the `delete` method to avoid an unnecessary additional database write, as we are about
-        to save the model ourselves in the next step.
+        The values the category was loaded with are snapshotted in `from_db` (see `DirtyFieldsMixin`),
+        so the function can tell whether the icon changed without fetching the row again. Only when
+        it did is the old icon deleted, or, if the upload has the same content as the stored icon,
+        the stored one kept (see `replace_changed_images`).
 
         Finally, the original save method is called through the use of `super()` to save the
-        changes (including the new icon) to the database.
+        changes (including the new icon) to the database, and a new icon is run through the image
+        pipeline and repainted in the category sprite sheet (see `sprites.py`). Saves that do not
+        change the icon never process it again.
+
+        All of it runs in one transaction: released files are only deleted once it commits (see
+        `media_blobs.release_blobs`), so a save that fails never leaves the row pointing at an
+        icon that is gone.
 
         Args:
             *args: Variable length argument list.
             **kwargs: Arbitrary keyword arguments.
         """
-        if self.id:
-            existing_category = get_object_or_404(Category, id=self.id)
-            if existing_category.icon != self.icon:
-                logger.debug(f'Deleting old icon for category {self.name}')
-                existing_category.icon.delete(save=False)
+        # No savepoint of its own when nested, like `Model.save_base`
+        with transaction.atomic(savepoint=False):
+            replace_changed_images(self, ["icon"])
+            icon_changed = "icon" in self.changed_fields()
+
+            self.name = self.name.lower()
+
+            super(Category, self).save(*args, **kwargs)
+            logger.info(f'Saved category {self.name} (ID: {self.id})')
+
+            # Icons are validated to be at most 70x70, so their variants are always made inline
+            if self.icon:
+                from .image_pipeline import process_inline
 
-        self.name = self.name.lower()
+                process_inline(self, "icon")
 
-        super(Category, self).save(*args, **kwargs)
-        logger.info(f'Saved category {self.name} (ID: {self.id})')
+            if icon_changed:
+                from .sprites import update_category_sprite
+
+                # Repaint only this category's cell of the sprite sheet
+                update_category_sprite(self)
+
+        self.take_snapshot()
 
     def __str__(self):
         return self.name
@@ -100,15 +196,12 @@ class Category(models.Model):
         Receiver for a `pre_delete` signal on the `Category` model.
 
         This function is triggered right before a `Category` instance is deleted. Its main role is to
-        delete the associated icon file from the file system, if one exists.
-
-        The function checks if the `Category` instance has an associated icon by trying to access
-        the `icon` attribute. If the `icon` attribute has a value (i.e., a file), it calls the `delete`
-        method on it, which deletes the file from the file system.
+        release the associated icon file and its variants.
 
-        The `delete` method takes an optional `save` argument which defaults to `True`. However, since
-        we are in the process of deleting the `Category` instance from the database, there is no need
-        to save it. Hence, we pass `save=False` to avoid an unnecessary database operation.
+        Processed icons are shared content-addressed blobs (see `media_blobs.py`), so releasing one
+        only deletes the file once no other category or server points at it. The default icon is
+        shared by every category and is never deleted. The category's cell of the sprite sheet is
+        cleared for the next category to reuse.
 
         Args:
             sender (Model): The model class that sent the signal.
@@ -116,12 +209,16 @@ class Category(models.Model):
             **kwargs: Arbitrary keyword arguments.
         """
         if instance.icon:
-            logger.debug(f'Deleting icon for category "{instance.name}"')
-            instance.icon.delete(save=False)
+            logger.debug(f'Releasing icon for category "{instance.name}"')
+            release_media([instance.icon.name, *stored_variant_names(instance.icon_variants)])
+
+        from .sprites import remove_from_category_sprite
+
+        remove_from_category_sprite(instance.pk)
             
             
     
-class Server(models.Model):
+class Server(DirtyFieldsMixin, models.Model):
     """
     Server in the system that belongs to a specific category.
     
@@ -133,9 +230,28 @@ class Server(models.Model):
         category (Category): The category to which this server belongs.
         description (str): A brief description of the server.
         members (ManyToMany): The users who are members of this server.
+        member_count (int): Number of members, kept in step with `members` by the m2m_changed
+            receiver in `signals.py` so listings never have to count the join table.
         banner_img (ImageField): An optional banner image for the server.
         icon (ImageField): An optional icon for the server.
+        banner_img_variants (dict): WebP/AVIF/fallback renditions of the banner per pixel density.
+        icon_variants (dict): WebP/AVIF/fallback renditions of the icon per pixel density.
+        banner_img_fingerprint (str): SHA-256 of the uploaded banner, used to spot re-uploads.
+        icon_fingerprint (str): SHA-256 of the uploaded icon, used to spot re-uploads.
+        banner_img_placeholder (dict): `{"blurhash": ..., "color": "#rrggbb"}` painted while the
+            banner loads (see `utils/image_placeholder.py`).
+        icon_placeholder (dict): The same for the icon.
+        images_pending (bool): True while the banner or icon is still queued for background
+            processing; clients can show a "processing" state until it turns False.
     """
+    tracked_fields = (
+        "banner_img",
+        "icon",
+        "banner_img_variants",
+        "icon_variants",
+        "banner_img_fingerprint",
+        "icon_fingerprint",
+    )
 
     name = models.CharField(
         max_length=50,
@@ -168,11 +284,17 @@ class Server(models.Model):
         verbose_name="Members",
         help_text="The users who are members of this server."
     )
+    member_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name="Member Count",
+        help_text="Number of members, maintained automatically. Run reconcile_member_counts to repair drift."
+    )
     banner_img = models.ImageField(
         upload_to=server_banner_img_upload_path,
         blank=True,
         null=True,
-        validators=[validate_image_file_extension],
+        validators=[validate_image_file_extension, validate_image_budget],
         default=default_server_banner_img_path,
         verbose_name="Banner Image",
         help_text="An optional banner image for the server."
@@ -181,56 +303,106 @@ class Server(models.Model):
         upload_to=server_icon_upload_path,
         blank=True,
         null=True,
-        validators=[validate_image_file_extension],
+        validators=[validate_image_file_extension, validate_image_budget],
         verbose_name="Icon",
         help_text="An optional icon for the server."
     )
+    banner_img_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name="Banner Image Variants",
+        help_text="Renditions of the banner per format and pixel density."
+    )
+    icon_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name="Icon Variants",
+        help_text="Renditions of the icon per format and pixel density."
+    )
+    banner_img_fingerprint = models.CharField(
+        max_length=64,
+        blank=True,
+        default="",
+        editable=False,
+        db_index=True,
+        verbose_name="Banner Image Fingerprint",
+        help_text="SHA-256 of the uploaded banner image."
+    )
+    icon_fingerprint = models.CharField(
+        max_length=64,
+        blank=True,
+        default="",
+        editable=False,
+        db_index=True,
+        verbose_name="Icon Fingerprint",
+        help_text="SHA-256 of the uploaded icon."
+    )
+    banner_img_placeholder = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name="Banner Image Placeholder",
+        help_text="BlurHash and dominant colour of the banner, shown while it loads."
+    )
+    icon_placeholder = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name="Icon Placeholder",
+        help_text="BlurHash and dominant colour of the icon, shown while it loads."
+    )
+    images_pending = models.BooleanField(
+        default=False,
+        editable=False,
+        verbose_name="Images Pending",
+        help_text="True while the banner or icon is waiting to be processed in the background."
+    )
 
     def save(self, *args, **kwargs):
         """
-        Overwrites the default save method to handle deletion of the old icon
-        when a new one is uploaded.
-
-        First, the function checks if the instance already has an ID. The presence of an ID indicates
-        that this is an existing Category in the database, not a new instance being created.
-        This check is crucial because we only want to attempt deletion of the previous icon for
-        an existing Category that is being updated.
-
-        If the Category is already in the database, the function fetches the current Category
-        instance from the database using Django's get_object_or_404 function. This function will
-        return the Category object if it exists, and if it doesn't, it will raise a Http404 exception.
+        Overwrites the default save method to handle deletion of the old icon and banner
+        when new ones are uploaded.
 
-        The function then compares the existing icon with the new icon. If they differ, it means a
-        new icon has been uploaded. When a new icon is uploaded, the function deletes the old
-        icon file from the filesystem. It's important to note that the `delete` method of a
-        FileField takes an optional `save` argument. By default, `save` is `True`, and it will save
-        the model after deleting the associated file. In this case, however, we pass `save=False`
-        to the `delete` method to avoid an unnecessary additional database write, as we are about
-        to save the model ourselves in the next step.
+        The values the server was loaded with are snapshotted in `from_db` (see `DirtyFieldsMixin`),
+        so the function can tell which images changed without fetching the row again. Only for those
+        is the old file deleted, or, if the upload has the same content as the stored image, the
+        stored one kept (see `replace_changed_images`).
 
         Finally, the original save method is called through the use of `super()` to save the
-        changes (including the new icon) to the database.
+        changes to the database, and new images are run through the image pipeline. Saves that only
+        change the name or description never process the images again.
+
+        All of it runs in one transaction: released files are only deleted once it commits (see
+        `media_blobs.release_blobs`), so a save that fails never leaves the row pointing at an
+        image that is gone.
 
         Args:
             *args: Variable length argument list.
             **kwargs: Arbitrary keyword arguments.
         """
-        if self.id:
-            existing = get_object_or_404(Server, id=self.id)
-            if existing.icon != self.icon:
-                existing.icon.delete(save=False)
-            if existing.banner_img != self.banner_img:
-                existing.banner_img.delete(save=False)
+        # No savepoint of its own when nested, like `Model.save_base`
+        with transaction.atomic(savepoint=False):
+            replace_changed_images(self, ["banner_img", "icon"])
 
-        super(Server, self).save(*args, **kwargs)
+            super(Server, self).save(*args, **kwargs)
 
-        if self.banner_img:
-            scale_down_image(self.banner_img.path)
-            
-        if self.icon:
-            scale_down_icon(self.icon.path)
-            # Re-validate the icon size
-            validate_icon_image_size(self.icon)
+            # Images are scaled and their variants generated by the pipeline (see `image_pipeline.py`).
+            # In background mode they are handed to the worker and the server is flagged as
+            # processing until the scaled files are swapped in.
+            from .image_pipeline import enqueue_image_jobs, process_inline
+
+            if getattr(settings, "SERVER_IMAGE_PROCESSING", "inline") == "background":
+                enqueue_image_jobs(self, ["banner_img", "icon"])
+            else:
+                process_inline(self, "banner_img")
+
+                if process_inline(self, "icon"):
+                    # Re-validate the icon size
+                    validate_icon_image_size(self.icon)
+
+        self.take_snapshot()
 
     def __str__(self):
         return self.name
@@ -252,15 +424,11 @@ class Server(models.Model):
         but it's a good practice to follow when dealing with larger sets of data.
 
         For each field in the instance's fields, the function checks if the field's name is in the set
-        of names. If it is, the function tries to get the value of that field (i.e., the associated file)
-        using the `getattr` function. If the field has a value, the function deletes the file from the
-        file system by calling the `delete` method on the field's value.
+        of names. If it is, the file of that field and its variants are released (see `release_media`).
 
-        The `delete` method of a `FileField` (or an `ImageField`) in Django deletes the file from the file
-        system. The method takes an optional `save` argument, which defaults to `True`. This argument
-        determines whether to save the model after deleting the associated file. However, since the instance
-        is about to be deleted from the database, there's no need to save it. Therefore, we pass `save=False`
-        to avoid an unnecessary database operation.
+        Processed images are shared content-addressed blobs (see `media_blobs.py`): releasing one only
+        deletes the file once no other server or category points at it, and the default images are
+        never deleted.
 
         Args:
             sender (Model): The model class that sent the signal.
@@ -271,9 +439,9 @@ class Server(models.Model):
         for field in instance._meta.fields:
             if field.name in field_names_to_check:
                 file = getattr(instance, field.name)
+                release_media([file.name, *stored_variant_names(getattr(instance, f"{field.name}_variants"))])
                 if file:
-                    file.delete(save=False)
-                    logger.info(f"Deleted {field.name} for server {instance.id}")
+                    logger.info(f"Released {field.name} for server {instance.id}")
 
 
 class Channel(models.Model):
@@ -318,6 +486,190 @@ class Channel(models.Model):
         return self.name
 
 
+class ImageJob(models.Model):
+    """
+    A queued image processing task, run by the `run_image_worker` management command.
+
+    Jobs are persisted so that uploads can return straight away and nothing is lost when a
+    worker restarts: a job left in "processing" by a dead worker is picked up again once it
+    has been locked for longer than `SERVER_IMAGE_JOB_TIMEOUT` seconds.
+
+    Attributes:
+        model (str): Label of the model owning the image, e.g. "server.server".
+        object_id (int): Primary key of the instance owning the image.
+        field_name (str): Name of the image field on that instance.
+        file_name (str): The stored file name when the job was queued. If the field points at
+            another file by the time the job runs, the job is superseded and skipped.
+        status (str): One of pending, processing, done or failed.
+        attempts (int): How many times a worker has started the job.
+        error (str): The last error raised while processing.
+        created_at (datetime): When the job was queued.
+        locked_at (datetime): When a worker last claimed the job.
+    """
+    PENDING = "pending"
+    PROCESSING = "processing"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (PROCESSING, "Processing"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    ]
+
+    model = models.CharField(
+        max_length=100,
+        verbose_name="Model",
+        help_text="Label of the model owning the image, e.g. server.server."
+    )
+    object_id = models.PositiveBigIntegerField(
+        verbose_name="Object ID",
+        help_text="Primary key of the instance owning the image."
+    )
+    field_name = models.CharField(
+        max_length=50,
+        verbose_name="Field Name",
+        help_text="Name of the image field to process."
+    )
+    file_name = models.CharField(
+        max_length=255,
+        verbose_name="File Name",
+        help_text="The stored file name when the job was queued."
+    )
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default=PENDING,
+        verbose_name="Status",
+        help_text="Where the job is in its lifecycle."
+    )
+    attempts = models.PositiveSmallIntegerField(
+        default=0,
+        verbose_name="Attempts",
+        help_text="How many times a worker has started the job."
+    )
+    error = models.TextField(
+        blank=True,
+        default="",
+        verbose_name="Error",
+        help_text="The last error raised while processing."
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name="Created At",
+        help_text="When the job was queued."
+    )
+    locked_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name="Locked At",
+        help_text="When a worker last claimed the job."
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "id"], name="imagejob_status_id_idx"),
+            models.Index(fields=["model", "object_id"], name="imagejob_object_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.model}:{self.object_id}.{self.field_name} ({self.status})"
+
+
+class SpriteSheet(models.Model):
+    """
+    A sprite sheet packing many small images into one file, so a list of icons costs a single
+    image request (see `sprites.py`).
+
+    Images sit in a grid of square cells. Each owner keeps its cell for as long as it exists,
+    so replacing one image only repaints that cell, and the cells of deleted owners are reused.
+
+    Attributes:
+        name (str): What the sheet holds, e.g. "categories".
+        image (str): Storage name of the sheet, a content-addressed blob (see `media_blobs.py`).
+        cell_size (int): Width and height of a cell in pixels.
+        columns (int): Number of cells per row.
+        rows (int): Number of rows of cells in the image; it grows but never shrinks.
+        slots (dict): Owner primary key (as a string) -> cell index.
+        updated_at (datetime): When the sheet was last repainted.
+    """
+    name = models.CharField(
+        max_length=50,
+        unique=True,
+        verbose_name="Name",
+        help_text="What the sheet holds, e.g. categories."
+    )
+    image = models.CharField(
+        max_length=255,
+        blank=True,
+        default="",
+        verbose_name="Image",
+        help_text="Storage name of the sheet image."
+    )
+    cell_size = models.PositiveSmallIntegerField(
+        verbose_name="Cell Size",
+        help_text="Width and height of a cell in pixels."
+    )
+    columns = models.PositiveSmallIntegerField(
+        verbose_name="Columns",
+        help_text="Number of cells per row."
+    )
+    rows = models.PositiveSmallIntegerField(
+        default=0,
+        verbose_name="Rows",
+        help_text="Number of rows of cells in the image."
+    )
+    slots = models.JSONField(
+        default=dict,
+        blank=True,
+        verbose_name="Slots",
+        help_text="Owner primary key -> cell index."
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name="Updated At",
+        help_text="When the sheet was last repainted."
+    )
+
+    def __str__(self):
+        return f"{self.name} sprite sheet ({len(self.slots)} images)"
+
+
+class MediaBlob(models.Model):
+    """
+    A content-addressed media file, shared by every image field and variant with that content.
+
+    Processed images are stored under a name derived from the SHA-256 of their bytes (see
+    `media_blobs.py`), so identical images are kept once however many servers or categories use
+    them. `refcount` counts the references to the file; it is only deleted once the last one is
+    released.
+
+    Attributes:
+        name (str): Storage name of the file, e.g. "blobs/ab/ab12...ef.webp".
+        refcount (int): Number of image fields and variants pointing at the file.
+        created_at (datetime): When the content was first stored.
+    """
+    name = models.CharField(
+        max_length=255,
+        unique=True,
+        verbose_name="Name",
+        help_text="Storage name of the file, derived from the hash of its content."
+    )
+    refcount = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Reference Count",
+        help_text="Number of image fields and variants pointing at the file."
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name="Created At",
+        help_text="When the content was first stored."
+    )
+
+    def __str__(self):
+        return f"{self.name} ({self.refcount} references)"
+
+
         #  SUMMARY
 
 """Upload Path Functions: category_icon_upload_path, channel_icon_upload_path,
@@ -1,11 +1,42 @@
+from django.core.files.storage import default_storage
 from rest_framework import serializers
 from .models import Category, Server, Channel
-from typing import Dict, Any
+from typing import Dict, Any, Optional
+from .sprites import sprite_coordinates
+from .utils.image_variants import srcset_map
 
 class CategorySerializer(serializers.ModelSerializer):
+    """
+    Serializes every Category field, except that the stored icon variants are exposed as
+    `icon_srcset`: a map of format -> srcset string (None until variants exist).
+    `icon_placeholder` holds a BlurHash and a dominant colour to paint until the icon loads
+    ({} until the icon has been processed), and `icon_sprite` the icon's position in the
+    category sprite sheet, when the sheet is given in the serializer context.
+    """
+    icon_srcset = serializers.SerializerMethodField()
+    icon_sprite = serializers.SerializerMethodField()
+
     class Meta:
         model = Category
-        fields = "__all__"
+        exclude = ("icon_variants",)
+
+    def get_icon_srcset(self, obj) -> Optional[Dict[str, str]]:
+        return srcset_map(obj.icon_variants)
+
+    def get_icon_sprite(self, obj) -> Optional[Dict[str, Any]]:
+        """
+        The icon's place in the category sprite sheet passed in the "sprite" context (see
+        `sprites.py`): `{"url", "sheet_width", "sheet_height", "x", "y", "width", "height"}`.
+        """
+        sheet = self.context.get("sprite")
+        if sheet is None or not sheet.image or str(obj.pk) not in sheet.slots:
+            return None
+        return {
+            "url": default_storage.url(sheet.image),
+            "sheet_width": sheet.columns * sheet.cell_size,
+            "sheet_height": sheet.rows * sheet.cell_size,
+            **sprite_coordinates(sheet, sheet.slots[str(obj.pk)]),
+        }
 
 class ChannelSerializer(serializers.ModelSerializer):
     class Meta:
@@ -15,18 +46,26 @@ class ChannelSerializer(serializers.ModelSerializer):
 
 class ServerSerializer(serializers.ModelSerializer):
     """
-    Excludes the 'member' field. Also includes the 'num_members' field which is 
-    a count of the number of members on the server. This field is added in a view 
-    and is optional, so it is only included in the serialized data if it is not None.
+    Excludes the 'member' and 'member_count' fields. Also includes the 'num_members' field which is 
+    a count of the number of members on the server. This field is added in a view (from the
+    stored member_count column) and is optional, so it is only included in the serialized data
+    if it is not None.
 
-    In addition, it includes related Channel objects.
+    In addition, it includes related Channel objects, and exposes the stored image variants as
+    `banner_img_srcset` and `icon_srcset`: maps of format -> srcset string, e.g.
+    {"webp": "/media/...-1x.webp 1x, /media/...-2x.webp 2x", "png": "..."}.
+    They are None until the variants exist; clients then fall back to `banner_img` / `icon`.
+    `banner_img_placeholder` and `icon_placeholder` hold a BlurHash and a dominant colour
+    ({"blurhash": "LA3fd_...", "color": "#1e88e5"}) to paint until the images load.
     """
     num_members = serializers.SerializerMethodField()
     channel_server = ChannelSerializer(many=True)
     category = serializers.StringRelatedField() # returns the name instead of the
+    banner_img_srcset = serializers.SerializerMethodField()
+    icon_srcset = serializers.SerializerMethodField()
     class Meta:
         model = Server
-        exclude = ("members",)
+        exclude = ("members", "member_count", "banner_img_variants", "icon_variants")
         
     def get_num_members(self, obj) -> int:
         """
@@ -35,6 +74,12 @@ class ServerSerializer(serializers.ModelSerializer):
         """
         return getattr(obj, "num_members", None)
 
+    def get_banner_img_srcset(self, obj) -> Optional[Dict[str, str]]:
+        return srcset_map(obj.banner_img_variants)
+
+    def get_icon_srcset(self, obj) -> Optional[Dict[str, str]]:
+        return srcset_map(obj.icon_variants)
+
     
     def to_representation(self, instance) -> Dict[str, Any]:
         """
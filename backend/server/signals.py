@@ -0,0 +1,96 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .cache import CATEGORY_LISTING, SERVER_LISTING, bump_listing_version
+from .member_counts import add_members, recount_members
+from .models import Category, Channel, Server
+
+
+def invalidate_listings(*listings):
+    """
+    Bump the versions of the given listings now and again once the transaction commits.
+
+    The first bump keeps the saving request from reading its own stale listing; the second
+    one drops anything another request cached from the old rows before the commit.
+    """
+    bump_listing_version(*listings)
+    transaction.on_commit(lambda: bump_listing_version(*listings))
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def category_changed(sender, **kwargs):
+    """
+    Invalidate the category listing, and the server listing that shows category names.
+    """
+    invalidate_listings(CATEGORY_LISTING, SERVER_LISTING)
+
+
+@receiver(post_save, sender=Server)
+@receiver(post_delete, sender=Server)
+@receiver(post_save, sender=Channel)
+@receiver(post_delete, sender=Channel)
+def server_listing_changed(sender, **kwargs):
+    """
+    Invalidate server listings when a server or one of its channels changes.
+    """
+    invalidate_listings(SERVER_LISTING)
+
+
+@receiver(m2m_changed, sender=Server.members.through)
+def server_members_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Keep `Server.member_count` in step with the members join table and invalidate server
+    listings (by_user, num_members) when a membership changes.
+
+    Adds increment the counter by the number of rows Django actually inserted. Removes and
+    clears recount instead, because `pk_set` lists the ids asked for, not the rows deleted.
+    Changes can come from either side: `server.members` (instance is a Server) or
+    `user.server_set` (instance is a user, `pk_set` holds server ids).
+    """
+    if action == "pre_clear" and reverse:
+        # After the clear there is no way left to tell which servers the user was in
+        instance._cleared_server_ids = list(
+            Server.members.through.objects.filter(user_id=instance.pk).values_list("server_id", flat=True)
+        )
+        return
+
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+
+    if action == "post_add":
+        if pk_set:
+            if reverse:
+                add_members(pk_set)
+            else:
+                add_members([instance.pk], len(pk_set))
+    elif action == "post_remove":
+        recount_members(pk_set if reverse else [instance.pk])
+    else:
+        recount_members(instance.__dict__.pop("_cleared_server_ids", []) if reverse else [instance.pk])
+
+    invalidate_listings(SERVER_LISTING)
+
+
+@receiver(pre_delete, sender=settings.AUTH_USER_MODEL)
+def remember_deleted_user_servers(sender, instance, **kwargs):
+    """
+    Note the servers of a user about to be deleted. Their memberships are removed by the
+    cascade, which sends no m2m_changed (nor delete signals for the auto-created through model).
+    """
+    instance._member_server_ids = list(
+        Server.members.through.objects.filter(user_id=instance.pk).values_list("server_id", flat=True)
+    )
+
+
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def recount_deleted_user_servers(sender, instance, **kwargs):
+    """
+    Recount the members of the servers a deleted user belonged to.
+    """
+    server_ids = instance.__dict__.pop("_member_server_ids", [])
+    if server_ids:
+        recount_members(server_ids)
+        invalidate_listings(SERVER_LISTING)
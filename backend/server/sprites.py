@@ -0,0 +1,203 @@
+import logging
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image
+
+from .cache import CATEGORY_LISTING, bump_listing_version
+from .media_blobs import intern_file, release_blobs
+from .models import Category, SpriteSheet
+from .utils.image_processors import ICON_SIZE
+
+# Set up the logger
+logger = logging.getLogger(__name__)
+
+CATEGORY_SPRITE = "categories"
+
+
+def _blank_sheet(cell_size, columns, rows):
+    return Image.new("RGBA", (cell_size * columns, cell_size * max(rows, 1)), (0, 0, 0, 0))
+
+
+def _open_sheet(sheet):
+    # The current sheet image, or None if there is none yet (or it went missing)
+    if not sheet.image or not default_storage.exists(sheet.image):
+        return None
+    with Image.open(default_storage.path(sheet.image)) as img:
+        return img.convert("RGBA")
+
+
+def cell_box(sheet, index):
+    """
+    Returns the (left, top, right, bottom) pixel box of a cell.
+    """
+    left = (index % sheet.columns) * sheet.cell_size
+    top = (index // sheet.columns) * sheet.cell_size
+    return left, top, left + sheet.cell_size, top + sheet.cell_size
+
+
+def paint_cell(canvas, sheet, index, image_path):
+    """
+    Clears a cell and, if `image_path` is given, draws the image centred in it, scaled down to
+    fit. An image that cannot be read leaves the cell empty.
+    """
+    box = cell_box(sheet, index)
+    canvas.paste((0, 0, 0, 0), box)
+    if not image_path:
+        return
+    try:
+        with Image.open(image_path) as img:
+            icon = img.convert("RGBA")
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not add {image_path} to the {sheet.name} sprite sheet: {e}")
+        return
+    icon.thumbnail((sheet.cell_size, sheet.cell_size), Image.LANCZOS)
+    canvas.paste(icon, (box[0] + (sheet.cell_size - icon.width) // 2, box[1] + (sheet.cell_size - icon.height) // 2))
+
+
+def _save_sheet(sheet, canvas):
+    # Store the new sheet as a blob, so its URL changes with its content and can be cached
+    # forever. The previous one is only released once the new one is committed: releasing it
+    # under the sheet lock would delete it even if the transaction rolls back
+    fd, tmp_path = tempfile.mkstemp(dir=settings.MEDIA_ROOT, prefix=".tmp-", suffix=".png")
+    os.close(fd)
+    try:
+        canvas.save(tmp_path, format="PNG", optimize=True)
+        name = intern_file(tmp_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+    previous = sheet.image
+    sheet.image = name
+    sheet.rows = canvas.height // sheet.cell_size
+    sheet.save()
+    transaction.on_commit(lambda: release_blobs([previous]))
+
+
+def _icon_path(category):
+    return category.icon.path if category.icon else None
+
+
+def _locked_category_sheet():
+    sheet, _ = SpriteSheet.objects.select_for_update().get_or_create(
+        name=CATEGORY_SPRITE, defaults={"cell_size": ICON_SIZE[0], "columns": 8}
+    )
+    return sheet
+
+
+def rebuild_category_sprite():
+    """
+    Repaints the category sprite sheet from scratch, one cell per category in id order.
+
+    Used when there is no sheet yet or its image went missing, and by the
+    `rebuild_category_sprite` command.
+
+    Returns:
+        SpriteSheet: The rebuilt sheet.
+    """
+    with transaction.atomic():
+        sheet = _locked_category_sheet()
+        categories = list(Category.objects.order_by("id"))
+        sheet.slots = {str(category.pk): index for index, category in enumerate(categories)}
+
+        canvas = _blank_sheet(sheet.cell_size, sheet.columns, -(-len(categories) // sheet.columns))
+        for index, category in enumerate(categories):
+            paint_cell(canvas, sheet, index, _icon_path(category))
+        _save_sheet(sheet, canvas)
+
+    bump_listing_version(CATEGORY_LISTING)
+    logger.info(f"Rebuilt the category sprite sheet with {len(categories)} icons")
+    return sheet
+
+
+def update_category_sprite(category):
+    """
+    Repaints the cell of one category after its icon changed, leaving every other cell as is.
+
+    A new category takes the first free cell, growing the sheet by a row when all are taken.
+    The sheet row is locked while it is repainted, so concurrent saves never lose each other's
+    cells.
+
+    Args:
+        category (Category): The saved category.
+    """
+    with transaction.atomic():
+        sheet = _locked_category_sheet()
+        canvas = _open_sheet(sheet)
+        if canvas is None:
+            # First category (or a lost image): paint every cell instead
+            rebuild_category_sprite()
+            return
+
+        key = str(category.pk)
+        if key not in sheet.slots:
+            taken = set(sheet.slots.values())
+            sheet.slots[key] = next(index for index in range(len(taken) + 1) if index not in taken)
+
+        index = sheet.slots[key]
+        rows = index // sheet.columns + 1
+        if rows * sheet.cell_size > canvas.height:
+            grown = _blank_sheet(sheet.cell_size, sheet.columns, rows)
+            grown.paste(canvas, (0, 0))
+            canvas = grown
+
+        paint_cell(canvas, sheet, index, _icon_path(category))
+        _save_sheet(sheet, canvas)
+
+    bump_listing_version(CATEGORY_LISTING)
+
+
+def remove_from_category_sprite(category_id):
+    """
+    Clears the cell of a deleted category and frees it for the next new category.
+    """
+    with transaction.atomic():
+        sheet = SpriteSheet.objects.select_for_update().filter(name=CATEGORY_SPRITE).first()
+        if sheet is None or str(category_id) not in sheet.slots:
+            return
+
+        index = sheet.slots.pop(str(category_id))
+        canvas = _open_sheet(sheet)
+        if canvas is None:
+            sheet.save()
+            return
+        paint_cell(canvas, sheet, index, None)
+        _save_sheet(sheet, canvas)
+
+
+def sprite_map(sheet):
+    """
+    Returns the coordinate map of a sheet, as served to clients.
+
+    Returns:
+        dict: `{"url", "width", "height", "cell_size", "icons": {pk: {"x", "y", "width", "height"}}}`,
+        or None if the sheet has no image yet.
+    """
+    if sheet is None or not sheet.image:
+        return None
+    return {
+        "url": default_storage.url(sheet.image),
+        "width": sheet.columns * sheet.cell_size,
+        "height": sheet.rows * sheet.cell_size,
+        "cell_size": sheet.cell_size,
+        "icons": {pk: sprite_coordinates(sheet, index) for pk, index in sheet.slots.items()},
+    }
+
+
+def sprite_coordinates(sheet, index):
+    """
+    Returns the position of one cell, e.g. `{"x": 70, "y": 0, "width": 70, "height": 70}`.
+    """
+    left, top, _, _ = cell_box(sheet, index)
+    return {"x": left, "y": top, "width": sheet.cell_size, "height": sheet.cell_size}
+
+
+def get_category_sprite():
+    """
+    Returns the category sprite sheet, or None if it was never built.
+    """
+    return SpriteSheet.objects.filter(name=CATEGORY_SPRITE).first()
@@ -1,3 +1,714 @@
-from django.test import TestCase
+import os
+import shutil
+import struct
+import tempfile
+import zlib
+from io import BytesIO, StringIO
+from unittest.mock import patch
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DatabaseError, connection, transaction
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image, ImageSequence
+from rest_framework.test import APIClient
+
+from .image_pipeline import store_variants
+from .media_blobs import IMMUTABLE_CACHE_CONTROL, serve_media
+from .models import Category, Channel, ImageJob, MediaBlob, Server
+from .serializers import ServerSerializer
+from .sprites import cell_box, get_category_sprite, paint_cell
+from .utils.animated_image import iter_scaled_frames, write_animated_gif
+from .utils.image_path import default_category_icon
+from .utils.image_placeholder import BASE83_CHARACTERS, encode_blurhash
+from .utils.image_probe import LIMITS, ImageBudgetExceeded, ImageInfo, check_image_budget, count_gif_frames, probe_image
+from .utils.image_processors import process_image
+from .utils.image_variants import stored_variant_names
+from .utils.scale_image import scale_down_image
+from .validators.image_validators import validate_image_budget
+
+
+class TemporaryMediaMixin:
+    """
+    Points MEDIA_ROOT at a throwaway copy of the media directory, so uploads and generated
+    variants never touch the real one.
+    """
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        shutil.copytree(settings.MEDIA_ROOT, media_root, dirs_exist_ok=True)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+
+
+class ServerListQueryCountTests(TemporaryMediaMixin, TestCase):
+    """
+    Benchmark for the server listing: the number of queries must stay the same however
+    many servers (each with its own channels and category) are listed.
+    """
+
+    def setUp(self):
+        super().setUp()
+        # Reseed the listing versions so nothing cached by an earlier test can be served
+        cache.clear()
+        self.user = get_user_model().objects.create(username="owner")
+        self.client = APIClient(SERVER_NAME="localhost")
+        self.client.force_authenticate(self.user)
+        self.server_count = 0
+
+    def add_servers(self, count, channels_per_server=3):
+        for _ in range(count):
+            i = self.server_count
+            category = Category.objects.create(name=f"category{i}")
+            server = Server.objects.create(name=f"server{i}", owner=self.user, category=category)
+            server.members.add(self.user)
+            for j in range(channels_per_server):
+                Channel.objects.create(name=f"channel{j}", owner=self.user, topic="topic", server=server)
+            self.server_count += 1
+
+    def count_queries(self, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/server/select/", params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), self.server_count)
+        return len(queries)
+
+    def assert_query_count_is_constant(self, **params):
+        self.add_servers(1)
+        baseline = self.count_queries(**params)
+
+        self.add_servers(49)
+        self.assertEqual(self.count_queries(**params), baseline)
+
+    def test_query_count_is_constant_as_servers_grow(self):
+        self.assert_query_count_is_constant()
+
+    def test_query_count_is_constant_with_by_user_and_num_members(self):
+        self.assert_query_count_is_constant(by_user="true", with_num_members="true")
+
+    def test_by_user_lists_only_servers_the_user_is_a_member_of(self):
+        self.add_servers(2)
+        other = get_user_model().objects.create(username="other")
+        Server.objects.get(name="server0").members.add(other)
+
+        self.client.force_authenticate(other)
+        response = self.client.get("/api/server/select/", {"by_user": "true", "with_num_members": "true"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(s["name"], s["num_members"]) for s in response.json()], [("server0", 2)])
+
+    def test_repeated_listing_is_served_from_cache(self):
+        self.add_servers(2)
+        self.client.get("/api/server/select/", {"category": "category0"})
+
+        with self.assertNumQueries(0):
+            response = self.client.get("/api/server/select/", {"category": "category0"})
+        self.assertEqual(len(response.json()), 1)
+
+        Channel.objects.create(name="new", owner=self.user, topic="topic", server=Server.objects.get(name="server0"))
+        response = self.client.get("/api/server/select/", {"category": "category0"})
+        self.assertEqual(len(response.json()[0]["channel_server"]), 4)
+
+    def test_category_listing_is_invalidated_on_change(self):
+        self.add_servers(1)
+        self.assertEqual([c["name"] for c in self.client.get("/api/server/category/").json()], ["category0"])
+
+        with self.assertNumQueries(0):
+            self.client.get("/api/server/category/")
+
+        Category.objects.create(name="Games")
+        self.assertEqual(
+            [c["name"] for c in self.client.get("/api/server/category/").json()], ["games", "category0"]
+        )
+
+
+class MemberCountTests(TemporaryMediaMixin, TestCase):
+    """
+    Server.member_count must follow every kind of membership change.
+    """
+
+    def setUp(self):
+        super().setUp()
+        User = get_user_model()
+        self.users = [User.objects.create(username=f"user{i}") for i in range(3)]
+        category = Category.objects.create(name="category")
+        self.servers = [
+            Server.objects.create(name=f"server{i}", owner=self.users[0], category=category) for i in range(2)
+        ]
+
+    def assertCounts(self, *expected):
+        counts = [Server.objects.get(pk=server.pk).member_count for server in self.servers]
+        self.assertEqual(counts, list(expected))
+
+    def test_changes_from_the_server_side(self):
+        server = self.servers[0]
+        server.members.add(*self.users)
+        server.members.add(self.users[0])  # already a member
+        self.assertCounts(3, 0)
+
+        server.members.remove(self.users[0], self.users[0])
+        self.assertCounts(2, 0)
+
+        server.members.clear()
+        self.assertCounts(0, 0)
+
+    def test_changes_from_the_user_side(self):
+        user = self.users[0]
+        user.server_set.add(*self.servers)
+        self.servers[0].members.add(self.users[1])
+        self.assertCounts(2, 1)
+
+        user.server_set.remove(self.servers[1])
+        self.assertCounts(2, 0)
+
+        self.servers[1].members.add(user)
+        user.server_set.clear()
+        self.assertCounts(1, 0)
+
+    def test_deleting_a_user_updates_their_servers(self):
+        self.servers[0].members.add(*self.users[1:])
+        self.users[2].delete()
+        self.assertCounts(1, 0)
+
+    def test_reconcile_command_repairs_drift(self):
+        self.servers[0].members.add(*self.users)
+        Server.objects.filter(pk=self.servers[0].pk).update(member_count=7)
+
+        call_command("reconcile_member_counts", "--dry-run", stdout=StringIO())
+        self.assertCounts(7, 0)
+
+        call_command("reconcile_member_counts", stdout=StringIO())
+        self.assertCounts(3, 0)
+
+
+@override_settings(SERVER_IMAGE_PROCESSING="background")
+class BackgroundImageProcessingTests(TemporaryMediaMixin, TestCase):
+    """
+    In background mode, uploads are queued and scaled by the image worker.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.user = get_user_model().objects.create(username="owner")
+        self.category = Category.objects.create(name="category")
+
+    def upload(self, name, size, color=(200, 30, 30)):
+        buffer = BytesIO()
+        Image.new("RGB", size, color).save(buffer, format="PNG")
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type="image/png")
+
+    def test_upload_is_queued_then_scaled_by_the_worker(self):
+        server = Server.objects.create(
+            name="server", owner=self.user, category=self.category, banner_img=self.upload("banner.png", (1200, 900))
+        )
+
+        # The request returns with the original file and a pending flag
+        server.refresh_from_db()
+        self.assertTrue(server.images_pending)
+        with Image.open(server.banner_img.path) as img:
+            self.assertEqual(img.size, (1200, 900))
+        self.assertEqual(ImageJob.objects.get().status, ImageJob.PENDING)
+
+        call_command("run_image_worker", "--once", "--processes", "1")
+
+        server.refresh_from_db()
+        self.assertFalse(server.images_pending)
+        with Image.open(server.banner_img.path) as img:
+            self.assertEqual(img.size, (400, 400))
+        self.assertEqual(set(server.banner_img_variants["formats"]["webp"]), {"1x", "2x", "3x"})
+        self.assertEqual(ImageJob.objects.get().status, ImageJob.DONE)
+
+    def test_replaced_file_supersedes_the_queued_job(self):
+        server = Server.objects.create(
+            name="server", owner=self.user, category=self.category, banner_img=self.upload("first.png", (800, 800))
+        )
+        server.banner_img = self.upload("second.png", (800, 800), color=(30, 200, 30))
+        server.save()
+
+        statuses = dict(ImageJob.objects.values_list("file_name", "status"))
+        self.assertEqual(sorted(statuses.values()), [ImageJob.DONE, ImageJob.PENDING])
+
+        call_command("run_image_worker", "--once", "--processes", "1")
+        self.assertFalse(ImageJob.objects.exclude(status=ImageJob.DONE).exists())
+        self.assertFalse(Server.objects.get(pk=server.pk).images_pending)
+
+
+    def test_failure_to_store_is_retried_without_stopping_the_worker(self):
+        server = Server.objects.create(
+            name="server", owner=self.user, category=self.category, banner_img=self.upload("banner.png", (1200, 900))
+        )
+        calls = []
+
+        def store_once_the_database_is_back(*args):
+            calls.append(args)
+            if len(calls) == 1:
+                raise DatabaseError("database is down")
+            return store_variants(*args)
+
+        with patch("server.image_pipeline.store_variants", side_effect=store_once_the_database_is_back):
+            with self.assertLogs("server.image_pipeline", "ERROR"):
+                call_command("run_image_worker", "--once", "--processes", "1")
+
+        job = ImageJob.objects.get()
+        self.assertEqual((job.status, job.attempts), (ImageJob.DONE, 2))
+        server.refresh_from_db()
+        self.assertFalse(server.images_pending)
+        self.assertTrue(server.banner_img.name.startswith("blobs/"))
+
+class ImageVariantTests(TemporaryMediaMixin, TestCase):
+    """
+    Uploads get 1x/2x/3x renditions in modern formats, exposed as srcset maps.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.user = get_user_model().objects.create(username="owner")
+        self.category = Category.objects.create(name="category")
+
+    def upload(self, name, size, color=(20, 120, 200)):
+        buffer = BytesIO()
+        Image.new("RGB", size, color).save(buffer, format="PNG")
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type="image/png")
+
+    def test_banner_variants_are_generated_from_the_original(self):
+        server = Server.objects.create(
+            name="server", owner=self.user, category=self.category, banner_img=self.upload("banner.png", (1500, 1000))
+        )
+
+        formats = server.banner_img_variants["formats"]
+        self.assertEqual(set(formats["webp"]), {"1x", "2x", "3x"})
+        self.assertEqual(set(formats["png"]), {"1x", "2x", "3x"})
+        with Image.open(os.path.join(settings.MEDIA_ROOT, formats["webp"]["3x"])) as img:
+            self.assertEqual(img.size, (1200, 800))
+
+        srcset = ServerSerializer(server).data["banner_img_srcset"]
+        self.assertRegex(srcset["webp"], r"^/media/blobs/\S+\.webp 1x, /media/blobs/\S+\.webp 2x, /media/blobs/\S+\.webp 3x$")
+
+    def test_small_sources_are_not_upscaled(self):
+        server = Server.objects.create(
+            name="server", owner=self.user, category=self.category, icon=self.upload("icon.png", (100, 100))
+        )
+        self.assertEqual(set(server.icon_variants["formats"]["webp"]), {"1x"})
+
+    def test_unchanged_image_is_not_processed_again(self):
+        server = Server.objects.create(
+            name="server", owner=self.user, category=self.category, banner_img=self.upload("banner.png", (900, 900))
+        )
+        variants = Server.objects.get(pk=server.pk).banner_img_variants
+
+        server = Server.objects.get(pk=server.pk)
+        server.name = "renamed"
+        with self.assertNumQueries(1):
+            server.save()
+        self.assertEqual(Server.objects.get(pk=server.pk).banner_img_variants, variants)
+
+    def test_reupload_of_the_same_image_keeps_the_stored_file(self):
+        server = Server.objects.create(
+            name="server", owner=self.user, category=self.category, banner_img=self.upload("banner.png", (900, 900))
+        )
+        server = Server.objects.get(pk=server.pk)
+        stored_name = server.banner_img.name
+
+        server.banner_img = self.upload("banner.png", (900, 900))
+        server.save()
+        self.assertEqual(Server.objects.get(pk=server.pk).banner_img.name, stored_name)
+        self.assertTrue(os.path.isfile(server.banner_img.path))
+
+        server.banner_img = self.upload("banner.png", (900, 900), color=(0, 0, 0))
+        with self.captureOnCommitCallbacks(execute=True):
+            server.save()
+        self.assertNotEqual(server.banner_img.name, stored_name)
+        self.assertFalse(os.path.isfile(os.path.join(settings.MEDIA_ROOT, stored_name)))
+
+
+class ImageBudgetTests(TestCase):
+    """
+    Oversized images are rejected from their headers, before anything decodes them.
+    """
+
+    def png_header(self, width, height):
+        # A header claiming the given size, with no pixel data at all
+        def chunk(kind, data):
+            return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+        ihdr = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+        return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", ihdr) + chunk(b"IDAT", b"") + chunk(b"IEND", b"")
+
+    def gif(self, frames):
+        buffer = BytesIO()
+        images = [Image.new("RGB", (16, 16), (index * 20, 0, 0)) for index in range(frames)]
+        images[0].save(buffer, format="GIF", save_all=True, append_images=images[1:], duration=50)
+        return buffer.getvalue()
+
+    def test_huge_dimensions_are_rejected_without_decoding(self):
+        upload = SimpleUploadedFile("large.png", self.png_header(6000, 5000), content_type="image/png")
+        with self.assertRaisesMessage(ValidationError, "6000x5000"):
+            validate_image_budget(upload)
+        self.assertEqual(upload.tell(), 0)
+
+        # Far over the budget, PIL's own guard refuses to even open it
+        with self.assertRaisesMessage(ValidationError, "too large"):
+            validate_image_budget(SimpleUploadedFile("bomb.png", self.png_header(40000, 40000)))
+
+    def test_gif_frames_are_counted_from_the_block_structure(self):
+        data = self.gif(12)
+        self.assertEqual(count_gif_frames(BytesIO(data)), 12)
+        self.assertEqual(count_gif_frames(BytesIO(data), limit=5), 6)
+        self.assertEqual(probe_image(BytesIO(data)), ImageInfo("GIF", 16, 16, 12))
+
+    @override_settings(SERVER_IMAGE_MAX_FRAMES=10)
+    def test_frame_budget(self):
+        validate_image_budget(SimpleUploadedFile("ok.gif", self.gif(10), content_type="image/gif"))
+        with self.assertRaisesMessage(ValidationError, "more than 10 frames"):
+            validate_image_budget(SimpleUploadedFile("long.gif", self.gif(11), content_type="image/gif"))
+
+    def test_worker_refuses_images_over_the_budget(self):
+        with tempfile.NamedTemporaryFile(suffix=".png") as fp:
+            Image.new("RGB", (300, 300)).save(fp, format="PNG")
+            fp.flush()
+            with self.assertRaises(ImageBudgetExceeded):
+                check_image_budget(probe_image(fp.name), max_pixels=200 * 200)
+            with patch.dict(LIMITS, max_pixels=200 * 200):
+                with self.assertRaises(ImageBudgetExceeded):
+                    process_image("banner", fp.name)
+
+
+class AnimatedGifScalingTests(TestCase):
+    """
+    GIF banners are scaled frame by frame, keeping their timing.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, "banner.gif")
+
+    def write_gif(self, colors, durations):
+        frames = [Image.new("RGB", (800, 600), color) for color in colors]
+        with open(self.path, "wb") as fp:
+            # Written frame by frame so the duplicates are kept in the source
+            write_animated_gif(zip((frame.convert("RGBA") for frame in frames), durations), fp, (800, 600))
+
+    def read_gif(self):
+        with Image.open(self.path) as img:
+            return img.size, [frame.info["duration"] for frame in ImageSequence.Iterator(img)]
+
+    def test_frames_are_scaled_with_their_own_durations(self):
+        red, green, blue = (200, 0, 0), (0, 200, 0), (0, 0, 200)
+        self.write_gif([red, green, green, green, blue], [30, 40, 50, 60, 70])
+
+        scale_down_image(self.path, max_size=(400, 400), raise_errors=True)
+
+        size, durations = self.read_gif()
+        self.assertEqual(size, (400, 400))
+        # The three identical green frames become one lasting as long as all three
+        self.assertEqual(durations, [30, 150, 70])
+        with Image.open(self.path) as img:
+            img.seek(1)
+            frame = img.convert("RGBA")
+            self.assertEqual(frame.getpixel((0, 0))[3], 0)
+            self.assertEqual(frame.getpixel((200, 200)), (0, 200, 0, 255))
+
+    def test_frame_count_is_capped(self):
+        self.write_gif([(index * 20, 0, 0) for index in range(10)], [50] * 10)
+
+        with Image.open(self.path) as img:
+            with open(os.path.join(self.directory, "out.gif"), "wb") as fp:
+                written = write_animated_gif(iter_scaled_frames(img, (100, 100), max_frames=4), fp, (100, 100))
+        self.assertEqual(written, 4)
+
+
+class MediaBlobTests(TemporaryMediaMixin, TestCase):
+    """
+    Processed images are stored once per content and deleted with their last reference.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.user = get_user_model().objects.create(username="owner")
+        self.category = Category.objects.create(name="category")
+
+    def upload(self, name="logo.png", color=(90, 40, 160)):
+        buffer = BytesIO()
+        Image.new("RGB", (600, 600), color).save(buffer, format="PNG")
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type="image/png")
+
+    def create_server(self, name, **images):
+        return Server.objects.create(name=name, owner=self.user, category=self.category, **images)
+
+    def blob_names(self, server):
+        return {server.banner_img.name, *stored_variant_names(server.banner_img_variants)}
+
+    def test_identical_uploads_share_blobs_until_the_last_reference_goes(self):
+        first = self.create_server("first", banner_img=self.upload("a.png"))
+        with patch("server.image_pipeline.process_image") as process:
+            second = self.create_server("second", banner_img=self.upload("b.png"))
+        process.assert_not_called()
+
+        names = self.blob_names(first)
+        self.assertTrue(first.banner_img.name.startswith("blobs/"))
+        self.assertEqual(self.blob_names(second), names)
+        self.assertEqual(set(MediaBlob.objects.filter(name__in=names).values_list("refcount", flat=True)), {2})
+        self.assertFalse(os.path.exists(os.path.join(settings.MEDIA_ROOT, f"server/{second.pk}/server_banners/b.png")))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(all(os.path.isfile(os.path.join(settings.MEDIA_ROOT, name)) for name in names))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(any(os.path.exists(os.path.join(settings.MEDIA_ROOT, name)) for name in names))
+        self.assertFalse(MediaBlob.objects.filter(name__in=names).exists())
+
+    def test_files_are_only_deleted_once_the_release_commits(self):
+        server = self.create_server("server", banner_img=self.upload())
+        names = self.blob_names(server)
+
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            Server.objects.get(pk=server.pk).delete()
+            raise RuntimeError
+        self.assertTrue(all(os.path.isfile(os.path.join(settings.MEDIA_ROOT, name)) for name in names))
+        self.assertEqual(set(MediaBlob.objects.filter(name__in=names).values_list("refcount", flat=True)), {1})
+
+        # The same content is stored again before the release commits, so it is kept
+        with self.captureOnCommitCallbacks(execute=True):
+            server.delete()
+            other = self.create_server("other", banner_img=self.upload())
+        self.assertEqual(self.blob_names(other), names)
+        self.assertTrue(all(os.path.isfile(os.path.join(settings.MEDIA_ROOT, name)) for name in names))
+        self.assertEqual(set(MediaBlob.objects.filter(name__in=names).values_list("refcount", flat=True)), {1})
+
+    def test_default_images_are_never_deleted(self):
+        default_icon = os.path.join(settings.MEDIA_ROOT, default_category_icon())
+        category = Category.objects.create(name="other")
+        self.assertEqual(category.icon.name, default_category_icon())
+
+        category.delete()
+        self.assertTrue(os.path.isfile(default_icon))
+
+    def test_blobs_are_served_as_immutable(self):
+        server = self.create_server("server", banner_img=self.upload())
+        request = RequestFactory().get(f"/media/{server.banner_img.name}")
+
+        response = serve_media(request, server.banner_img.name, document_root=settings.MEDIA_ROOT)
+        self.assertEqual(response["Cache-Control"], IMMUTABLE_CACHE_CONTROL)
+        response = serve_media(request, default_category_icon(), document_root=settings.MEDIA_ROOT)
+        self.assertNotIn("Cache-Control", response)
+
+
+class DefaultImageTests(TemporaryMediaMixin, TestCase):
+    """
+    The shared default images are processed once for every instance using them, never in place.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.user = get_user_model().objects.create(username="owner")
+
+    def test_default_icon_is_processed_once_and_shared(self):
+        default_icon = os.path.join(settings.MEDIA_ROOT, default_category_icon())
+        with open(default_icon, "rb") as f:
+            original = f.read()
+
+        with patch("server.image_pipeline.process_image", wraps=process_image) as process:
+            first = Category.objects.create(name="first")
+            second = Category.objects.create(name="second")
+        self.assertEqual(process.call_count, 1)
+
+        self.assertEqual(second.icon.name, default_category_icon())
+        self.assertEqual(first.icon_variants["source"], default_category_icon())
+        self.assertTrue(first.icon_variants["formats"])
+        self.assertTrue(first.icon_placeholder["blurhash"])
+        self.assertEqual(Category.objects.get(pk=second.pk).icon_variants, first.icon_variants)
+        self.assertEqual(Category.objects.get(pk=second.pk).icon_placeholder, first.icon_placeholder)
+        with open(default_icon, "rb") as f:
+            self.assertEqual(f.read(), original)
+
+        names = stored_variant_names(first.icon_variants)
+        self.assertEqual(set(MediaBlob.objects.filter(name__in=names).values_list("refcount", flat=True)), {2})
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+            second.delete()
+        self.assertFalse(any(os.path.exists(os.path.join(settings.MEDIA_ROOT, name)) for name in names))
+        self.assertTrue(os.path.isfile(default_icon))
+
+    def test_missing_default_banner_is_skipped(self):
+        category = Category.objects.create(name="category")
+        with self.assertNoLogs("server", level="ERROR"):
+            server = Server.objects.create(name="inline", owner=self.user, category=category)
+        self.assertEqual(Server.objects.get(pk=server.pk).banner_img_variants, {})
+
+    @override_settings(SERVER_IMAGE_PROCESSING="background")
+    def test_default_images_are_never_queued(self):
+        category = Category.objects.create(name="category")
+        server = Server.objects.create(name="background", owner=self.user, category=category)
+
+        self.assertFalse(ImageJob.objects.exists())
+        self.assertFalse(Server.objects.get(pk=server.pk).images_pending)
+
+
+class AutocommitMediaReleaseTests(TemporaryMediaMixin, TransactionTestCase):
+    """
+    Outside a test transaction (autocommit, as the project runs), a save that fails must not
+    delete the files its row still points at.
+    """
+
+    def upload(self, color):
+        buffer = BytesIO()
+        Image.new("RGB", (600, 600), color).save(buffer, format="PNG")
+        return SimpleUploadedFile("banner.png", buffer.getvalue(), content_type="image/png")
+
+    def test_failed_save_keeps_the_replaced_files(self):
+        user = get_user_model().objects.create(username="owner")
+        category = Category.objects.create(name="category")
+        server = Server.objects.create(
+            name="server", owner=user, category=category, banner_img=self.upload((90, 40, 160))
+        )
+        server = Server.objects.get(pk=server.pk)
+        stored_name = server.banner_img.name
+        names = {stored_name, *stored_variant_names(server.banner_img_variants)}
+
+        server.banner_img = self.upload((0, 0, 0))
+        with patch.object(Server, "save_base", side_effect=DatabaseError), self.assertRaises(DatabaseError):
+            server.save()
+
+        self.assertEqual(Server.objects.get(pk=server.pk).banner_img.name, stored_name)
+        self.assertTrue(all(os.path.isfile(os.path.join(settings.MEDIA_ROOT, name)) for name in names))
+        self.assertEqual(set(MediaBlob.objects.filter(name__in=names).values_list("refcount", flat=True)), {1})
+
+        # A save that goes through releases them once it has committed
+        server = Server.objects.get(pk=server.pk)
+        server.banner_img = self.upload((0, 0, 0))
+        server.save()
+        self.assertFalse(any(os.path.exists(os.path.join(settings.MEDIA_ROOT, name)) for name in names))
+
+
+class ImagePlaceholderTests(TemporaryMediaMixin, TestCase):
+    """
+    Processed images get a BlurHash and a dominant colour for the UI to paint while they load.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.user = get_user_model().objects.create(username="owner")
+        self.category = Category.objects.create(name="category")
+
+    def upload(self, color):
+        buffer = BytesIO()
+        img = Image.new("RGB", (500, 300), color)
+        img.paste((255, 255, 255), (0, 0, 100, 300))
+        img.save(buffer, format="PNG")
+        return SimpleUploadedFile("banner.png", buffer.getvalue(), content_type="image/png")
+
+    def decode83(self, text):
+        value = 0
+        for character in text:
+            value = value * 83 + BASE83_CHARACTERS.index(character)
+        return value
+
+    def test_blurhash_encoding(self):
+        blurhash = encode_blurhash(Image.new("RGB", (64, 64), (30, 136, 229)))
+        # Size flag for 4x3 components, then the average colour
+        self.assertEqual(self.decode83(blurhash[0]), 3 + 2 * 9)
+        self.assertEqual(self.decode83(blurhash[2:6]), 0x1E88E5)
+        self.assertEqual(len(encode_blurhash(Image.new("RGB", (64, 64)), x_components=9, y_components=9)), 6 + 2 * 80)
+
+    def test_placeholder_is_stored_and_serialized(self):
+        server = Server.objects.create(
+            name="server", owner=self.user, category=self.category, banner_img=self.upload((30, 136, 229))
+        )
+
+        stored = Server.objects.get(pk=server.pk).banner_img_placeholder
+        self.assertEqual(stored["color"], "#1e88e5")
+        self.assertEqual(len(stored["blurhash"]), 28)
+        self.assertEqual(ServerSerializer(server).data["banner_img_placeholder"], stored)
+
+        server.banner_img = self.upload((200, 40, 40))
+        server.save()
+        self.assertEqual(Server.objects.get(pk=server.pk).banner_img_placeholder["color"], "#c82828")
+
+
+class CategorySpriteTests(TemporaryMediaMixin, TestCase):
+    """
+    Category icons are packed into one sprite sheet, repainted a cell at a time.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+
+    def icon(self, color):
+        buffer = BytesIO()
+        Image.new("RGB", (40, 40), color).save(buffer, format="PNG")
+        return SimpleUploadedFile("icon.png", buffer.getvalue(), content_type="image/png")
+
+    def cell_color(self, category):
+        sheet = get_category_sprite()
+        left, top, _, _ = cell_box(sheet, sheet.slots[str(category.pk)])
+        with Image.open(os.path.join(settings.MEDIA_ROOT, sheet.image)) as img:
+            return img.convert("RGB").getpixel((left + 35, top + 35))
+
+    def test_icons_are_packed_and_repainted_one_cell_at_a_time(self):
+        red = Category.objects.create(name="red", icon=self.icon((255, 0, 0)))
+        blue = Category.objects.create(name="blue", icon=self.icon((0, 0, 255)))
+        self.assertEqual(self.cell_color(red), (255, 0, 0))
+        self.assertEqual(self.cell_color(blue), (0, 0, 255))
+        slots = dict(get_category_sprite().slots)
+
+        red = Category.objects.get(pk=red.pk)
+        red.icon = self.icon((0, 255, 0))
+        with patch("server.sprites.paint_cell", wraps=paint_cell) as paint:
+            red.save()
+        paint.assert_called_once()
+        self.assertEqual(self.cell_color(red), (0, 255, 0))
+        self.assertEqual(get_category_sprite().slots, slots)
+
+        # Saves that do not change the icon leave the sheet alone
+        sheet_image = get_category_sprite().image
+        red.description = "green now"
+        red.save()
+        self.assertEqual(get_category_sprite().image, sheet_image)
+
+    def test_deleted_category_frees_its_cell(self):
+        first = Category.objects.create(name="first", icon=self.icon((255, 0, 0)))
+        Category.objects.create(name="second", icon=self.icon((0, 0, 255)))
+        index = get_category_sprite().slots[str(first.pk)]
+
+        first.delete()
+        self.assertNotIn(str(first.pk), get_category_sprite().slots)
+
+        third = Category.objects.create(name="third", icon=self.icon((0, 255, 0)))
+        self.assertEqual(get_category_sprite().slots[str(third.pk)], index)
+        self.assertEqual(self.cell_color(third), (0, 255, 0))
+
+    def test_previous_sheet_is_released_once_the_new_one_is_committed(self):
+        Category.objects.create(name="first", icon=self.icon((255, 0, 0)))
+        previous = get_category_sprite().image
+        previous_path = os.path.join(settings.MEDIA_ROOT, previous)
+
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            Category.objects.create(name="rolled back", icon=self.icon((0, 0, 255)))
+            raise RuntimeError
+        self.assertEqual(get_category_sprite().image, previous)
+        self.assertTrue(os.path.isfile(previous_path))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(name="second", icon=self.icon((0, 255, 0)))
+        self.assertNotEqual(get_category_sprite().image, previous)
+        self.assertFalse(os.path.exists(previous_path))
+
+    def test_listing_and_sprite_endpoint_expose_coordinates(self):
+        categories = [Category.objects.create(name=f"c{index}", icon=self.icon((index * 20, 0, 0))) for index in range(10)]
+
+        listing = {item["id"]: item["icon_sprite"] for item in self.client.get("/api/server/category/").json()}
+        sprite = self.client.get("/api/server/category/sprite/").json()
+        self.assertEqual((sprite["width"], sprite["height"]), (8 * 70, 2 * 70))
+        self.assertEqual(sprite["icons"][str(categories[9].pk)], {"x": 70, "y": 70, "width": 70, "height": 70})
+        self.assertEqual(listing[categories[9].pk]["url"], sprite["url"])
+        self.assertEqual((listing[categories[9].pk]["x"], listing[categories[9].pk]["y"]), (70, 70))
@@ -25,6 +25,7 @@ urlpatterns = router.urls
 # - PATCH /server/select/{pk}/  -> partial_update action of ServerListViewSet
 # - DELETE /server/select/{pk}/ -> destroy action of ServerListViewSet
 # - GET /server/category/       -> list action of CategoryListViewSet
+# - GET /server/category/sprite/ -> sprite action of CategoryListViewSet (icon sprite sheet map)
 # - POST /server/category/      -> create action of CategoryListViewSet
 # - GET /server/category/{pk}/  -> retrieve action of CategoryListViewSet
 # - PUT /server/category/{pk}/  -> update action of CategoryListViewSet
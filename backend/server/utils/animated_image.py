@@ -0,0 +1,134 @@
+import logging
+from PIL import GifImagePlugin, Image, ImageChops, ImageSequence
+
+from .atomic_save import atomic_write
+from .image_probe import LIMITS
+
+# Set up the logger
+logger = logging.getLogger(__name__)
+
+# Frame duration (ms) used when a frame does not specify one, as browsers do
+DEFAULT_FRAME_DURATION = 100
+
+
+def fit_frame(frame, size):
+    """
+    Scales one frame to fit within `size` and centres it on a transparent canvas of that size.
+
+    Args:
+        frame (PIL.Image.Image): A frame of any mode.
+        size (tuple): Width and height of the canvas.
+
+    Returns:
+        PIL.Image.Image: An RGBA image of exactly `size`.
+    """
+    frame = frame.convert("RGBA")
+    frame.thumbnail(size, Image.LANCZOS)
+    canvas = Image.new("RGBA", size, (255, 255, 255, 0))
+    canvas.paste(frame, ((size[0] - frame.width) // 2, (size[1] - frame.height) // 2))
+    return canvas
+
+
+def iter_scaled_frames(img, size, max_frames=None):
+    """
+    Yields the frames of an animated image scaled onto `size` canvases, one at a time.
+
+    Only the frame being decoded and the last one yielded are ever held in memory, however
+    long the animation is. Consecutive frames that come out identical after scaling are
+    merged into one, with their durations added up so the timing of the animation is kept.
+
+    Args:
+        img (PIL.Image.Image): An opened (multi-frame) image.
+        size (tuple): Width and height of the output canvas.
+        max_frames (int): Number of source frames to read at most; the rest of the animation
+            is dropped. Defaults to the process's frame budget (see `configure_image_limits`).
+
+    Yields:
+        tuple: `(frame, duration)`, an RGBA image of `size` and its duration in milliseconds.
+    """
+    max_frames = max_frames or LIMITS["max_frames"]
+
+    previous, previous_duration = None, 0
+    for index, frame in enumerate(ImageSequence.Iterator(img)):
+        if max_frames and index >= max_frames:
+            logger.warning(f"Animation truncated to its first {max_frames} frames")
+            break
+
+        duration = frame.info.get("duration") or DEFAULT_FRAME_DURATION
+        canvas = fit_frame(frame, size)
+        if previous is not None and ImageChops.difference(previous, canvas).getbbox(alpha_only=False) is None:
+            previous_duration += duration
+            continue
+
+        if previous is not None:
+            yield previous, previous_duration
+        previous, previous_duration = canvas, duration
+
+    if previous is not None:
+        yield previous, previous_duration
+
+
+def _to_palette(frame):
+    # GIF frames are palette images: quantize the colours and reserve one more index,
+    # painted wherever the frame is (mostly) transparent, as the transparent colour
+    palette_frame = frame.convert("RGB").quantize(colors=255)
+    palette = palette_frame.getpalette()[: 255 * 3]
+    transparency = len(palette) // 3
+    palette_frame.putpalette(palette + [0, 0, 0])
+    palette_frame.paste(transparency, mask=frame.getchannel("A").point(lambda alpha: 255 if alpha < 128 else 0))
+    return palette_frame, transparency
+
+
+def write_animated_gif(frames, fp, size, loop=0):
+    """
+    Encodes `(frame, duration)` pairs into a GIF file as they arrive.
+
+    `Image.save(save_all=True)` collects every frame before writing any of them; here each
+    frame is quantized and written straight away, so memory does not grow with the number of
+    frames. Every frame gets its own colour table and is disposed of before the next one.
+
+    Args:
+        frames (iterable): `(frame, duration)` pairs, e.g. from `iter_scaled_frames`. Frames
+            are RGBA images of exactly `size`.
+        fp (file): A binary file object to write to.
+        size (tuple): Width and height of the animation.
+        loop (int): Number of times to play the animation, 0 for forever.
+
+    Returns:
+        int: The number of frames written.
+    """
+    width, height = size
+    # Header and logical screen descriptor, without a global colour table
+    fp.write(b"GIF89a" + width.to_bytes(2, "little") + height.to_bytes(2, "little") + b"\x70\x00\x00")
+    # Netscape application extension: loop count
+    fp.write(b"!\xff\x0bNETSCAPE2.0\x03\x01" + loop.to_bytes(2, "little") + b"\x00")
+
+    count = 0
+    for frame, duration in frames:
+        palette_frame, transparency = _to_palette(frame)
+        for data in GifImagePlugin.getdata(
+            palette_frame, duration=duration, transparency=transparency, disposal=2, include_color_table=True
+        ):
+            fp.write(data)
+        count += 1
+
+    fp.write(b";")
+    return count
+
+
+def scale_animated_gif(img, image_path, size, max_frames=None):
+    """
+    Scales every frame of an opened GIF onto `size` canvases and writes the result over
+    `image_path`, streaming frames from the decoder to the encoder one at a time.
+
+    Args:
+        img (PIL.Image.Image): The opened GIF.
+        image_path (str): Absolute path of the file to replace.
+        size (tuple): Width and height of the output.
+        max_frames (int): Passed on to `iter_scaled_frames`.
+
+    Returns:
+        int: The number of frames written.
+    """
+    with atomic_write(image_path) as fp:
+        return write_animated_gif(iter_scaled_frames(img, size, max_frames), fp, size)
@@ -0,0 +1,57 @@
+import os
+import tempfile
+from contextlib import contextmanager
+from PIL import Image
+
+
+@contextmanager
+def atomic_write(path):
+    """
+    Opens a temporary file next to `path` for binary writing and moves it over `path` once the
+    block exits without an error.
+
+    The rename is atomic on the same filesystem, so anything reading the file (the media
+    server, a browser, another worker) sees either the old content or the new one, and a crash
+    mid-write leaves the original untouched.
+
+    Args:
+        path (str): Absolute path of the file to replace.
+
+    Yields:
+        file: The temporary file, opened in "wb" mode.
+    """
+    directory, filename = os.path.split(path)
+    extension = os.path.splitext(filename)[1]
+
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=extension)
+    try:
+        with os.fdopen(fd, "wb") as tmp_file:
+            yield tmp_file
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def save_image_atomically(image, image_path, **save_kwargs):
+    """
+    Saves a PIL image over `image_path` without ever exposing a partially written file.
+
+    The image is encoded into a temporary file in the same directory, which is then moved over
+    the original (see `atomic_write`).
+
+    Args:
+        image (PIL.Image.Image): The image to save.
+        image_path (str): Absolute path of the file to replace.
+        **save_kwargs: Passed on to `Image.save` (e.g. `quality`).
+            The format defaults to the one matching the file extension.
+
+    Returns:
+        None
+    """
+    extension = os.path.splitext(image_path)[1]
+    save_kwargs.setdefault("format", Image.registered_extensions().get(extension.lower()))
+
+    with atomic_write(image_path) as tmp_file:
+        image.save(tmp_file, **save_kwargs)
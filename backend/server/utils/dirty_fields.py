@@ -0,0 +1,96 @@
+import hashlib
+from django.db.models import FileField
+
+_UNSET = object()
+
+
+def file_fingerprint(field_file):
+    """
+    Returns the SHA-256 hex digest of a file's content, read in chunks.
+
+    Args:
+        field_file (FieldFile or File): An open or openable file, e.g. a pending upload.
+
+    Returns:
+        str: The fingerprint.
+    """
+    digest = hashlib.sha256()
+    field_file.open("rb")
+    field_file.seek(0)
+    for chunk in field_file.chunks():
+        digest.update(chunk)
+    field_file.seek(0)
+    return digest.hexdigest()
+
+
+class DirtyFieldsMixin:
+    """
+    Model mixin that remembers the values of `tracked_fields` as they were loaded from the
+    database, so `save()` can tell what changed without fetching the row again.
+
+    The snapshot is taken in `from_db` (and refreshed by `save()`), which means only instances
+    loaded through the ORM have one. File fields are compared by their stored name.
+
+    Attributes:
+        tracked_fields (tuple): Names of the concrete fields to snapshot.
+    """
+    tracked_fields = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = {
+            name: instance._normalize(name, value)
+            for name, value in zip(field_names, values)
+            if name in cls.tracked_fields
+        }
+        return instance
+
+    def _normalize(self, name, value):
+        # File fields hold a FieldFile on the instance but a plain name (or "") in the database
+        if isinstance(self._meta.get_field(name), FileField):
+            return getattr(value, "name", value) or None
+        return value
+
+    def _tracked_value(self, name):
+        return self._normalize(name, getattr(self, name))
+
+    def has_snapshot(self):
+        """
+        Returns True if the instance was loaded from the database and can report changes.
+        """
+        return bool(getattr(self, "_loaded_values", None))
+
+    def original_value(self, name, default=_UNSET):
+        """
+        Returns the value a tracked field had when the instance was loaded.
+        """
+        if default is _UNSET:
+            return self._loaded_values[name]
+        return getattr(self, "_loaded_values", {}).get(name, default)
+
+    def changed_fields(self):
+        """
+        Returns the names of the tracked fields whose value differs from the snapshot.
+
+        Without a snapshot (a new instance), every tracked field counts as changed.
+        """
+        loaded = getattr(self, "_loaded_values", {})
+        return {
+            name for name in self.tracked_fields if name not in loaded or loaded[name] != self._tracked_value(name)
+        }
+
+    def load_snapshot(self):
+        """
+        Fetches the stored values of an instance that was not loaded through the ORM (e.g. built
+        with an explicit pk). Instances loaded normally never need this extra query.
+        """
+        row = type(self)._base_manager.filter(pk=self.pk).values(*self.tracked_fields).first()
+        if row is not None:
+            self._loaded_values = {name: self._normalize(name, value) for name, value in row.items()}
+
+    def take_snapshot(self):
+        """
+        Records the current values as the new baseline, e.g. after a successful save.
+        """
+        self._loaded_values = {name: self._tracked_value(name) for name in self.tracked_fields}
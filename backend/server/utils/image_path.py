@@ -61,4 +61,12 @@ def default_server_banner_img_path():
     return "server/defaults/banner_image/default_banner.png"
 
 def default_server_icon_path():
-    return "server/defautls/icon_image/default_icon.png"
\ No newline at end of file
+    return "server/defautls/icon_image/default_icon.png"
+
+
+def is_default_media(name):
+    """
+    Returns True for the default images shared by every category and server, which must never
+    be deleted along with one of them.
+    """
+    return name in (default_category_icon(), default_server_banner_img_path(), default_server_icon_path())
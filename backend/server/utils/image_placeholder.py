@@ -0,0 +1,130 @@
+import logging
+import math
+from PIL import Image, ImageOps
+
+# Set up the logger
+logger = logging.getLogger(__name__)
+
+BASE83_CHARACTERS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~"
+
+# Size the image is reduced to before encoding; a placeholder has no detail to lose
+SAMPLE_SIZE = (32, 32)
+
+
+def _encode83(value, length):
+    return "".join(BASE83_CHARACTERS[(value // 83 ** (length - index)) % 83] for index in range(1, length + 1))
+
+
+def _srgb_to_linear(value):
+    value = value / 255
+    return value / 12.92 if value <= 0.04045 else ((value + 0.055) / 1.055) ** 2.4
+
+
+def _linear_to_srgb(value):
+    value = max(0.0, min(1.0, value))
+    if value <= 0.0031308:
+        return int(value * 12.92 * 255 + 0.5)
+    return int((1.055 * value ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+
+def _sign_pow(value, exponent):
+    return math.copysign(abs(value) ** exponent, value)
+
+
+def flatten(img):
+    """
+    Returns an RGB copy of `img`, with transparent areas composited onto white as the UI shows them.
+    """
+    if img.mode in ("RGBA", "LA", "PA") or (img.mode == "P" and "transparency" in img.info):
+        img = img.convert("RGBA")
+        background = Image.new("RGBA", img.size, (255, 255, 255, 255))
+        return Image.alpha_composite(background, img).convert("RGB")
+    return img.convert("RGB")
+
+
+def encode_blurhash(img, x_components=4, y_components=3):
+    """
+    Encodes an image as a BlurHash (https://blurha.sh): a short string that clients decode into
+    a blurred preview while the real image loads.
+
+    The image is reduced to `SAMPLE_SIZE` first, so encoding costs the same for any upload.
+
+    Args:
+        img (PIL.Image.Image): An RGB image.
+        x_components (int): Horizontal detail, 1 to 9.
+        y_components (int): Vertical detail, 1 to 9.
+
+    Returns:
+        str: The BlurHash, 28 characters with the default components.
+    """
+    img = img.copy()
+    img.thumbnail(SAMPLE_SIZE, Image.BILINEAR)
+    width, height = img.size
+    pixels = [tuple(_srgb_to_linear(channel) for channel in pixel) for pixel in img.getdata()]
+
+    factors = []
+    for j in range(y_components):
+        for i in range(x_components):
+            normalisation = 1 if i == 0 and j == 0 else 2
+            red = green = blue = 0.0
+            for y in range(height):
+                vertical = math.cos(math.pi * j * y / height)
+                for x in range(width):
+                    basis = normalisation * math.cos(math.pi * i * x / width) * vertical
+                    pixel = pixels[y * width + x]
+                    red += basis * pixel[0]
+                    green += basis * pixel[1]
+                    blue += basis * pixel[2]
+            scale = 1 / (width * height)
+            factors.append((red * scale, green * scale, blue * scale))
+
+    dc, ac = factors[0], factors[1:]
+    blurhash = _encode83((x_components - 1) + (y_components - 1) * 9, 1)
+
+    if ac:
+        quantised_max = max(0, min(82, math.floor(max(abs(value) for factor in ac for value in factor) * 166 - 0.5)))
+        max_value = (quantised_max + 1) / 166
+    else:
+        quantised_max, max_value = 0, 1
+    blurhash += _encode83(quantised_max, 1)
+
+    blurhash += _encode83((_linear_to_srgb(dc[0]) << 16) + (_linear_to_srgb(dc[1]) << 8) + _linear_to_srgb(dc[2]), 4)
+    for factor in ac:
+        red, green, blue = (
+            max(0, min(18, math.floor(_sign_pow(value / max_value, 0.5) * 9 + 9.5))) for value in factor
+        )
+        blurhash += _encode83(red * 19 * 19 + green * 19 + blue, 2)
+    return blurhash
+
+
+def dominant_color(img):
+    """
+    Returns the most common colour of an image as a CSS hex string, e.g. "#1e88e5".
+
+    The colours are quantized to a small palette first, so near-identical shades count together.
+    """
+    img = img.copy()
+    img.thumbnail((64, 64), Image.BILINEAR)
+    quantized = img.quantize(colors=5)
+    palette = quantized.getpalette()
+    _, index = max(quantized.getcolors())
+    red, green, blue = palette[index * 3 : index * 3 + 3]
+    return f"#{red:02x}{green:02x}{blue:02x}"
+
+
+def compute_placeholder(image_path):
+    """
+    Computes the placeholder the UI paints while an image loads.
+
+    Only the first frame of an animation is used, and JPEGs are decoded at a reduced scale.
+
+    Args:
+        image_path (str): Absolute path to the original upload.
+
+    Returns:
+        dict: `{"blurhash": str, "color": "#rrggbb"}`.
+    """
+    with Image.open(image_path) as img:
+        img.draft("RGB", (SAMPLE_SIZE[0] * 4, SAMPLE_SIZE[1] * 4))
+        img = flatten(ImageOps.exif_transpose(img))
+    return {"blurhash": encode_blurhash(img), "color": dominant_color(img)}
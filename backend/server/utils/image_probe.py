@@ -0,0 +1,163 @@
+import logging
+import warnings
+from collections import namedtuple
+from PIL import Image
+
+# Set up the logger
+logger = logging.getLogger(__name__)
+
+ImageInfo = namedtuple("ImageInfo", ["format", "width", "height", "frames"])
+
+
+class ImageBudgetExceeded(ValueError):
+    """
+    Raised when an image is larger than the configured pixel or frame budgets.
+    """
+
+
+# Budgets applied by `check_image_budget`; set once per process with `configure_image_limits`
+LIMITS = {"max_pixels": None, "max_frames": None, "max_total_pixels": None}
+
+
+def configure_image_limits(max_pixels=None, max_frames=None, max_total_pixels=None):
+    """
+    Sets the image budgets for this process.
+
+    Also lowers PIL's own decompression bomb guard (`Image.MAX_IMAGE_PIXELS`) to the pixel
+    budget, so any `Image.open` of a larger image warns, and one over twice the budget raises
+    `DecompressionBombError` before anything is decoded. Called from `ServerConfig.ready()`
+    and as the initializer of the image worker's pool processes.
+    """
+    LIMITS.update(max_pixels=max_pixels, max_frames=max_frames, max_total_pixels=max_total_pixels)
+    if max_pixels:
+        Image.MAX_IMAGE_PIXELS = max_pixels
+
+
+def _skip_sub_blocks(fp):
+    # GIF data is a chain of sub-blocks, each prefixed by its length, ending with a 0 length
+    while True:
+        size = fp.read(1)
+        if not size or size[0] == 0:
+            return
+        fp.seek(size[0], 1)
+
+
+def count_gif_frames(fp, limit=None):
+    """
+    Counts the frames of a GIF by walking its block structure, without decoding any pixel data.
+
+    Image data and extensions are skipped over by their length prefixes, so counting costs a
+    few small reads per frame however large the frames are.
+
+    Args:
+        fp (file): A binary file object positioned at the start of the GIF.
+        limit (int): Stop counting once this many frames have been exceeded.
+
+    Returns:
+        int: The number of frames (at most `limit + 1` when a limit is given).
+    """
+    header = fp.read(13)
+    if len(header) < 13 or header[:3] != b"GIF":
+        raise ValueError("Not a GIF file")
+
+    flags = header[10]
+    if flags & 0x80:
+        # Global colour table
+        fp.seek(3 * (2 ** ((flags & 0x07) + 1)), 1)
+
+    frames = 0
+    while True:
+        block = fp.read(1)
+        if block == b",":
+            # Image descriptor: position, size and flags, then the LZW-compressed data
+            frames += 1
+            if limit is not None and frames > limit:
+                break
+            descriptor = fp.read(9)
+            if len(descriptor) < 9:
+                break
+            if descriptor[8] & 0x80:
+                # Local colour table
+                fp.seek(3 * (2 ** ((descriptor[8] & 0x07) + 1)), 1)
+            fp.read(1)  # LZW minimum code size
+            _skip_sub_blocks(fp)
+        elif block == b"!":
+            # Extension: label, then sub-blocks
+            fp.read(1)
+            _skip_sub_blocks(fp)
+        else:
+            # Trailer (";"), end of file, or garbage after the last frame
+            break
+    return frames
+
+
+def probe_image(source, frame_limit=None):
+    """
+    Reads the format, dimensions and frame count of an image from its headers only.
+
+    `Image.open` is lazy: it parses the header but decodes nothing until pixels are accessed.
+    PNG frame counts come from the APNG control chunk; GIF frames are counted by
+    `count_gif_frames`.
+
+    Args:
+        source (str or file): A path, or a binary file object such as an upload. A file object
+            is rewound to where it was afterwards.
+        frame_limit (int): Passed to `count_gif_frames` to stop early on huge animations.
+
+    Returns:
+        ImageInfo: The probed format, width, height and number of frames.
+
+    Raises:
+        PIL.UnidentifiedImageError: If the data is not an image PIL understands.
+        PIL.Image.DecompressionBombError: If the image is over twice `Image.MAX_IMAGE_PIXELS`.
+    """
+    if isinstance(source, str):
+        with open(source, "rb") as fp:
+            return probe_image(fp, frame_limit)
+
+    position = source.tell()
+    try:
+        source.seek(0)
+        with warnings.catch_warnings():
+            # The budgets are checked by the caller; only the hard limit (an error) matters here
+            warnings.simplefilter("ignore", Image.DecompressionBombWarning)
+            with Image.open(source) as img:
+                image_format, (width, height) = img.format, img.size
+                frames = 1 if image_format == "GIF" else getattr(img, "n_frames", 1)
+        if image_format == "GIF":
+            source.seek(0)
+            frames = count_gif_frames(source, frame_limit)
+    finally:
+        source.seek(position)
+    return ImageInfo(image_format, width, height, frames)
+
+
+def check_image_budget(info, max_pixels=None, max_frames=None, max_total_pixels=None):
+    """
+    Raises `ImageBudgetExceeded` if a probed image is over any of the budgets.
+
+    Budgets left as None fall back to the process limits from `configure_image_limits`.
+
+    Args:
+        info (ImageInfo): The result of `probe_image`.
+        max_pixels (int): Maximum width * height of a single frame.
+        max_frames (int): Maximum number of frames.
+        max_total_pixels (int): Maximum width * height * frames, i.e. all the pixels a full
+            decode of every frame would produce.
+    """
+    max_pixels = max_pixels or LIMITS["max_pixels"]
+    max_frames = max_frames or LIMITS["max_frames"]
+    max_total_pixels = max_total_pixels or LIMITS["max_total_pixels"]
+
+    pixels = info.width * info.height
+    if max_pixels and pixels > max_pixels:
+        raise ImageBudgetExceeded(
+            f"The image is {info.width}x{info.height} ({pixels} pixels), the maximum is {max_pixels} pixels"
+        )
+    if max_frames and info.frames > max_frames:
+        raise ImageBudgetExceeded(f"The image has more than {max_frames} frames")
+    if max_total_pixels and pixels * info.frames > max_total_pixels:
+        raise ImageBudgetExceeded(
+            f"The image has {info.frames} frames of {info.width}x{info.height}, "
+            f"more than {max_total_pixels} pixels in total"
+        )
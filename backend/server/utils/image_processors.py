@@ -0,0 +1,58 @@
+from .image_placeholder import compute_placeholder
+from .image_probe import check_image_budget, probe_image
+from .image_variants import generate_variants
+from .scale_icon import scale_down_icon
+from .scale_image import scale_down_image
+
+# 1x sizes of the variants; they match the sizes the scalers produce for the fallback file
+BANNER_SIZE = (400, 400)
+ICON_SIZE = (70, 70)
+
+
+def process_banner(image_path):
+    variants = generate_variants(image_path, BANNER_SIZE)
+    scale_down_image(image_path, max_size=BANNER_SIZE, raise_errors=True)
+    return variants
+
+
+def process_icon(image_path):
+    variants = generate_variants(image_path, ICON_SIZE)
+    scale_down_icon(image_path, max_size=ICON_SIZE, raise_errors=True)
+    return variants
+
+
+def process_category_icon(image_path):
+    # Category icons are validated to fit 70x70 already, they only need the modern formats
+    return generate_variants(image_path, ICON_SIZE)
+
+
+# Processors are referenced by name so that only plain strings cross into the worker's pool
+# processes. This module must not import any models: pool processes never set up Django.
+PROCESSORS = {
+    "banner": process_banner,
+    "icon": process_icon,
+    "category_icon": process_category_icon,
+}
+
+
+def process_image(processor, image_path):
+    """
+    Run a named processor on one file, raising on failure.
+
+    The file is probed first and refused if it is over the process's image budgets (see
+    `configure_image_limits`), so nothing that slipped past the upload validators gets
+    decoded. The placeholder and the variants are then computed from the original upload, and
+    the file itself is replaced by its scaled-down fallback.
+
+    Args:
+        processor (str): Key in `PROCESSORS`.
+        image_path (str): Absolute path of the file to process in place.
+
+    Returns:
+        tuple: The variants written, `{format: {density: absolute path}}`, and the placeholder
+        (see `compute_placeholder`).
+    """
+    info = probe_image(image_path)
+    check_image_budget(info)
+    placeholder = compute_placeholder(image_path)
+    return PROCESSORS[processor](image_path), placeholder
@@ -0,0 +1,160 @@
+import logging
+import os
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from .atomic_save import save_image_atomically
+
+# Set up the logger
+logger = logging.getLogger(__name__)
+
+# Pixel densities generated for every image, as used in an HTML srcset
+DENSITIES = (1, 2, 3)
+
+# Modern formats, most compact first, with their encoder settings. A format is only generated
+# when the installed Pillow can encode it (AVIF needs Pillow >= 11.3 or pillow-avif-plugin).
+MODERN_FORMATS = {
+    "avif": {"format": "AVIF", "quality": 60},
+    "webp": {"format": "WEBP", "quality": 80, "method": 4},
+}
+
+# Fallback for clients without WebP/AVIF support, picked from the source image
+FALLBACK_FORMATS = {
+    "png": {"format": "PNG", "optimize": True},
+    "jpeg": {"format": "JPEG", "quality": 85, "optimize": True, "progressive": True},
+}
+
+
+def can_encode(image_format):
+    """
+    Returns True if the installed Pillow has an encoder for `image_format` (e.g. "AVIF").
+    """
+    Image.init()
+    return image_format in Image.SAVE
+
+
+def variant_path(image_path, density, extension):
+    """
+    Returns the path of one variant, stored next to the source: "banner.png" -> "banner-2x.webp".
+    """
+    stem = os.path.splitext(image_path)[0]
+    return f"{stem}-{density}x.{extension}"
+
+
+def generate_variants(image_path, base_size):
+    """
+    Generates 1x/2x/3x renditions of an image in every supported modern format plus a fallback.
+
+    Each density is scaled to fit within `base_size` multiplied by that density, keeping the
+    aspect ratio. Densities the source is too small for are skipped rather than upscaled, so a
+    small upload yields fewer variants. Animated images are left alone (no variants) and keep
+    being served from the original file.
+
+    The variants must be generated from the original upload, before `scale_down_image` or
+    `scale_down_icon` replace it with the fixed-size fallback.
+
+    Args:
+        image_path (str): Absolute path to the source image.
+        base_size (tuple): Width and height of the 1x rendition, e.g. (400, 400) for banners.
+
+    Returns:
+        dict: `{format: {"1x": path, "2x": path, ...}}` with absolute paths, or an empty dict
+        if the file is missing or animated.
+    """
+    if not os.path.isfile(image_path):
+        logger.warning(f"Image path is not a valid file: {image_path}")
+        return {}
+
+    with Image.open(image_path) as img:
+        if getattr(img, "is_animated", False):
+            logger.debug(f"Skipping variants for animated image {image_path}")
+            return {}
+
+        source_format = img.format
+        if source_format == "JPEG":
+            # Let libjpeg decode at the smallest 1/2, 1/4 or 1/8 scale that still covers the
+            # largest rendition, instead of decoding every pixel of a large photo
+            img.draft("RGB", (base_size[0] * DENSITIES[-1], base_size[1] * DENSITIES[-1]))
+        has_alpha = img.mode in ("RGBA", "LA", "PA") or (img.mode == "P" and "transparency" in img.info)
+        img = ImageOps.exif_transpose(img).convert("RGBA" if has_alpha else "RGB")
+
+        fallback = "png" if has_alpha or source_format == "PNG" else "jpeg"
+        formats = {name: options for name, options in MODERN_FORMATS.items() if can_encode(options["format"])}
+        formats[fallback] = FALLBACK_FORMATS[fallback]
+
+        variants = {name: {} for name in formats}
+        last_size = None
+        for density in DENSITIES:
+            target = (base_size[0] * density, base_size[1] * density)
+            if density > 1 and (img.width < target[0] and img.height < target[1]):
+                # Too small for this density; larger ones would only be upscaled copies
+                break
+
+            rendition = img.copy()
+            rendition.thumbnail(target, Image.LANCZOS)
+            if rendition.size == last_size:
+                continue
+            last_size = rendition.size
+
+            for name, options in formats.items():
+                path = variant_path(image_path, density, name)
+                save_image_atomically(rendition, path, **options)
+                variants[name][f"{density}x"] = path
+
+    logger.info(f"Generated {', '.join(variants)} variants at {len(variants[fallback])} densities for {image_path}")
+    return variants
+
+
+def to_stored_variants(source_name, variants):
+    """
+    Converts the output of `generate_variants` into the value stored on the model.
+
+    Paths are made relative to the media storage, and the name of the source file is kept so
+    that variants are only regenerated once the field points at another file.
+
+    Args:
+        source_name (str): Storage name of the file the variants were generated from.
+        variants (dict): `{format: {density: absolute path}}`.
+
+    Returns:
+        dict: `{"source": source_name, "formats": {format: {density: storage name}}}`. The
+        formats are empty when no variants could be made (e.g. animated images).
+    """
+    media_root = default_storage.path("")
+    formats = {
+        name: {density: os.path.relpath(path, media_root) for density, path in renditions.items()}
+        for name, renditions in variants.items()
+    }
+    return {"source": source_name, "formats": formats}
+
+
+def stored_variant_names(stored):
+    """
+    Returns the set of storage names referenced by a stored variants value.
+    """
+    return {name for renditions in (stored or {}).get("formats", {}).values() for name in renditions.values()}
+
+
+def delete_stored_variants(stored, keep=()):
+    """
+    Deletes the files of a stored variants value, except for the storage names in `keep`.
+    """
+    for name in stored_variant_names(stored) - set(keep):
+        default_storage.delete(name)
+
+
+def srcset_map(stored):
+    """
+    Builds the srcset strings for a stored variants value, one per format.
+
+    Returns:
+        dict: e.g. `{"webp": "/media/a-1x.webp 1x, /media/a-2x.webp 2x", "png": "..."}`, or
+        None when the image has no variants (clients then use the original file).
+    """
+    formats = (stored or {}).get("formats")
+    if not formats:
+        return None
+    return {
+        name: ", ".join(f"{default_storage.url(path)} {density}" for density, path in renditions.items())
+        for name, renditions in formats.items()
+    }
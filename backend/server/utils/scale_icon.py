@@ -3,6 +3,8 @@ from PIL import Image, ImageOps, ImageSequence
 import os
 from django.conf import settings
 
+from .atomic_save import save_image_atomically
+
 # Logging config
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.DEBUG)
@@ -11,13 +13,14 @@ logging.basicConfig(level=logging.DEBUG)
 pil_logger = logging.getLogger("PIL")
 pil_logger.setLevel(logging.WARNING)
 
-def scale_down_icon(image_path, max_size=(70, 70)):
+def scale_down_icon(image_path, max_size=(70, 70), raise_errors=False):
     """
     Scales down an image to a maximum size while maintaining aspect ratio.
 
     This function opens an image from a given path and scales it down such that its largest dimension
     is no greater than provided in the max_size tuple. If the image is already smaller than max_size,
-    then the image will not be resized. The scaled-down image is saved back to the same path, replacing 
+    then the image will not be resized. The scaled-down image is written to a temporary file and moved
+    over the original path (see `save_image_atomically`), replacing 
     the original image.
 
     The image path should follow the format:
@@ -29,6 +32,8 @@ def scale_down_icon(image_path, max_size=(70, 70)):
     Args:
         image_path (str): The file path to the image to be scaled down. 
         max_size (tuple): A tuple containing two integers, the max width & height for the scaled down image.
+        raise_errors (bool): Re-raise processing errors after logging them instead of swallowing them.
+            The background image worker uses this to record failed jobs.
 
     Returns:
         None
@@ -73,8 +78,10 @@ def scale_down_icon(image_path, max_size=(70, 70)):
                 background = background.convert('RGB')
 
             # Save the new image back to the same path
-            background.save(image_path)
+            save_image_atomically(background, image_path)
         logger.info(f"Scaled image from {original_size} to {new_size} and saved at {image_path}")
     
     except Exception as e:
         logger.error(f"Error scaling image at {image_path}: {e}", exc_info=True)
+        if raise_errors:
+            raise
@@ -1,8 +1,11 @@
 import logging
-from PIL import Image, ImageOps, ImageSequence
+from PIL import Image, ImageOps
 import os
 from django.conf import settings
 
+from .animated_image import scale_animated_gif
+from .atomic_save import save_image_atomically
+
 # Configure logging
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.DEBUG)
@@ -11,14 +14,16 @@ logging.basicConfig(level=logging.DEBUG)
 pil_logger = logging.getLogger('PIL')
 pil_logger.setLevel(logging.WARNING)
 
-def scale_down_image(image_path, max_size=(400, 400)):
+def scale_down_image(image_path, max_size=(400, 400), raise_errors=False):
     """
     Scales down an image to a maximum size while maintaining aspect ratio.
 
     This function opens an image from a given path and scales it down such that its largest dimension
     is no greater than provided in the max_size tuple. If the image is already smaller than max_size,
-    then the image will not be resized. The scaled-down image is saved back to the same path, replacing
-    the original image.
+    then the image will not be resized. The scaled-down image is written to a temporary file and moved
+    over the original path (see `save_image_atomically`), replacing
+    the original image. GIFs keep their animation: frames are scaled one at a time, with their own
+    durations, duplicates merged and the frame count capped (see `scale_animated_gif`).
 
     If the image_path is None or not a valid path to an image file, the function will immediately return
     and no action will be performed.
@@ -26,6 +31,8 @@ def scale_down_image(image_path, max_size=(400, 400)):
     Args:
         image_path (str): The file path to the image to be scaled down.
         max_size (tuple): A tuple containing two integers, the maximum width and height for the scaled-down image.
+        raise_errors (bool): Re-raise processing errors after logging them instead of swallowing them.
+            The background image worker uses this to record failed jobs.
 
     Returns:
         None
@@ -51,16 +58,9 @@ def scale_down_image(image_path, max_size=(400, 400)):
     try:
         with Image.open(image_path) as img:
             if img.format == 'GIF':
-                frames = []
-                for frame in ImageSequence.Iterator(img):
-                    frame = frame.convert('RGBA')
-                    frame.thumbnail(max_size, Image.LANCZOS)
-                    background = Image.new('RGBA', max_size, (255, 255, 255, 0))
-                    offset = ((max_size[0] - frame.width) // 2, (max_size[1] - frame.height) // 2)
-                    background.paste(frame, offset)
-                    frames.append(background)
-                frames[0].save(image_path, save_all=True, append_images=frames[1:], loop=0, duration=img.info.get('duration', 100))
-                logger.info(f"Scaled GIF and saved at {image_path}")
+                # Frames are streamed from the decoder to the encoder, see utils/animated_image.py
+                frame_count = scale_animated_gif(img, image_path, max_size)
+                logger.info(f"Scaled GIF ({frame_count} frames) and saved at {image_path}")
             else:
                 original_size = img.size
                 logger.debug(f"Original image size: {original_size}")
@@ -72,8 +72,10 @@ def scale_down_image(image_path, max_size=(400, 400)):
                 background = Image.new('RGB', max_size, (255, 255, 255))
                 offset = ((max_size[0] - new_size[0]) // 2, (max_size[1] - new_size[1]) // 2)
                 background.paste(img, offset)
-                background.save(image_path)
+                save_image_atomically(background, image_path)
                 logger.info(f"Scaled image from {original_size} to {new_size} and saved at {image_path}")
 
     except Exception as e:
         logger.error(f"Error scaling image at {image_path}: {e}", exc_info=True)
+        if raise_errors:
+            raise
@@ -1,7 +1,10 @@
+from django.conf import settings
 from django.core.exceptions import ValidationError
-from PIL import Image
+from PIL import Image, UnidentifiedImageError
 import os
 
+from ..utils.image_probe import ImageBudgetExceeded, check_image_budget, probe_image
+
 # validate_icon_image_size and validate_image_file_extenstion opents
 # the image using the Image.open(image) method and checks its dimenstion. 
 # it does not modify the image or path to the image. it reads to acces the dimenstions
@@ -26,6 +29,43 @@ def validate_icon_image_size(image):
         except Exception as e:
             raise ValidationError(f"Invalid image file: {e}")
                 
+def validate_image_budget(image):
+    """
+    Rejects images over the configured pixel and frame budgets before anything decodes them.
+
+    Only the headers are read (see `probe_image`), so a 20000x20000 PNG or a GIF with thousands
+    of frames is turned down in microseconds instead of being decompressed first. The budgets
+    are the `SERVER_IMAGE_MAX_PIXELS`, `SERVER_IMAGE_MAX_FRAMES` and
+    `SERVER_IMAGE_MAX_TOTAL_PIXELS` settings.
+
+    Args:
+        image (UploadedFile or FieldFile): The uploaded image file.
+
+    Raises:
+        ValidationError: If the file is not a readable image or is over a budget.
+    """
+    if not image:
+        return
+
+    max_frames = getattr(settings, "SERVER_IMAGE_MAX_FRAMES", None)
+    try:
+        info = probe_image(image, frame_limit=max_frames)
+    except Image.DecompressionBombError as e:
+        raise ValidationError(f"The image is too large: {e}")
+    except (UnidentifiedImageError, OSError, ValueError) as e:
+        raise ValidationError(f"Invalid image file: {e}")
+
+    try:
+        check_image_budget(
+            info,
+            max_pixels=getattr(settings, "SERVER_IMAGE_MAX_PIXELS", None),
+            max_frames=max_frames,
+            max_total_pixels=getattr(settings, "SERVER_IMAGE_MAX_TOTAL_PIXELS", None),
+        )
+    except ImageBudgetExceeded as e:
+        raise ValidationError(str(e))
+
+
 def validate_image_file_extension(value):
     """
     Validates the extension of an uploaded file.
@@ -7,10 +7,18 @@ import drf_spectacular
 from rest_framework.exceptions import ValidationError, AuthenticationFailed, NotFound
 from .models import Category, Server
 from rest_framework import viewsets, status
+from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
+from account.authenticate import OptionalJWTCookieAuthentication
 from .serializers import ServerSerializer, CategorySerializer
 from rest_framework.response import Response
-from django.db.models import Count
+from django.db.models import F
+from django.utils.decorators import method_decorator
+from django.utils.http import quote_etag
+from django.views.decorators.http import condition
+import hashlib
+from .cache import CATEGORY_LISTING, SERVER_LISTING, cached_listing, get_listing_version
+from .sprites import get_category_sprite, sprite_map
 # from .schema import server_list_docs
 from typing import Dict, Any
 from drf_spectacular.utils import extend_schema
@@ -19,6 +27,35 @@ from drf_spectacular.utils import extend_schema
 logger = logging.getLogger(__name__)
 
 
+def server_list_params(request):
+    """
+    Normalize the ServerListViewSet query parameters into a hashable tuple.
+
+    Parameters the view ignores are dropped, boolean flags are reduced to True/False and the
+    user id is only included for `by_user` requests, whose results depend on the caller.
+    """
+    params = request.GET
+    by_user = params.get("by_user") == "true"
+    return (
+        ("category", params.get("category") or None),
+        ("num_results", params.get("num_results") or None),
+        ("by_user", request.user.id if by_user else None),
+        ("by_serverid", params.get("by_serverid") or None),
+        ("with_num_members", params.get("with_num_members") == "true"),
+    )
+
+
+def server_list_etag(request, *args, **kwargs):
+    """
+    ETag for a server listing: the listing version plus the normalized query parameters.
+
+    Computing it needs no database query, so an unchanged listing is answered with 304
+    without touching or serializing any server.
+    """
+    key = (get_listing_version(SERVER_LISTING), server_list_params(request))
+    return quote_etag(hashlib.md5(repr(key).encode()).hexdigest())
+
+
 class CategoryListViewSet(viewsets.ViewSet):
     queryset = Category.objects.all().order_by("-name")
     serializer_class = CategorySerializer
@@ -31,22 +68,53 @@ class CategoryListViewSet(viewsets.ViewSet):
         If no categories are found, raises a NotFound exception.
         Otherwise, serializes the queryset and returns it with a 200 OK status.
 
+        The serialized list is kept in the listing response cache (see `cached_listing`) until a
+        Category changes, so repeated requests do not touch the database.
+
         Args:
             request (Request): The request object.
 
         Returns:
             Response: A DRF Response object containing the serialized data and HTTP status code.
         """
-        queryset = self.queryset
-        # Check if the queryset is empty
-        if not queryset.exists():
+        # Serialize the queryset to convert it to JSON format, with each icon's place in the sprite sheet
+        data = cached_listing(
+            CATEGORY_LISTING,
+            (),
+            lambda: list(
+                CategorySerializer(self.queryset.all(), many=True, context={"sprite": get_category_sprite()}).data
+            ),
+        )
+        # An empty result doubles as the "no categories" check, without a separate exists() query
+        if not data:
             # Raise a NotFound exception if no categories are found
             raise NotFound(detail="No categories found.")
-        
-        # Serialize the queryset to convert it to JSON format
-        serializer = CategorySerializer(queryset, many=True)
+
         # Return the serialized data with a 200 OK status
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return Response(data, status=status.HTTP_200_OK)
+
+    @action(detail=False)
+    def sprite(self, request):
+        """
+        Handles the GET request for the category sprite sheet: one image holding every category
+        icon, and the coordinates of each icon in it, keyed by category id (see `sprite_map`).
+
+        Clients show the sidebar icons as slices of this image, which costs one image request
+        instead of one per category. The map is cached with the category listing.
+
+        Args:
+            request (Request): The request object.
+
+        Returns:
+            Response: The coordinate map with a 200 OK status.
+
+        Raises:
+            NotFound: If the sprite sheet has not been built yet.
+        """
+        data = cached_listing(CATEGORY_LISTING, ("sprite",), lambda: sprite_map(get_category_sprite()))
+        if data is None:
+            raise NotFound(detail="The category sprite sheet has not been built yet.")
+        return Response(data, status=status.HTTP_200_OK)
     
 
 
@@ -55,11 +123,19 @@ class ServerListViewSet(viewsets.ViewSet):
     A ViewSet for listing or retrieving servers.
 
     Attributes:
-        queryset: The initial queryset of Server objects from the database.
+        queryset: The initial queryset of Server objects from the database. The category is
+            joined in and the channels are prefetched, so serializing any number of servers
+            costs the same fixed number of queries.
+
+    Requests are authenticated from the access token cookie only, so listing servers never loads
+    a session. The listing is public, so an expired or invalid cookie is served anonymously
+    rather than rejected (see `OptionalJWTCookieAuthentication`).
     """
-    queryset = Server.objects.all()
+    authentication_classes = [OptionalJWTCookieAuthentication]
+    queryset = Server.objects.select_related("category").prefetch_related("channel_server")
     
     @extend_schema(responses=ServerSerializer)
+    @method_decorator(condition(etag_func=server_list_etag))
     def list(self, request) -> Response:
         """
         Retrieve a list of servers based on provided query parameters.
@@ -74,6 +150,11 @@ class ServerListViewSet(viewsets.ViewSet):
             - `by_serverid` (str, optional): Filters servers by a specific server ID.
             - `with_num_members` (bool, optional): Annotates each server in the response with the number of members it has.
 
+        Responses carry an ETag derived from the server listing version (see `server_list_etag`), so a client
+        sending a matching If-None-Match gets 304 Not Modified until a Server, Channel or Category changes.
+        Otherwise the serialized list is served from the listing response cache (see `cached_listing`), keyed
+        by the same normalized parameters, and only rebuilt from the database after such a change.
+
         Args:
             request (Request): Django REST Framework request object.
 
@@ -84,8 +165,6 @@ class ServerListViewSet(viewsets.ViewSet):
             AuthenticationFailed: Raised when an unauthenticated user tries to filter servers by user or by server id.
             ValidationError: Raised when an invalid server id is provided or when the server id specified for filtering does not exist.
         """
-        queryset = self.queryset
-        
         # Fetch query parameters
         category = request.query_params.get("category")
         num_results = request.query_params.get("num_results")
@@ -99,13 +178,40 @@ class ServerListViewSet(viewsets.ViewSet):
             category, num_results, by_user, by_serverid, with_num_members
         )
 
+        data = cached_listing(
+            SERVER_LISTING,
+            server_list_params(request),
+            lambda: self.build_listing(request, category, num_results, by_user, by_serverid, with_num_members),
+        )
+
+        # An empty result for a single server means the id does not exist
+        if by_serverid and not data:
+            raise ValidationError(detail=f"Server with id {by_serverid} not found")
+
+        return Response(data, status=status.HTTP_200_OK)
+
+    def build_listing(self, request, category, num_results, by_user, by_serverid, with_num_members):
+        """
+        Query and serialize the servers matching the given filters.
+
+        Called by `list` when the listing is not in the response cache.
+
+        Returns:
+            list: The serialized servers.
+        """
+        # Clone the class-level queryset so its result cache is never shared between requests
+        queryset = self.queryset.all()
+
         # If user-specific or server-specific requests are made, check authentication
         # if (by_user or by_serverid) and not request.user.is_authenticated:
         #     raise AuthenticationFailed(detail="Authentication required for this request.")
 
         # If by_user is true, filter the queryset by the user
+        # Membership is matched with a subquery on the M2M through table rather than a join, so
+        # servers are not duplicated
         if by_user:
-            queryset = queryset.filter(member=request.user.id)
+            memberships = Server.members.through.objects.filter(user_id=request.user.id)
+            queryset = queryset.filter(id__in=memberships.values("server_id"))
             logger.info("Filtered servers by user: %s", request.user.id)
 
         # If a category is specified, filter the queryset by the category
@@ -113,9 +219,10 @@ class ServerListViewSet(viewsets.ViewSet):
             queryset = queryset.filter(category__name=category)
             logger.info("Filtered servers by category: %s", category)
 
-        # If with_num_members is true, annotate the queryset with a count of members
+        # If with_num_members is true, annotate the queryset with the stored member count
+        # (kept up to date on every membership change, so no GROUP BY over the members table)
         if with_num_members:
-            queryset = queryset.annotate(num_members=Count("members"))
+            queryset = queryset.annotate(num_members=F("member_count"))
             logger.info("Annotated servers with number of members")
 
         # If num_results is specified, limit the queryset to the specified number of results
@@ -126,13 +233,11 @@ class ServerListViewSet(viewsets.ViewSet):
         # If by_serverid is specified, filter the queryset by the server id
         if by_serverid:
             queryset = queryset.filter(id=by_serverid)
-            if not queryset.exists():
-                raise ValidationError(detail=f"Server with id {by_serverid} not found")
             logger.info("Filtered servers by server id: %s", by_serverid)
 
         # Serialize the queryset and return the serialized data
         serializer = ServerSerializer(queryset, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return list(serializer.data)
 
 
 # Tutorial on the annotate() method
@@ -108,7 +108,9 @@ function ExploreServers() {
                         display: { xs: "none", sm: "block" },
                         width: '100%',
                         // height: 150,
-                        objectFit: 'cover' }}
+                        objectFit: 'cover',
+                        // Painted straight away, until the banner has loaded
+                        bgcolor: server.banner_img_placeholder?.color }}
                     />
                     <CardContent
                       sx={{
@@ -124,6 +126,7 @@ function ExploreServers() {
                               <Avatar
                                 alt="server Icon"
                                 src={`${MEDIA_URL}${server.icon}`}
+                                sx={{ bgcolor: server.icon_placeholder?.color }}
                               ></Avatar>
                             </ListItemAvatar>
                           </ListItemIcon>
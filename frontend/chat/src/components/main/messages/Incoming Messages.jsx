@@ -1,17 +1,51 @@
 /**
  * Handles incoming Websocket message, parses the data, and updates the newMessages state.
+ * A "history" frame replaces the conversation, a "replay" frame appends the messages missed
+ * while disconnected, and any other frame is a single new message.
  * @param {object} message - The Websocket messsage received.
  * @param {function} setNewMessages - Funtion to update the newMessage state.
+ * @param {object} lastSeqRef - Ref holding the highest message seq seen, used to resume after a reconnect.
  */
 
-const handleIncomingMessage = (message, setNewMessages) => {
+const handleIncomingMessage = (message, setNewMessages, lastSeqRef) => {
     const msgData = JSON.parse(message.data);
+
+    // Remember the newest seq so a reconnect can ask for only what it missed
+    const trackSeq = (messages) => {
+        messages.forEach((msg) => {
+            if (typeof msg.seq === "number" && (lastSeqRef.current === null || msg.seq > lastSeqRef.current)) {
+                lastSeqRef.current = msg.seq;
+            }
+        });
+    };
+
+    // Sent once right after connecting: the room's recent messages, oldest first
+    if (msgData.type === "history") {
+        const messages = Array.isArray(msgData.messages) ? msgData.messages : [];
+        trackSeq(messages);
+        setNewMessages(messages);
+        return;
+    }
+
+    // Sent after a resumed reconnect: only the messages after the seq we asked for
+    if (msgData.type === "replay") {
+        const messages = Array.isArray(msgData.messages) ? msgData.messages : [];
+        trackSeq(messages);
+        setNewMessages((preMessages) => {
+            const known = new Set(preMessages.map((msg) => msg.id));
+            return [...preMessages, ...messages.filter((msg) => !known.has(msg.id))];
+        });
+        return;
+    }
+
     const newMessage = {
         id: msgData.id,
         sender: msgData.sender,
         content: msgData.content,
         timestamp: msgData.timestamp,
+        seq: msgData.seq,
     };
+    trackSeq([newMessage]);
 
     // Update the newMessages state with the newly parsed message
     setNewMessages((preMessages) => [...preMessages, newMessage]);
@@ -2,7 +2,6 @@ import { Box, Typography, TextField, useTheme } from "@mui/material";
 import { useState, useEffect, useCallback, useRef } from "react";
 import useWebSocket from "react-use-websocket";
 import { useParams } from "react-router-dom";
-import useCrud from "../../../hooks/useCrud";
 import { MessageInterfaceStyles } from "./MessageInterfaceStyles";
 import { useServerByIdContext } from "../../../context/ServerByIdContext";
 import MessageInterfaceChannels from "./MessageInterfaceChannels";
@@ -29,11 +28,22 @@ const MessageInterface = () => {
 
   const token = Cookies.get("access_token");
   
+  // Highest message seq received; sent back on reconnect so only the missed messages are replayed
+  const lastSeqRef = useRef(null);
+
+  // Start over with a full history whenever another channel is opened
+  useEffect(() => {
+    lastSeqRef.current = null;
+  }, [channelId]);
+
   // Constructing the WebSocket URL (ws is unsecured wss is secured: in PRODUCTION IMPLIMENT WSS)
-  const socketURL = channelId ? `ws://localhost:8000/${serverId}/${channelId}/?token=${token}` : null;
+  // Resolved on every (re)connect so it can carry the resume_after cursor.
+  const getSocketURL = useCallback(() => {
+    const resume = lastSeqRef.current !== null ? `&resume_after=${lastSeqRef.current}` : "";
+    return Promise.resolve(`ws://localhost:8000/${serverId}/${channelId}/?token=${token}${resume}`);
+  }, [serverId, channelId, token]);
+  const socketURL = channelId ? getSocketURL : null;
 
-  // Custom hook for fetching data from the API
-  const { fetchData, serverData } = useCrud([], `/messages/?channel_id=${channelId}`);
   const { serverName, serverDescription } = useServerByIdContext();
   
 
@@ -42,20 +52,14 @@ const MessageInterface = () => {
    * @param {object} message - The incoming Websocket message.
    */
   const handleMessage = useCallback((message) => {
-    handleIncomingMessage(message, setNewMessages); // Call the imported utility function to handle incoming messages
+    handleIncomingMessage(message, setNewMessages, lastSeqRef); // Call the imported utility function to handle incoming messages
   },[]);
 
   // WebSocket hook to handle connection and messages
   const { sendJsonMessage } = useWebSocket(socketURL, {
-    onOpen: async () => {
+    onOpen: () => {
+      // The server sends the recent conversation as a "history" frame right after connecting
       console.log("WebSocket Connected");
-      try {
-        await fetchData(); // Fetches the conversation when WebSocket opens
-        setNewMessages(Array.isArray(serverData) ? serverData : []);
-        console.log("Fetched initial messages:", serverData); // Debugging line
-      } catch (error) {
-        console.log(error);
-      }
     },
     onClose: (event) => {
       if (event.code === 4001) {
@@ -77,15 +81,6 @@ const MessageInterface = () => {
     onMessage: handleMessage,  // process Websocket messages with handleMessage func.
   });
 
-  // Effect to update messages whenever serverData changes
-  useEffect(() => {
-    if (Array.isArray(serverData)) {
-      setNewMessages(serverData);
-      console.log("Updated messages from serverData:", serverData); // Debugging line
-      console.log("Fetched data:", serverData);
-    }
-  }, [serverData]);
-
   // Effect to log new messages whenever they update
   useEffect(() => {
     console.log("New messages state updated:", newMessages); // Debugging line
@@ -46,7 +46,11 @@ const PopularChannels = ({ open }) => {
               <ListItemButton sx={{ minHeight: 0, justifyContent: "center" }}>
                 <ListItemIcon sx={{ minWidth: 0, justifyContent: "center" }}>
                   <ListItemAvatar sx={{ minWidth: "50px" }}>
-                    <Avatar alt="Server Icon" src={`${MEDIA_URL}${server.icon}`} />
+                    <Avatar
+                      alt="Server Icon"
+                      src={`${MEDIA_URL}${server.icon}`}
+                      sx={{ bgcolor: server.icon_placeholder?.color }}
+                    />
                   </ListItemAvatar>
                 </ListItemIcon>
                 <ListItemText
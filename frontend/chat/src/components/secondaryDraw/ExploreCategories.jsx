@@ -15,6 +15,37 @@ import { Link } from "react-router-dom";
 import { useTheme } from "@mui/material/styles";
 
 const MEDIA_URL = process.env.REACT_APP_MEDIA_URL;
+const ICON_SIZE = 25;
+
+// Every category icon lives in one sprite sheet, so the sidebar costs a single image request.
+// Each icon is drawn as its slice of the sheet, scaled down to ICON_SIZE.
+function CategoryIcon({ category }) {
+  const sprite = category.icon_sprite;
+  const style = {
+    width: `${ICON_SIZE}px`,
+    height: `${ICON_SIZE}px`,
+    display: "block",
+    margin: "auto",
+  };
+
+  if (!sprite) {
+    return <img alt="server Icon" src={`${MEDIA_URL}${category.icon}`} style={style} />;
+  }
+
+  const scale = ICON_SIZE / sprite.width;
+  return (
+    <span
+      role="img"
+      aria-label="server Icon"
+      style={{
+        ...style,
+        backgroundImage: `url(${MEDIA_URL}${sprite.url})`,
+        backgroundSize: `${sprite.sheet_width * scale}px ${sprite.sheet_height * scale}px`,
+        backgroundPosition: `-${sprite.x * scale}px -${sprite.y * scale}px`,
+      }}
+    />
+  );
+}
 
 function ExploreCategories() {
   // Theme
@@ -63,17 +94,7 @@ function ExploreCategories() {
               <ListItemButton sx={{ minHeight: 48 }}>
                 <ListItemIcon sx={{ minWidth: 0, justifyContent: "" }}>
                   <ListItemAvatar sx={{ minWidth: "0px" }}>
-                    <img
-                      alt="server Icon"
-                      src={`${MEDIA_URL}${category.icon}`}
-                      style={{
-                        width: "25px",
-                        height: "25px",
-                        display: "block",
-                        margin: "auto",
-                        // filter: isDarkMode ? "invert(100%)" : "none",
-                      }}
-                    />
+                    <CategoryIcon category={category} />
                   </ListItemAvatar>
                 </ListItemIcon>
                 <ListItemText